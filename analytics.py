@@ -0,0 +1,183 @@
+"""
+Аналитика прохождения глав: воронка по частям и распределение баллов.
+
+Обработчики бота отмечают события (начало главы, переход к части, верный или
+неверный ответ, завершение) в счетчиках процесса - это только прибавление к
+словарю. Раз в несколько секунд накопленные приращения одной транзакцией
+прибавляются к дневным сводкам analytics_part_daily и analytics_score_daily.
+Сводки не пересчитываются: каждая пачка только добавляет к ним разницу, а
+отчеты суммируют несколько десятков строк сводки.
+
+Отчеты:
+    python analytics.py funnel chapter1 --days 30
+    python analytics.py scores chapter1 --days 30
+В боте - команды /funnel и /scores для администраторов (ADMIN_IDS).
+"""
+import argparse
+import asyncio
+import logging
+from collections import Counter
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+analytics_events = metrics.counter("analytics_events_total", "События прохождения глав по типу")
+analytics_flushes = metrics.counter("analytics_flushes_total", "Сохранения пачек аналитики по результату")
+analytics_pending = metrics.gauge("analytics_pending_rows", "Строки сводок, ожидающие сохранения")
+
+EVENTS = ("start", "reached", "correct", "wrong", "complete")
+# Ширина корзины распределения баллов за главу
+SCORE_BUCKET = 5
+# Сколько строк приращений держать, если база недоступна; дальше новые события теряются
+MAX_PENDING = 100_000
+
+
+class Analytics:
+    def __init__(self, db, flush_interval: float = 10.0, max_pending: int = MAX_PENDING):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # (день, глава, версия, часть, событие) -> приращение
+        self._parts: Counter = Counter()
+        # (день, глава, версия, корзина) -> приращение
+        self._scores: Counter = Counter()
+        self._lock = asyncio.Lock()
+
+    def _has_room(self, counter: Counter, key: Tuple) -> bool:
+        if key in counter or len(self._parts) + len(self._scores) < self.max_pending:
+            return True
+        analytics_flushes.inc(result="dropped")
+        return False
+
+    def record(self, event: str, chapter: Optional[str], version: Optional[str], part: int):
+        """Отмечает событие части главы"""
+        if chapter is None:
+            return
+        key = (date.today(), chapter, version or "", part, event)
+        if self._has_room(self._parts, key):
+            self._parts[key] += 1
+            analytics_events.inc(event=event)
+
+    def record_score(self, chapter: Optional[str], version: Optional[str], score: int):
+        """Отмечает баллы, набранные за завершенную главу"""
+        if chapter is None:
+            return
+        key = (date.today(), chapter, version or "", score // SCORE_BUCKET * SCORE_BUCKET)
+        if self._has_room(self._scores, key):
+            self._scores[key] += 1
+
+    async def flush(self) -> int:
+        """Прибавляет накопленные приращения к сводкам; возвращает число строк"""
+        async with self._lock:
+            parts, self._parts = self._parts, Counter()
+            scores, self._scores = self._scores, Counter()
+            if not parts and not scores:
+                return 0
+            try:
+                await asyncio.to_thread(
+                    self.db.add_analytics,
+                    [key + (count,) for key, count in parts.items()],
+                    [key + (count,) for key, count in scores.items()],
+                )
+            except Exception:
+                # Возвращаем приращения, чтобы сохранить их следующей пачкой
+                self._parts.update(parts)
+                self._scores.update(scores)
+                analytics_flushes.inc(result="error")
+                raise
+            finally:
+                analytics_pending.set(len(self._parts) + len(self._scores))
+            analytics_flushes.inc(result="ok")
+            return len(parts) + len(scores)
+
+    async def run(self):
+        """Фоновое сохранение пачек"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Не удалось сохранить аналитику: {e}")
+
+    async def close(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Не удалось сохранить аналитику при остановке: {e}")
+
+
+def build_funnel(rows: List[Tuple]) -> List[Dict[str, int]]:
+    """Строки (часть, событие, количество) -> список частей со счетчиками всех событий"""
+    by_part: Dict[int, Dict[str, int]] = {}
+    for part, event, count in rows:
+        by_part.setdefault(part, dict.fromkeys(EVENTS, 0))[event] = int(count)
+    return [dict(by_part[part], part=part) for part in sorted(by_part)]
+
+
+def format_funnel(chapter: str, rows: List[Tuple], days: int) -> str:
+    funnel = build_funnel(rows)
+    if not funnel:
+        return f"{chapter}: нет данных за {days} дн."
+    starts = sum(part["start"] for part in funnel)
+    completes = sum(part["complete"] for part in funnel)
+    lines = [f"{chapter} за {days} дн.: начали {starts}, завершили {completes}"
+             + (f" ({completes / starts:.0%})" if starts else "")]
+    previous = None
+    for part in funnel:
+        answers = part["correct"] + part["wrong"]
+        if not part["reached"] and not answers:
+            # Строка только с завершениями (они отмечаются за последней частью)
+            continue
+        line = f"#{part['part']}: дошли {part['reached']}"
+        if starts:
+            line += f" ({part['reached'] / starts:.0%})"
+        if previous is not None and previous >= part["reached"]:
+            line += f", ушли {previous - part['reached']}"
+        if answers:
+            line += f", верно {part['correct']}/{answers}"
+        lines.append(line)
+        previous = part["reached"]
+    return "\n".join(lines)
+
+
+def format_scores(chapter: str, rows: List[Tuple], days: int) -> str:
+    if not rows:
+        return f"{chapter}: нет завершений за {days} дн."
+    total = sum(int(count) for _, count in rows)
+    widest = max(int(count) for _, count in rows)
+    lines = [f"{chapter} за {days} дн.: баллы за главу ({total} завершений)"]
+    for bucket, count in rows:
+        bar = "█" * max(1, round(int(count) / widest * 20))
+        lines.append(f"{bucket:>3}-{bucket + SCORE_BUCKET - 1:<3} {bar} {count}")
+    return "\n".join(lines)
+
+
+def funnel_report(db, chapter: str, days: int = 30) -> str:
+    return format_funnel(chapter, db.get_chapter_funnel(chapter, date.today() - timedelta(days=days)), days)
+
+
+def scores_report(db, chapter: str, days: int = 30) -> str:
+    return format_scores(chapter, db.get_score_distribution(chapter, date.today() - timedelta(days=days)), days)
+
+
+if __name__ == "__main__":
+    from config import DATABASE_URL
+    from main import open_database
+
+    parser = argparse.ArgumentParser(description="Отчеты по прохождению глав")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in ("funnel", "scores"):
+        command_parser = subparsers.add_parser(command)
+        command_parser.add_argument("chapter")
+        command_parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    db = open_database(DATABASE_URL)
+    try:
+        report = funnel_report if args.command == "funnel" else scores_report
+        print(report(db, args.chapter, args.days))
+    finally:
+        db.close()
@@ -0,0 +1,189 @@
+"""
+Журнал попыток ответа: кто, в какой главе и части, что ответил, засчитан ли
+ответ, насколько он похож на ожидаемый и сколько пользователь думал.
+
+Обработчик только кладет запись в кольцевой буфер (deque фиксированного
+размера): при переполнении вытесняются самые старые записи, память не растет.
+Фоновая задача забирает записи пачками и пишет их в answer_events одним COPY.
+Если база недоступна, пачка сохраняется в локальный файл-сегмент
+(answer_segments/*.jsonl.gz); после восстановления базы сегменты дописываются
+в нее по порядку и удаляются.
+"""
+import asyncio
+import glob
+import gzip
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+answers_enqueued = metrics.counter("answer_events_enqueued_total", "Попытки ответа, принятые в буфер")
+answers_dropped = metrics.counter("answer_events_dropped_total", "Попытки ответа, вытесненные из полного буфера")
+answers_written = metrics.counter("answer_events_written_total", "Записанные попытки ответа по месту записи")
+answers_buffered = metrics.gauge("answer_events_buffered", "Попытки ответа в буфере")
+answer_segments = metrics.gauge("answer_event_segments", "Сегменты, ожидающие записи в базу")
+
+# Суффикс сегмента, который процесс с указанным после него pid сейчас дописывает в базу
+CLAIM_SUFFIX = ".replaying-"
+
+
+class AnswerLog:
+    def __init__(self, db, segment_dir: str = "answer_segments", capacity: int = 50_000, batch_size: int = 1000,
+                 flush_interval: float = 2.0):
+        self.db = db
+        self.segment_dir = segment_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: deque = deque(maxlen=capacity)
+        self._ready = asyncio.Event()
+        self._segment_number = 0
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def record(self, telegram_id: int, chapter: Optional[str], version: Optional[str], part: Optional[int],
+               answer: str, matched: bool, similarity: Optional[float] = None, latency: Optional[float] = None):
+        """Добавляет попытку в буфер; ничего не ждет и не обращается к базе"""
+        if len(self._buffer) == self._buffer.maxlen:
+            answers_dropped.inc()
+        self._buffer.append((datetime.now(), telegram_id, chapter, version, part, answer, matched,
+                             None if similarity is None else round(similarity, 3),
+                             None if latency is None else int(latency * 1000)))
+        answers_enqueued.inc()
+        if len(self._buffer) >= self.batch_size:
+            self._ready.set()
+
+    def _take(self) -> List[Tuple]:
+        """Забирает из буфера пачку записей в порядке DatabaseManager.ANSWER_EVENT_COLUMNS"""
+        count = min(self.batch_size, len(self._buffer))
+        batch = [self._buffer.popleft() for _ in range(count)]
+        answers_buffered.set(len(self._buffer))
+        return batch
+
+    def _requeue(self, batch: List[Tuple]):
+        """Возвращает пачку в начало буфера; при переполнении вытесняются самые новые записи"""
+        overflow = len(self._buffer) + len(batch) - self._buffer.maxlen
+        if overflow > 0:
+            answers_dropped.inc(overflow)
+        self._buffer.extendleft(reversed(batch))
+        answers_buffered.set(len(self._buffer))
+
+    # Сегменты
+    def _segments(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.segment_dir, "*.jsonl.gz")))
+
+    def _release_abandoned(self):
+        """Возвращает в очередь сегменты, захваченные процессами, которые уже завершились"""
+        for claimed in glob.glob(os.path.join(self.segment_dir, f"*.jsonl.gz{CLAIM_SUFFIX}*")):
+            path, _, pid = claimed.rpartition(CLAIM_SUFFIX)
+            try:
+                os.kill(int(pid), 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except (ValueError, PermissionError):
+                continue
+            try:
+                os.rename(claimed, path)
+            except FileNotFoundError:
+                pass
+
+    def _write_segment(self, batch: List[Tuple]) -> str:
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self._segment_number += 1
+        path = os.path.join(self.segment_dir, f"{time.time_ns()}-{os.getpid()}-{self._segment_number}.jsonl.gz")
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for event in batch:
+                f.write(json.dumps([event[0].isoformat(), *event[1:]], ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+        return path
+
+    @staticmethod
+    def _read_segment(path: str) -> List[Tuple]:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        return [(datetime.fromisoformat(row[0]), *row[1:]) for row in rows]
+
+    def _store(self, batch: List[Tuple]) -> str:
+        """Пишет пачку в базу, при ошибке - в сегмент; возвращает место записи"""
+        try:
+            self.db.insert_answer_events(batch)
+            return "db"
+        except Exception as e:
+            try:
+                path = self._write_segment(batch)
+            except Exception:
+                # Ни база, ни диск не приняли пачку - она подождет следующей записи в буфере
+                self._requeue(batch)
+                raise
+            logger.warning(f"База недоступна, {len(batch)} попыток ответа сохранены в {path}: {e}")
+            return "segment"
+
+    def _replay_segments(self) -> int:
+        """
+        Дописывает сегменты в базу по порядку; останавливается на первой ошибке.
+        Сегмент сначала захватывается переименованием (атомарно), поэтому несколько
+        процессов с общим каталогом не запишут один сегмент дважды.
+        """
+        self._release_abandoned()
+        replayed = 0
+        for path in self._segments():
+            claimed = f"{path}{CLAIM_SUFFIX}{os.getpid()}"
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                # Сегмент уже забрал другой процесс
+                continue
+            try:
+                batch = self._read_segment(claimed)
+                self.db.insert_answer_events(batch)
+            except Exception:
+                os.rename(claimed, path)
+                raise
+            os.remove(claimed)
+            replayed += len(batch)
+            answers_written.inc(len(batch), target="db_from_segment")
+        return replayed
+
+    def _flush_batch(self, batch: List[Tuple]):
+        target = self._store(batch)
+        answers_written.inc(len(batch), target=target)
+        if target == "db" and os.path.isdir(self.segment_dir):
+            try:
+                replayed = self._replay_segments()
+                if replayed:
+                    logger.info(f"Из сегментов в базу дописано попыток ответа: {replayed}")
+            except Exception as e:
+                logger.warning(f"Сегменты попыток ответа пока не записаны: {e}")
+        answer_segments.set(len(self._segments()) if os.path.isdir(self.segment_dir) else 0)
+
+    async def flush(self):
+        """Записывает все, что накопилось в буфере"""
+        while self._buffer:
+            await asyncio.to_thread(self._flush_batch, self._take())
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._ready.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи журнала ответов: {e}")
+
+    async def close(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Не удалось записать журнал ответов при остановке: {e}")
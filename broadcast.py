@@ -0,0 +1,313 @@
+"""
+Рассылка сообщений всем пользователям (ежедневные задания, напоминания).
+
+- Пользователи читаются из users страницами по user_id (keyset), в памяти
+  одновременно не больше пары страниц - рассылка доходит до 100k+ пользователей.
+- Текст собирается из шаблона string.Template: $name, $score.
+- Скорость ограничена глобально (Telegram: ~30 сообщений в секунду) и для
+  каждого чата отдельно.
+- Прогресс сохраняется в broadcast_jobs контрольными точками вместе со списком
+  доставленных после точки пользователей, поэтому после остановки рассылка
+  продолжается с того же места. При аварийном падении повторно могут уйти
+  только сообщения, отправленные после последней точки (не больше секунды).
+
+Запуск:
+    python broadcast.py start --name "daily-tasks" --template "Исәнме, $name! Новые задания ждут вас."
+    python broadcast.py resume --job 3
+"""
+import argparse
+import asyncio
+import html
+import logging
+import time
+from collections import OrderedDict, deque
+from datetime import date, datetime, timedelta
+from string import Template
+from typing import Deque, List, Optional, Set, Tuple
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter, TelegramBadRequest
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+broadcast_sent = metrics.counter("broadcast_messages_sent_total", "Отправленные сообщения рассылок")
+broadcast_failed = metrics.counter("broadcast_messages_failed_total", "Неотправленные сообщения рассылок")
+broadcast_rate = metrics.gauge("broadcast_messages_per_second", "Текущая скорость рассылки")
+
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+# Через сколько секунд без контрольных точек задание считается брошенным и его может забрать другой шард
+JOB_LEASE_TIMEOUT = 60.0
+
+
+class TokenBucket:
+    """Ограничение скорости: не больше rate событий в секунду с запасом burst"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Telegram попросил подождать - забираем токены на это время"""
+        self._tokens = -seconds * self.rate
+
+
+class ChatRateLimiter:
+    """Минимальный интервал между сообщениями в один чат (помнит последние max_chats чатов)"""
+
+    def __init__(self, interval: float = 1.0, max_chats: int = 10000):
+        self.interval = interval
+        self.max_chats = max_chats
+        self._last: "OrderedDict[int, float]" = OrderedDict()
+
+    async def wait(self, chat_id: int):
+        last = self._last.get(chat_id)
+        if last is not None:
+            delay = last + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self._last[chat_id] = time.monotonic()
+        self._last.move_to_end(chat_id)
+        while len(self._last) > self.max_chats:
+            self._last.popitem(last=False)
+
+
+def render(template: Template, user: Tuple) -> str:
+    user_id, telegram_id, score, user_name = user
+    return template.safe_substitute(name=html.escape(user_name or ""), score=score or 0)
+
+
+class BroadcastJob:
+    def __init__(self, db, bot, job_id: int, rate: float = 25, concurrency: int = 8,
+                 per_chat_interval: float = 1.0, page_size: int = 1000, checkpoint_interval: float = 1.0):
+        self.db = db
+        self.bot = bot
+        self.job_id = job_id
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.checkpoint_interval = checkpoint_interval
+        self.bucket = TokenBucket(rate)
+        self.chat_limiter = ChatRateLimiter(per_chat_interval)
+
+        self.sent = 0
+        self.failed = 0
+        self.last_user_id = 0
+        # Пользователи в порядке выдачи и те из них, кто уже обработан:
+        # контрольная точка сдвигается только по непрерывному обработанному префиксу
+        self._order: Deque[int] = deque()
+        self._completed: Set[int] = set()
+        self._delivered: List[int] = []
+        self._started = 0.0
+
+    def _complete(self, user_id: int, delivered: bool):
+        self._completed.add(user_id)
+        if delivered:
+            self._delivered.append(user_id)
+        while self._order and self._order[0] in self._completed:
+            self.last_user_id = self._order.popleft()
+            self._completed.discard(self.last_user_id)
+
+    async def _checkpoint(self, status: str = STATUS_RUNNING):
+        delivered, self._delivered = self._delivered, []
+        try:
+            await asyncio.to_thread(self.db.save_broadcast_checkpoint, self.job_id, self.last_user_id,
+                                    self.sent, self.failed, status, delivered)
+        except BaseException:
+            # Точка не сохранилась - доставки попадут в следующую, иначе после перезапуска их отправят повторно
+            self._delivered[:0] = delivered
+            raise
+
+    async def _send(self, template: Template, user: Tuple):
+        user_id, telegram_id = user[0], user[1]
+        text = render(template, user)
+        for _ in range(3):
+            await self.bucket.acquire()
+            await self.chat_limiter.wait(telegram_id)
+            try:
+                await self.bot.send_message(telegram_id, text)
+                self.sent += 1
+                broadcast_sent.inc(job=str(self.job_id))
+                self._complete(user_id, True)
+                return
+            except TelegramRetryAfter as e:
+                logger.warning(f"Telegram просит подождать {e.retry_after} с")
+                self.bucket.pause(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Пользователь заблокировал бота или чат недоступен - повторять бессмысленно
+                logger.info(f"Рассылка {self.job_id}: пользователь {telegram_id} недоступен: {e}")
+                break
+            except Exception as e:
+                logger.error(f"Рассылка {self.job_id}: ошибка отправки пользователю {telegram_id}: {e}")
+                await asyncio.sleep(1)
+        self.failed += 1
+        broadcast_failed.inc(job=str(self.job_id))
+        self._complete(user_id, False)
+
+    async def _worker(self, queue: asyncio.Queue, template: Template):
+        while True:
+            user = await queue.get()
+            try:
+                if user is None:
+                    return
+                await self._send(template, user)
+            finally:
+                queue.task_done()
+
+    async def _report(self, stopping: asyncio.Event):
+        """Контрольные точки раз в checkpoint_interval, пока не выставлен stopping"""
+        last_sent, last_time = self.sent, time.monotonic()
+        logged_at = last_time
+        while True:
+            try:
+                await asyncio.wait_for(stopping.wait(), self.checkpoint_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self._checkpoint()
+            except Exception as e:
+                logger.error(f"Рассылка {self.job_id}: не удалось сохранить контрольную точку: {e}")
+            now = time.monotonic()
+            rate = (self.sent - last_sent) / (now - last_time)
+            broadcast_rate.set(rate, job=str(self.job_id))
+            if now - logged_at >= 10:
+                logged_at = now
+                logger.info(f"Рассылка {self.job_id}: отправлено {self.sent}, ошибок {self.failed}, "
+                            f"{rate:.1f} сообщ./с, контрольная точка user_id={self.last_user_id}")
+            last_sent, last_time = self.sent, now
+
+    async def run(self) -> Tuple[int, int]:
+        job = await asyncio.to_thread(self.db.get_broadcast_job, self.job_id)
+        if job is None:
+            raise ValueError(f"Broadcast job {self.job_id} not found")
+        _, name, template_text, status, self.last_user_id, self.sent, self.failed = job
+        if status == STATUS_DONE:
+            return self.sent, self.failed
+
+        template = Template(template_text)
+        already_delivered = set(await asyncio.to_thread(self.db.get_delivered_users, self.job_id, self.last_user_id))
+        logger.info(f"Рассылка {self.job_id} ({name}): старт с user_id > {self.last_user_id}")
+
+        self._started = time.monotonic()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.page_size)
+        workers = [asyncio.create_task(self._worker(queue, template)) for _ in range(self.concurrency)]
+        stopping = asyncio.Event()
+        reporter = asyncio.create_task(self._report(stopping))
+        cancelled = False
+        try:
+            after = self.last_user_id
+            while True:
+                page = await asyncio.to_thread(self.db.get_users_page, after, self.page_size)
+                if not page:
+                    break
+                for user in page:
+                    self._order.append(user[0])
+                    if user[0] in already_delivered:
+                        self._complete(user[0], False)
+                    else:
+                        await queue.put(user)
+                after = page[-1][0]
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            # Репортер не отменяем, а дожидаемся: отмена не останавливает поток с уже начатой
+            # контрольной точкой, и та могла бы записаться после финальной со старым last_user_id
+            stopping.set()
+            await asyncio.gather(reporter, return_exceptions=True)
+            if cancelled:
+                # Штатная остановка: сохраняем точку, чтобы не отправить доставленное повторно
+                await self._checkpoint()
+        await self._checkpoint(STATUS_DONE if not self._order else STATUS_RUNNING)
+
+        elapsed = time.monotonic() - self._started
+        logger.info(f"Рассылка {self.job_id} завершена: отправлено {self.sent}, ошибок {self.failed}, "
+                    f"{elapsed:.0f} с")
+        return self.sent, self.failed
+
+
+async def start_broadcast(db, bot, name: str, template: str, **kwargs) -> Tuple[int, int]:
+    job_id = await asyncio.to_thread(db.create_broadcast_job, name, template)
+    return await BroadcastJob(db, bot, job_id, **kwargs).run()
+
+
+async def run_daily(db, bot, hour: int, template: str):
+    """
+    Каждый день в hour:00 запускает рассылку; незавершенная после перезапуска продолжается.
+    Цикл работает в каждом шарде, но задание дня создается один раз (create_broadcast_job_once),
+    а выполняет его тот шард, который его забрал (claim_broadcast_job); остальные только
+    проверяют, не брошено ли оно.
+    """
+    while True:
+        now = datetime.now()
+        name = f"daily-{date.today().isoformat()}"
+        job = await asyncio.to_thread(db.get_broadcast_job_by_name, name)
+        if now.hour >= hour and (job is None or job[3] != STATUS_DONE):
+            try:
+                job_id = job[0] if job else await asyncio.to_thread(db.create_broadcast_job_once, name, template)
+                if job_id is None:
+                    # Задание только что создал другой шард
+                    job_id = (await asyncio.to_thread(db.get_broadcast_job_by_name, name))[0]
+                if await asyncio.to_thread(db.claim_broadcast_job, job_id, JOB_LEASE_TIMEOUT):
+                    await BroadcastJob(db, bot, job_id).run()
+                else:
+                    await asyncio.sleep(JOB_LEASE_TIMEOUT)
+                continue
+            except Exception as e:
+                logger.error(f"Ошибка ежедневной рассылки: {e}")
+                await asyncio.sleep(60)
+                continue
+        next_run = datetime.combine(date.today() + timedelta(days=1), datetime.min.time()) + timedelta(hours=hour)
+        await asyncio.sleep(max(60.0, (next_run - datetime.now()).total_seconds()))
+
+
+async def _cli(args):
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.enums import ParseMode
+    from config import API_TOKEN, DATABASE_URL
+    from main import open_database
+
+    db = open_database(DATABASE_URL)
+    bot = Bot(token=API_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    try:
+        if args.command == "start":
+            await start_broadcast(db, bot, args.name, args.template, rate=args.rate)
+        else:
+            await BroadcastJob(db, bot, args.job, rate=args.rate).run()
+    finally:
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Рассылка сообщений пользователям")
+    parser.add_argument("--rate", type=float, default=25, help="Сообщений в секунду (глобально)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    start_parser = subparsers.add_parser("start")
+    start_parser.add_argument("--name", required=True)
+    start_parser.add_argument("--template", required=True)
+    resume_parser = subparsers.add_parser("resume")
+    resume_parser.add_argument("--job", type=int, required=True)
+    asyncio.run(_cli(parser.parse_args()))
@@ -0,0 +1,78 @@
+"""
+Офлайн-сборка хранилища переводов статических текстов.
+
+Извлекает все переводимые строки из CHAPTERS и шаблонных ответов, переводит
+только те, которых еще нет в хранилище, и записывает translations/<язык>.idx.
+Без сети (или с флагом --offline) используется локальная заглушка, которая
+оставляет текст без изменений - такие строки можно перевести при следующей сборке.
+
+Запуск:
+    python build_translations.py --lang tt
+    python build_translations.py --lang tt --offline
+"""
+import argparse
+import logging
+from typing import Callable, Dict, List
+
+from chapters import CHAPTERS
+from translations import extract_strings, get_store, store_path, write_store
+
+logger = logging.getLogger(__name__)
+
+
+def collect_strings() -> List[str]:
+    from gigachat import FALLBACK_RESPONSES
+    strings = extract_strings(CHAPTERS)
+    for text in FALLBACK_RESPONSES:
+        if text not in strings:
+            strings.append(text)
+    return strings
+
+
+def offline_translate(text: str) -> str:
+    """Локальная заглушка переводчика: текст остается без изменений"""
+    return text
+
+
+def network_translator(lang: str) -> Callable[[str], str]:
+    if lang != "tt":
+        raise ValueError(f"translate.tatar supports only Russian to Tatar, got '{lang}'")
+    from gigachat import translate_to_tatar
+    return translate_to_tatar
+
+
+def build(lang: str, offline: bool = False) -> Dict[str, str]:
+    strings = collect_strings()
+    existing = get_store(lang)
+    translations: Dict[str, str] = {}
+    pending = []
+    for text in strings:
+        stored = existing.get(text) if existing else None
+        # Строки, оставленные заглушкой без перевода, пробуем перевести заново
+        if stored is not None and (stored != text or offline):
+            translations[text] = stored
+        else:
+            pending.append(text)
+
+    translate = offline_translate if offline else network_translator(lang)
+    for index, text in enumerate(pending, 1):
+        try:
+            translations[text] = translate(text)
+        except Exception as e:
+            logger.warning(f"Переводчик недоступен ({e}), оставшиеся строки переводит локальная заглушка")
+            translate = offline_translate
+            translations[text] = translate(text)
+        logger.info(f"[{index}/{len(pending)}] переведено")
+
+    write_store(store_path(lang), translations)
+    logger.info(f"Сохранено {len(translations)} строк в {store_path(lang)}, новых: {len(pending)}")
+    return translations
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Сборка хранилища переводов статических текстов")
+    parser.add_argument("--lang", default="tt")
+    parser.add_argument("--offline", action="store_true", help="Не обращаться к сети, использовать заглушку")
+    args = parser.parse_args()
+    build(args.lang, args.offline)
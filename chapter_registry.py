@@ -0,0 +1,229 @@
+"""
+Горячая перезагрузка глав без перезапуска бота.
+
+ChapterRegistry следит за chapters.py и изображениями, на которые ссылаются
+главы. При изменении файл выполняется заново, каждая глава проверяется и
+"собирается" (проверка структуры, независимая копия), после чего новая
+таблица глав подменяется одной операцией присваивания. Главы, содержимое и
+картинки которых не изменились, не пересобираются.
+
+Версия главы - хэш ее содержимого и подписей файлов изображений. Версия
+сохраняется в данных FSM при начале главы, и пользователь проходит главу до
+конца в этой версии. После перезапуска процесса в памяти есть только текущие
+версии - незавершенные главы продолжаются по ним.
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+import runpy
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+from pacing import PACING_STEPS
+
+logger = logging.getLogger(__name__)
+
+CHAPTERS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chapters.py")
+# Сколько прошлых версий главы держать для пользователей, которые ее еще проходят
+KEEP_VERSIONS = 10
+
+# Обязательные поля частей по типу
+REQUIRED_FIELDS = {
+    "info": ("text_tatar",),
+    "thanks_question": ("question", "options"),
+    "ded_question": ("text_tatar", "correct_answer"),
+    "tea_request": ("text", "required_word"),
+    "ded_chak_image": ("image", "text"),
+    "info_image": ("image", "text"),
+}
+DELIVERY_MODES = ("album", "paced")
+
+chapter_reloads = metrics.counter("chapter_reloads_total", "Перезагрузки глав по результату")
+chapter_versions = metrics.gauge("chapter_versions_loaded", "Версии глав в памяти")
+
+
+class ChapterValidationError(Exception):
+    pass
+
+
+def _image_paths(chapter: dict) -> List[str]:
+    return sorted({value for part in chapter.get("parts", []) for key, value in part.items()
+                   if "image" in key and isinstance(value, str)})
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def chapter_version(chapter: dict) -> str:
+    """Хэш содержимого главы и подписей (время изменения, размер) ее изображений"""
+    content = json.dumps(chapter, sort_keys=True, ensure_ascii=False, default=str)
+    files = [(path, _file_signature(path)) for path in _image_paths(chapter)]
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(content.encode("utf-8"))
+    digest.update(repr(files).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def validate_chapter(key: str, chapter: dict):
+    from feedback_templates import FEEDBACK_TEMPLATES
+
+    if not isinstance(chapter, dict) or not isinstance(chapter.get("parts"), list) or not chapter["parts"]:
+        raise ChapterValidationError(f"{key}: chapter must have a non-empty 'parts' list")
+    for index, part in enumerate(chapter["parts"]):
+        where = f"{key}.parts[{index}]"
+        part_type = part.get("type")
+        if part_type not in REQUIRED_FIELDS:
+            raise ChapterValidationError(f"{where}: unknown part type {part_type!r}")
+        missing = [field for field in REQUIRED_FIELDS[part_type] if not part.get(field)]
+        if missing:
+            raise ChapterValidationError(f"{where}: missing {', '.join(missing)}")
+        if part_type == "thanks_question":
+            options = part["options"]
+            if not all(isinstance(option, dict) and option.get("text") for option in options):
+                raise ChapterValidationError(f"{where}: every option needs 'text'")
+            if not any(option.get("correct") for option in options):
+                raise ChapterValidationError(f"{where}: no correct option")
+        if "review" in part and not (isinstance(part["review"], str) and part["review"].strip()):
+            raise ChapterValidationError(f"{where}: 'review' must be a non-empty string")
+        if part.get("next_delivery", "paced") not in DELIVERY_MODES:
+            raise ChapterValidationError(f"{where}: next_delivery must be one of {DELIVERY_MODES}")
+        if part.get("feedback_key") and part["feedback_key"] not in FEEDBACK_TEMPLATES:
+            raise ChapterValidationError(f"{where}: unknown feedback_key {part['feedback_key']!r}")
+        _validate_pacing(where, part.get("pacing", {}))
+    for path in _image_paths(chapter):
+        if not os.path.exists(path):
+            logger.warning(f"{key}: изображение не найдено: {path}")
+
+
+def _validate_pacing(where: str, pacing):
+    if not isinstance(pacing, dict):
+        raise ChapterValidationError(f"{where}: pacing must be a dict of steps")
+    for step, spec in pacing.items():
+        if step not in PACING_STEPS:
+            raise ChapterValidationError(f"{where}: unknown pacing step {step!r}, expected one of {PACING_STEPS}")
+        bounds = spec.values() if isinstance(spec, dict) else [spec]
+        if isinstance(spec, dict) and not set(spec) <= {"min", "max"}:
+            raise ChapterValidationError(f"{where}: pacing.{step} accepts only 'min' and 'max'")
+        if not all(isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0 for value in bounds):
+            raise ChapterValidationError(f"{where}: pacing.{step} must be a non-negative number or min/max")
+
+
+def compile_chapter(key: str, chapter: dict) -> dict:
+    """Проверенная независимая копия главы (изменения исходного модуля на нее не влияют)"""
+    validate_chapter(key, chapter)
+    return copy.deepcopy(chapter)
+
+
+class ChapterRegistry:
+    def __init__(self, path: str = CHAPTERS_PATH, keep_versions: int = KEEP_VERSIONS):
+        self.path = path
+        self.keep_versions = keep_versions
+        # Текущие версии глав: {ключ главы: (версия, глава)}; подменяется целиком
+        self._current: Dict[str, Tuple[str, dict]] = {}
+        self._versions: Dict[str, "OrderedDict[str, dict]"] = {}
+        self._signatures: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._listeners: List[Callable[[Iterable[str]], None]] = []
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._current
+
+    def current_version(self, key: str) -> Optional[str]:
+        entry = self._current.get(key)
+        return entry[0] if entry else None
+
+    def current(self, key: str) -> Optional[Tuple[str, dict]]:
+        """(версия, глава) текущей версии главы"""
+        return self._current.get(key)
+
+    def get(self, key: Optional[str], version: Optional[str] = None) -> Optional[dict]:
+        """Глава в нужной версии; если версия неизвестна (например, после перезапуска) - текущая"""
+        if key is None:
+            return None
+        if version is not None:
+            chapter = self._versions.get(key, {}).get(version)
+            if chapter is not None:
+                return chapter
+        entry = self._current.get(key)
+        return entry[1] if entry else None
+
+    def on_reload(self, listener: Callable[[Iterable[str]], None]):
+        """listener(paths) вызывается с путями изображений, изменившихся при перезагрузке"""
+        self._listeners.append(listener)
+
+    def _watched_signatures(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        paths = {self.path}
+        for _, chapter in self._current.values():
+            paths.update(_image_paths(chapter))
+        return {path: _file_signature(path) for path in paths}
+
+    def load(self) -> List[str]:
+        """
+        Перечитывает главы; возвращает ключи пересобранных глав.
+        При любой ошибке текущие главы остаются прежними.
+        """
+        namespace = runpy.run_path(self.path)
+        source = namespace.get("CHAPTERS")
+        if not isinstance(source, dict):
+            raise ChapterValidationError(f"{self.path}: CHAPTERS is not defined")
+
+        new_current: Dict[str, Tuple[str, dict]] = {}
+        compiled: Dict[str, Tuple[str, dict]] = {}
+        for key, chapter in source.items():
+            version = chapter_version(chapter)
+            existing = self._current.get(key)
+            if existing and existing[0] == version:
+                new_current[key] = existing
+                continue
+            compiled[key] = new_current[key] = (version, compile_chapter(key, chapter))
+
+        old_images = {path: self._signatures.get(path) for path in self._signatures if path != self.path}
+        # Все главы собраны без ошибок - подменяем таблицу одним присваиванием
+        self._current = new_current
+        for key, (version, chapter) in compiled.items():
+            versions = self._versions.setdefault(key, OrderedDict())
+            versions[version] = chapter
+            while len(versions) > self.keep_versions:
+                versions.popitem(last=False)
+        self._signatures = self._watched_signatures()
+        chapter_versions.set(sum(len(versions) for versions in self._versions.values()))
+
+        changed_images = [path for path, signature in old_images.items()
+                          if self._signatures.get(path, signature) != signature]
+        if changed_images:
+            for listener in self._listeners:
+                listener(changed_images)
+        if compiled:
+            logger.info(f"Главы перезагружены: {', '.join(f'{key}@{compiled[key][0]}' for key in compiled)}")
+        return list(compiled)
+
+    def changed(self) -> bool:
+        return self._watched_signatures() != self._signatures
+
+    def reload(self) -> List[str]:
+        try:
+            reloaded = self.load()
+        except Exception as e:
+            chapter_reloads.inc(result="error")
+            logger.error(f"Главы не перезагружены, остается прежняя версия: {e}")
+            # Запоминаем подписи, чтобы не повторять ту же ошибку на каждой проверке
+            self._signatures = self._watched_signatures()
+            return []
+        chapter_reloads.inc(result="ok")
+        return reloaded
+
+    async def watch(self, interval: float = 2.0):
+        """Проверяет файлы раз в interval секунд и перезагружает главы при изменениях"""
+        while True:
+            await asyncio.sleep(interval)
+            if await asyncio.to_thread(self.changed):
+                # Сборка быстрая; в цикле событий слушатели не пересекаются с обработчиками
+                self.reload()
@@ -0,0 +1,145 @@
+"""
+Описание глав сценария: пути к изображениям и тексты всех частей.
+
+Модуль не зависит от бота и базы данных, поэтому его можно импортировать из
+офлайн-инструментов (например, build_translations.py).
+"""
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Получаем абсолютные пути к папкам
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+VOICES_DIR = os.path.join(BASE_DIR, "voices")
+IMAGES_DIR = os.path.join(BASE_DIR, "images")
+
+# Создаем директории если их нет
+os.makedirs(VOICES_DIR, exist_ok=True)
+os.makedirs(IMAGES_DIR, exist_ok=True)
+
+# Пути к изображениям
+WELCOME_IMAGE = os.path.join(IMAGES_DIR, "derevnya_vstuplenie_1.jpg")
+DVOR_IMAGE = os.path.join(IMAGES_DIR, "pa_and_ma_dvor.jpg")
+HOME_IMAGE = os.path.join(IMAGES_DIR, "home.jpg")
+DOM_VNUTRI_IMAGE = os.path.join(IMAGES_DIR, "pa_and_ma_dom_vnutri.jpg")
+BABULKA_IMAGE = os.path.join(IMAGES_DIR, "babulka.jpg")
+SLOVARIK_IMAGE = os.path.join(IMAGES_DIR, "slovarik.jpg")
+LIST_SLOV_IMAGE = os.path.join(IMAGES_DIR, "listslov.jpg")
+DED_IMAGE = os.path.join(IMAGES_DIR, "ded.jpg")
+DED_CHAK_IMAGE = os.path.join(IMAGES_DIR, "ded_chak.jpg")
+GRUSTNII_BABULUA_IMAGE = os.path.join(IMAGES_DIR, "grustnii_babulya.jpg")
+SAMOVAR_IMAGE = os.path.join(IMAGES_DIR, "samovar.jpg")
+DOBRII_IMAGE = os.path.join(IMAGES_DIR, "dobrii.jpg")
+FINAL_IMAGE = os.path.join(IMAGES_DIR, "final.jpg")
+
+# Путь к голосовому сообщению
+VOICE_MESSAGE = os.path.join(VOICES_DIR, "golos.ogg")
+
+# Проверяем существование изображений и голосового сообщения
+for img_path in [WELCOME_IMAGE, DVOR_IMAGE, HOME_IMAGE, DOM_VNUTRI_IMAGE, BABULKA_IMAGE, SLOVARIK_IMAGE,
+                 LIST_SLOV_IMAGE, DED_IMAGE, DED_CHAK_IMAGE, GRUSTNII_BABULUA_IMAGE, SAMOVAR_IMAGE, DOBRII_IMAGE, FINAL_IMAGE]:
+    if not os.path.exists(img_path):
+        logger.warning(f"Изображение не найдено: {img_path}")
+
+if not os.path.exists(VOICE_MESSAGE):
+    logger.warning(f"Голосовое сообщение не найдено: {VOICE_MESSAGE}")
+
+
+# Функция для создания спойлера
+def create_spoiler(text: str) -> str:
+    """Создает текст со скрытым содержимым под спойлером"""
+    return f"<span class='tg-spoiler'>{text}</span>"
+
+
+# Объединенная глава со всеми заданиями
+CHAPTERS = {
+    "chapter1": {
+        "title": "Глава 1",
+        "parts": [
+            {
+                "type": "info",
+                "image": DVOR_IMAGE,
+                "text_tatar": "Әби (бабушка):\n\n— Исәнме, кунак! Безнең авылга рәхим ит!\n\n[Исэнme, куна́к! Безне́ng авылgá рэхи́m ит!]",
+                "text_russian": "Привет,"f"{create_spoiler('гость! Добро пожаловать в нашу деревню!')} \n\nБабай (дедушка):\n\n— Әйдә, түрдән уз. Сине кайнар чәй белән чәк-чәк көтә.\n\n[Эйдэ́, турдэ́n uz. Сине́ кайна́r чэй беле́n чэк-чэ́k кэtэ́.]\n\n Проходи {create_spoiler('в дом. Тебя ждёт горячий чай с чак-чаком.')}",
+                "next_button_text": "Зайти в дом",
+                # Кадры после кнопки: "album" - подряд идущие изображения одним альбомом, "paced" - по одному с паузами
+                "next_delivery": "album",
+                "next_image": HOME_IMAGE,
+                "next_image1": DOM_VNUTRI_IMAGE,
+                "next_text_tatar": "Бабай:\n\n— Безнең авыл тыныч һәм матур. Кичләрен без җырлибыз.\n\n[Безнэ́ng авы́l тыны́ч хэm мату́r. Кичлэ́rэн без жyrла́йбыz.]",
+                "next_text_russian": f"У нас {create_spoiler('в деревне спокойно и красиво. Вечерами мы поём песни.')}",
+                "next_image2": BABULKA_IMAGE,
+                "next_text_babulka": f"Әби:\n\n — Утырыгыз, рәхим итегез! Чәй эчәрсезме?\n\n[Утырыгы́z, рэхи́m итеге́z! Чэй эчэрсезме́?]\n\nПрисаживайтесь, {create_spoiler('угощайтесь! Будете чай?')}",
+                "next_text_babulka1": f"— Ай ты наверное плохо меня понимаешь..\n\n *Әбика взяла с полки старенькую потрепанную книгу. \n\n — Вот возьми словарик:  ",
+                "next_image3": SLOVARIK_IMAGE,
+                "take_button_text": "Алу (взять)",
+                # Паузы шагов (секунды или границы по времени чтения), см. pacing.py
+                "pacing": {"button": {"min": 1.5, "max": 3}, "scene": {"min": 1.5, "max": 5}},
+            },
+            {
+                "type": "thanks_question",
+                "question": "Поблагодарите бабушку:",
+                # Что спросить при интервальном повторении (review.py), если ответ был правильным
+                "review": "Большое спасибо!",
+                "options": [
+                    {"text": "Зур рахмат!", "correct": True, "response": "Правильно! Бабушка рада, что вы вежливы."},
+                    {"text": "Рэхим итерегез!", "correct": False,
+                     "response": "Неправильно. Это значит 'Добро пожаловать!'"},
+                    {"text": "Хверле ирте!", "correct": False, "response": "Неправильно. Это значит 'Добрый день!'"},
+                    {"text": "Бик яхшы куренегез!", "correct": False,
+                     "response": "Неправильно. Это значит 'Очень приятно познакомиться!'"}
+                ]
+            },
+            {
+                "type": "ded_question",
+                "image": DED_IMAGE,
+                "text_tatar": "Бабай:\n\n— Сезгә чәй ошадымы?\n\n[Сезгэ́ чэй ошадымы́?]",
+                "text_russian": "Чай вам понравился?",
+                "hint": "Ответьте фразой: Әйе, бик тәмле чәй булды! Рәхмәт!",
+                "correct_answer": "әйе бик тәмле чәй булды рәхмәт",
+                "review": "Да, чай был очень вкусный! Спасибо!",
+                "feedback": "template",
+                "feedback_key": "tea_liked"
+            },
+            {
+                "type": "tea_request",
+                "text": "Татарский чай такой вкусный, что вы бы с удовольствием выпили еще. Используя әле (мягкое «пожалуйста») и лексику из словаря попросите дедушку налить вам еще одну кружку чая",
+                "required_word": "әле",
+                "review": "Налейте, пожалуйста, еще чаю",
+                "expected_answers": ["тагын чәй салыгыз әле", "тагын бер чынаяк чәй салыгыз әле",
+                                     "чәй салыгыз әле", "тагын чәй салчы әле", "бабай тагын чәй салыгыз әле"],
+                "feedback": "auto",
+                "feedback_key": "tea_more"
+            },
+            {
+                "type": "ded_chak_image",
+                "image": DED_CHAK_IMAGE,
+                "text": f"Бабай:\n\n — Менә чәк-чәк. Аласызмы? \n\n [Менэ́ чэк-чэк. Аласызмы́?]\n\nВот чак-чак.{create_spoiler('Возьмёте? / Будете?')}",
+                "expected_responses": ["да", "конечно", "чак-чак"]
+            },
+            {
+                "type": "info_image",
+                "image": GRUSTNII_BABULUA_IMAGE,
+                "text": f"Әби:\n\n — Әй, самоварда су бетте... Ләкин бу бәла түгел, {create_spoiler('нам')} ярдәм итәр дип уйлыйм.\n\n "
+                        f"[Эй, самоварда́ су бетте́... Лэ-кин бу бэла́ тугель, {create_spoiler('нам')} ярдэм этэр дип уйла́ым.]\n\n Ой, вода"
+                        f"{create_spoiler(' в самоваре закончилась... Но это не беда, нам поможет, думаю.')}"
+            },
+            {
+                "type": "info_image",
+                "image": SAMOVAR_IMAGE,
+                "text": f"Проходите задания в течение дня и наполняй самовар пока бабушка печет свои пәрәмәч, чтобы к вечеру опять попить чай в теплой компании!☕️❤️"
+            },
+            {
+                "type": "info_image",
+                "image": DOBRII_IMAGE,
+                "text": "— Балам, ашадынмы? Хәзер сиңа урын җәимме? \n [Ба́лам, ашады́нгмы? Хэзе́р, синга́ уры́н жэйи́мме?] Дитя мое, ты поел ? Постель постелить ?"
+            },
+            {
+                "type": "info_image",
+                "image": FINAL_IMAGE,
+                "text": f"Бабай достал из сенцев тяжелый советский матрас. Әби принесла пару пуховых подушек и тяжелое-тяжелое одеяло. На полу вам соорудили просто царское ложе. Скрип половиц, запах влаги и посапывания кота. День подходит к концу..."
+            }
+        ]
+    }
+}
@@ -0,0 +1,112 @@
+"""
+Последовательная обработка обновлений внутри одного чата и подавление повторных нажатий.
+
+Middleware пропускает обновления одного чата к обработчикам строго по очереди
+(разные чаты обрабатываются параллельно). Повторное нажатие той же кнопки,
+пока предыдущее еще обрабатывается или в течение окна после него, отбрасывается.
+На callback-запросы отвечаем сразу, чтобы у пользователя не висели "часики".
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+updates_suppressed = metrics.counter("chat_updates_suppressed_total", "Отброшенные повторные обновления по причине")
+updates_waiting = metrics.gauge("chat_updates_waiting", "Обновления, ожидающие своей очереди в чате")
+
+# На эти callback-запросы обработчики отвечают сами (всплывающее сообщение с результатом);
+# если ни один обработчик их не принял (например, кнопка устаревшего вопроса), отвечает middleware
+SELF_ANSWERED_PREFIXES = ("answer_",)
+
+
+def _chat_id(event: TelegramObject) -> Optional[int]:
+    if isinstance(event, Message):
+        return event.chat.id
+    if isinstance(event, CallbackQuery):
+        return event.message.chat.id if event.message else event.from_user.id
+    return None
+
+
+class ChatSerializationMiddleware(BaseMiddleware):
+    def __init__(self, duplicate_window: float = 2.0):
+        self.duplicate_window = duplicate_window
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._users: Dict[int, int] = {}
+        # Нажатия в очереди или в обработке и время завершения последних нажатий
+        self._in_flight: Set[Tuple[int, str]] = set()
+        self._recent: Dict[Tuple[int, str], float] = {}
+
+    def _is_duplicate(self, key: Tuple[int, str]) -> bool:
+        if key in self._in_flight:
+            return True
+        finished_at = self._recent.get(key)
+        return finished_at is not None and time.monotonic() - finished_at < self.duplicate_window
+
+    def _forget_old(self):
+        if len(self._recent) < 1000:
+            return
+        border = time.monotonic() - self.duplicate_window
+        for key in [key for key, finished_at in self._recent.items() if finished_at < border]:
+            del self._recent[key]
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        chat_id = _chat_id(event)
+        if chat_id is None:
+            return await handler(event, data)
+
+        key = None
+        answer_later = False
+        if isinstance(event, CallbackQuery) and event.data:
+            key = (chat_id, event.data)
+            if self._is_duplicate(key):
+                updates_suppressed.inc(reason="duplicate_callback")
+                await self._answer(event)
+                return None
+            self._in_flight.add(key)
+            answer_later = event.data.startswith(SELF_ANSWERED_PREFIXES)
+            if not answer_later:
+                await self._answer(event)
+
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        self._users[chat_id] = self._users.get(chat_id, 0) + 1
+        updates_waiting.inc()
+        waiting = True
+        try:
+            async with lock:
+                updates_waiting.dec()
+                waiting = False
+                result = await handler(event, data)
+            if answer_later and result is UNHANDLED:
+                await self._answer(event)
+            return result
+        finally:
+            if waiting:
+                updates_waiting.dec()
+            self._users[chat_id] -= 1
+            if not self._users[chat_id]:
+                del self._users[chat_id]
+                del self._locks[chat_id]
+            if key is not None:
+                self._in_flight.discard(key)
+                self._recent[key] = time.monotonic()
+                self._forget_old()
+
+    @staticmethod
+    async def _answer(callback: CallbackQuery):
+        try:
+            await callback.answer()
+        except Exception as e:
+            logger.debug(f"Не удалось ответить на callback: {e}")
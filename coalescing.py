@@ -0,0 +1,113 @@
+"""
+Объединение одинаковых одновременных запросов и короткий кэш результатов.
+
+- SingleFlight: если запрос с тем же ключом уже выполняется, новые вызовы ждут
+  его результат вместо того, чтобы делать свой запрос.
+- TTLCache: небольшой LRU-кэш со временем жизни записей. Поколения ключей
+  защищают от гонки "чтение началось до записи, а закончилось после": такой
+  результат в кэш не попадает.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+coalesced_calls = metrics.counter("coalesced_calls_total", "Вызовы, получившие результат чужого запроса")
+cache_requests = metrics.counter("cache_requests_total", "Обращения к кэшу по результату (hit/miss)")
+
+_MISSING = object()
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        future = self._calls.get(key)
+        if future is not None:
+            coalesced_calls.inc(name=self.name)
+            # shield: отмена одного ожидающего не должна отменять общий запрос
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(factory())
+        self._calls[key] = future
+        future.add_done_callback(lambda f: self._finish(key, f))
+        return await asyncio.shield(future)
+
+    def _finish(self, key: Hashable, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            # Помечаем исключение полученным, даже если ждавшие уже отменены
+            future.exception()
+
+    def forget(self, key: Hashable):
+        """Следующий вызов с этим ключом не присоединится к уже идущему запросу"""
+        self._calls.pop(key, None)
+
+
+class TTLCache:
+    def __init__(self, name: str, ttl: float = 5.0, max_size: int = 10000):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._generations: Dict[Hashable, int] = {}
+        self._version = 0
+        # Поколение ключей, забытых при очистке _generations
+        self._floor = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Hashable, default: Any = _MISSING) -> Any:
+        item = self._items.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._items[key]
+            cache_requests.inc(name=self.name, result="miss")
+            return default
+        self._items.move_to_end(key)
+        cache_requests.inc(name=self.name, result="hit")
+        return item[1]
+
+    def generation(self, key: Hashable) -> int:
+        return self._generations.get(key, self._floor)
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        """Сохраняет значение; если передано поколение и ключ с тех пор инвалидирован - не сохраняет"""
+        if generation is not None and generation != self.generation(key):
+            return
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._items.pop(key, None)
+        self._version += 1
+        self._generations[key] = self._version
+        if len(self._generations) > self.max_size * 2:
+            # Чтения, начатые до очистки, получат несовпадающее поколение и не попадут в кэш
+            self._generations.clear()
+            self._floor = self._version
+
+
+async def cached_call(cache: TTLCache, flight: SingleFlight, key: Hashable,
+                      factory: Callable[[], Awaitable[T]]) -> T:
+    """Чтение через кэш: кэш -> общий идущий запрос -> новый запрос"""
+    value = cache.get(key)
+    if value is not _MISSING:
+        return value
+    generation = cache.generation(key)
+    value = await flight.do(key, factory)
+    cache.set(key, value, generation)
+    return value
@@ -4,6 +4,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Получаем значения из переменных окружения
+# DATABASE_URL: postgresql://... или sqlite:///путь/к/файлу.db для встроенной базы (sqlite_backend.py)
 API_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 DATABASE_URL = os.getenv('DATABASE_URL')
 
@@ -22,3 +23,65 @@ if not API_TOKEN:
 
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL is not set")
+
+# Горизонтальное масштабирование: количество процессов-воркеров и общее хранилище FSM
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '1'))
+REDIS_URL = os.getenv('REDIS_URL')
+# Без Redis: через сколько секунд простоя состояние пользователя выгружается из памяти в базу
+# и сколько памяти (МБ) могут занимать состояния в процессе
+SESSION_TTL = float(os.getenv('SESSION_TTL', '1800'))
+SESSION_MEMORY_BUDGET_MB = float(os.getenv('SESSION_MEMORY_BUDGET_MB', '64'))
+
+# GigaChat и переводчик (адреса можно переопределить, например, для локального тестового сервера)
+GIGACHAT_OAUTH_URL = os.getenv('GIGACHAT_OAUTH_URL', 'https://ngw.devices.sberbank.ru:9443/api/v2/oauth')
+GIGACHAT_API_URL = os.getenv('GIGACHAT_API_URL', 'https://gigachat.devices.sberbank.ru/api/v1/chat/completions')
+# Ключ авторизации GigaChat (Basic) - только из окружения; без него LLM выключена и бот отвечает шаблонами
+GIGACHAT_AUTH_KEY = os.getenv('GIGACHAT_AUTH_KEY', '')
+TRANSLATE_API_URL = os.getenv('TRANSLATE_API_URL', 'https://v2.api.translate.tatar/')
+
+# Бюджет времени (секунды) на обратную связь от LLM в одном ответе пользователю
+LLM_TIME_BUDGET = float(os.getenv('LLM_TIME_BUDGET', '8'))
+# Через сколько секунд без ответа отправлять повторный (hedged) запрос к GigaChat; 0 - выключено
+LLM_HEDGE_DELAY = float(os.getenv('LLM_HEDGE_DELAY', '0'))
+# Сколько запросов к GigaChat может выполняться одновременно (остальные ждут в очереди)
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '20'))
+
+# Порт HTTP-эндпоинта /metrics (если не задан, сервер метрик не поднимается)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+# Показывать ответ LLM по мере генерации (правкой сообщения) и минимальный интервал между правками
+LLM_STREAMING = os.getenv('LLM_STREAMING', '1') == '1'
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.0'))
+
+# Как часто (секунды) проверять изменения chapters.py и изображений глав; 0 - без горячей перезагрузки
+CHAPTERS_RELOAD_INTERVAL = float(os.getenv('CHAPTERS_RELOAD_INTERVAL', '2'))
+
+# Сколько глав одновременно может воспроизводиться в одном процессе
+MAX_PLAYBACKS = int(os.getenv('MAX_PLAYBACKS', '500'))
+
+# Как часто (секунды) проверять подошедшие повторения; 0 - не отправлять повторения
+REVIEW_INTERVAL = float(os.getenv('REVIEW_INTERVAL', '60'))
+
+# Ежедневная рассылка: шаблон сообщения ($name, $score) и час отправки; без шаблона рассылка выключена
+DAILY_BROADCAST_TEMPLATE = os.getenv('DAILY_BROADCAST_TEMPLATE', '')
+DAILY_BROADCAST_HOUR = int(os.getenv('DAILY_BROADCAST_HOUR', '10'))
+
+# Запись входящих обновлений для нагрузочных тестов (traffic.py): путь к журналу (пусто - не записывать)
+# и секрет для псевдонимов пользователей (пусто - новый при каждом запуске)
+TRAFFIC_LOG = os.getenv('TRAFFIC_LOG', '')
+TRAFFIC_SALT = os.getenv('TRAFFIC_SALT', '')
+
+# Реплики только для чтения (через запятую; пусто - все запросы идут на DATABASE_URL),
+# размер пула соединений на каждую базу и допустимое отставание реплики (секунды)
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', '5'))
+
+# История решенных задач: через сколько месяцев партиция уходит в архив (0 - хранить все) и каталог архивов
+SOLVED_TASKS_RETENTION_MONTHS = int(os.getenv('SOLVED_TASKS_RETENTION_MONTHS', '0'))
+SOLVED_TASKS_ARCHIVE_DIR = os.getenv('SOLVED_TASKS_ARCHIVE_DIR', 'archive')
+
+# Telegram id администраторов через запятую: им доступны отчеты /funnel и /scores
+ADMIN_IDS = {int(admin_id) for admin_id in os.getenv('ADMIN_IDS', '').split(',') if admin_id.strip()}
+
+# Каталог сегментов журнала ответов, в который пишутся попытки, пока база недоступна
+ANSWER_LOG_DIR = os.getenv('ANSWER_LOG_DIR', 'answer_segments')
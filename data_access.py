@@ -0,0 +1,115 @@
+"""
+Общий для процесса асинхронный доступ к данным пользователей.
+
+bot.py и routers.py работают через один экземпляр DataAccess (get_data_access),
+а значит, через один DatabaseManager и общий кэш:
+- одинаковые одновременные чтения объединяются в один запрос к базе;
+- результаты чтений живут в кэше несколько секунд;
+- запись (создание пользователя, начисление очков, решенная задача)
+  сбрасывает кэш затронутого пользователя.
+
+DatabaseSessionMiddleware связывает обращения к базе с пользователем: после
+его записи чтения этого пользователя идут на основную базу, а не на реплику,
+которая может еще не получить изменения.
+"""
+import asyncio
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from coalescing import SingleFlight, TTLCache, cached_call
+from main import DatabaseManager, db_session, open_database
+
+# Сколько секунд живут прочитанные данные пользователя
+CACHE_TTL = 5.0
+# Сколько соответствий user_id -> telegram_id помнить (давно не встречавшиеся вытесняются)
+MAX_TELEGRAM_IDS = 100_000
+
+
+class DataAccess:
+    def __init__(self, db: DatabaseManager, ttl: float = CACHE_TTL, max_telegram_ids: int = MAX_TELEGRAM_IDS):
+        self.db = db
+        self._cache = TTLCache("users", ttl=ttl)
+        self._flight = SingleFlight("users")
+        # user_id -> telegram_id, чтобы запись по user_id сбрасывала кэш по telegram_id
+        self.max_telegram_ids = max_telegram_ids
+        self._telegram_ids: "OrderedDict[int, int]" = OrderedDict()
+
+    def _remember(self, user_id: int, telegram_id: int):
+        self._telegram_ids[user_id] = telegram_id
+        self._telegram_ids.move_to_end(user_id)
+        while len(self._telegram_ids) > self.max_telegram_ids:
+            self._telegram_ids.popitem(last=False)
+
+    def invalidate_user(self, telegram_id: int):
+        for key in (("user", telegram_id), ("stats", telegram_id)):
+            self._cache.invalidate(key)
+            self._flight.forget(key)
+
+    def _invalidate_user_id(self, user_id: int):
+        telegram_id = self._telegram_ids.get(user_id)
+        if telegram_id is not None:
+            self.invalidate_user(telegram_id)
+
+    async def _load_user(self, telegram_id: int) -> Optional[Tuple]:
+        user = await asyncio.to_thread(self.db.get_user_by_telegram_id, telegram_id)
+        if user is not None:
+            self._remember(user[0], telegram_id)
+        return user
+
+    # Чтение
+    async def get_user_by_telegram_id(self, telegram_id: int) -> Optional[Tuple]:
+        return await cached_call(self._cache, self._flight, ("user", telegram_id),
+                                 lambda: self._load_user(telegram_id))
+
+    async def get_user_stats(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        return await cached_call(self._cache, self._flight, ("stats", telegram_id),
+                                 lambda: asyncio.to_thread(self.db.get_user_stats, telegram_id))
+
+    # Запись
+    async def create_user(self, telegram_id: int, user_name: str, echpoch_score: int = 0) -> int:
+        try:
+            user_id = await asyncio.to_thread(self.db.create_user, telegram_id, user_name, echpoch_score)
+        finally:
+            self.invalidate_user(telegram_id)
+        self._remember(user_id, telegram_id)
+        return user_id
+
+    async def increment_user_score(self, user_id: int, increment: int) -> bool:
+        try:
+            return await asyncio.to_thread(self.db.increment_user_score, user_id, increment)
+        finally:
+            self._invalidate_user_id(user_id)
+
+    async def mark_task_as_solved(self, user_id: int, task_id: int) -> bool:
+        try:
+            return await asyncio.to_thread(self.db.mark_task_as_solved, user_id, task_id)
+        finally:
+            self._invalidate_user_id(user_id)
+
+
+class DatabaseSessionMiddleware(BaseMiddleware):
+    """Обращения к базе при обработке обновления относятся к сессии его автора"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        # Контекст копируется в asyncio.to_thread и в задачи, созданные обработчиком
+        with db_session(user.id):
+            return await handler(event, data)
+
+
+@lru_cache(maxsize=None)
+def get_data_access() -> DataAccess:
+    from config import DATABASE_URL, DATABASE_REPLICA_URLS, DB_POOL_SIZE, DB_REPLICA_MAX_LAG
+    return DataAccess(open_database(DATABASE_URL, replica_urls=DATABASE_REPLICA_URLS, pool_size=DB_POOL_SIZE,
+                                    max_replica_lag=DB_REPLICA_MAX_LAG))
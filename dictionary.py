@@ -0,0 +1,153 @@
+"""
+Татарско-русский словарик с поиском по началу слова.
+
+Статьи загружаются из data/dictionary.tsv (татарское слово<TAB>перевод).
+Индекс - отсортированный массив ключей, по которому ищется бинарным поиском:
+ключами служат татарское слово, перевод и каждое слово внутри фраз. Ключи
+приводятся к нижнему регистру и "сворачиваются" (ә→а, ү→у, ө→о, җ→ж, ң→н,
+һ→х, ё→е, э→а), поэтому "сэлам", "салам", "сәлам" и "СӘЛАМ" находят одну
+и ту же статью.
+Результаты поиска кэшируются по введенному префиксу.
+
+Бенчмарк на синтетическом словаре:
+    python dictionary.py bench --entries 200000
+"""
+import argparse
+import logging
+import os
+import random
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+DICTIONARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "dictionary.tsv")
+
+MAX_RESULTS = 20
+PREFIX_CACHE_SIZE = 4096
+
+_FOLDING = str.maketrans({
+    "ә": "а", "ү": "у", "ө": "о", "җ": "ж", "ң": "н", "һ": "х", "ё": "е",
+    # На русской раскладке ә часто набирают как э: "рэхмэт"
+    "э": "а",
+})
+
+
+def fold(text: str) -> str:
+    """Нижний регистр без татарских диакритик и лишних пробелов"""
+    return " ".join(text.lower().translate(_FOLDING).split())
+
+
+def load_entries(path: str = DICTIONARY_PATH) -> List[Tuple[str, str]]:
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split("\t")
+            if len(parts) != 2:
+                logger.warning(f"{path}:{line_number}: ожидалось 'слово<TAB>перевод', строка пропущена")
+                continue
+            entries.append((parts[0].strip(), parts[1].strip()))
+    return entries
+
+
+class Dictionary:
+    def __init__(self, entries: Iterable[Tuple[str, str]], cache_size: int = PREFIX_CACHE_SIZE):
+        self.entries: List[Tuple[str, str]] = list(entries)
+        pairs = []
+        for index, (tatar, russian) in enumerate(self.entries):
+            keys = {fold(tatar), fold(russian)}
+            # Каждое слово фразы тоже ключ: "теле" находит "татар теле"
+            for text in (tatar, russian):
+                keys.update(fold(word.strip("(),.?!;")) for word in text.split())
+            pairs.extend((key, index) for key in keys if key)
+        pairs.sort()
+        # Два параллельных массива вместо списка кортежей: bisect идет по строкам
+        self._keys = [key for key, _ in pairs]
+        self._indexes = [index for _, index in pairs]
+        self._cached_search = lru_cache(maxsize=cache_size)(self._search)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _search(self, prefix: str, limit: int) -> Tuple[Tuple[str, str], ...]:
+        found = []
+        seen = set()
+        position = bisect_left(self._keys, prefix)
+        keys = self._keys
+        while position < len(keys) and len(found) < limit and keys[position].startswith(prefix):
+            index = self._indexes[position]
+            if index not in seen:
+                seen.add(index)
+                found.append(self.entries[index])
+            position += 1
+        return tuple(found)
+
+    def search(self, query: str, limit: int = MAX_RESULTS) -> Tuple[Tuple[str, str], ...]:
+        """Статьи, у которых ключ начинается с query (без учета регистра и диакритик)"""
+        prefix = fold(query)
+        if not prefix:
+            return ()
+        return self._cached_search(prefix, limit)
+
+    def cache_info(self):
+        return self._cached_search.cache_info()
+
+
+@lru_cache(maxsize=None)
+def get_dictionary() -> Dictionary:
+    entries = load_entries()
+    dictionary = Dictionary(entries)
+    logger.info(f"Словарик загружен: {len(entries)} статей, {len(dictionary._keys)} ключей")
+    return dictionary
+
+
+def _random_word(rng: random.Random, alphabet: str) -> str:
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(3, 10)))
+
+
+def benchmark(entries: int, queries: int):
+    rng = random.Random(1)
+    tatar_letters = "абвгдежзийклмнопрстуфхчшыэюяәүөҗңһ"
+    russian_letters = "абвгдежзийклмнопрстуфхцчшщыэюя"
+    data = [(_random_word(rng, tatar_letters), _random_word(rng, russian_letters)) for _ in range(entries)]
+
+    started = time.perf_counter()
+    dictionary = Dictionary(data, cache_size=queries)
+    build_time = time.perf_counter() - started
+
+    words = [rng.choice(data)[rng.randint(0, 1)] for _ in range(queries)]
+    prefixes = [word[:rng.randint(1, len(word))] for word in words]
+
+    started = time.perf_counter()
+    found = sum(len(dictionary.search(prefix)) for prefix in prefixes)
+    cold = (time.perf_counter() - started) / queries
+
+    started = time.perf_counter()
+    for prefix in prefixes:
+        dictionary.search(prefix)
+    cached = (time.perf_counter() - started) / queries
+
+    print(f"entries={entries} keys={len(dictionary._keys)} build={build_time:.2f}s")
+    print(f"search (cold):   {cold * 1e6:.1f} us/query, {found / queries:.1f} results/query")
+    print(f"search (cached): {cached * 1e6:.1f} us/query")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Татарско-русский словарик")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subparsers.add_parser("bench")
+    bench_parser.add_argument("--entries", type=int, default=200_000)
+    bench_parser.add_argument("--queries", type=int, default=100_000)
+    lookup_parser = subparsers.add_parser("lookup")
+    lookup_parser.add_argument("query")
+    args = parser.parse_args()
+    if args.command == "bench":
+        benchmark(args.entries, args.queries)
+    else:
+        for tatar, russian in get_dictionary().search(args.query):
+            print(f"{tatar} - {russian}")
@@ -0,0 +1,65 @@
+"""
+Локальная заглушка GigaChat для проверки потокового режима без сети.
+
+Запуск:
+    python fake_sse_server.py --port 8089 --delay 0.2
+
+и затем бот с переменными окружения:
+    GIGACHAT_OAUTH_URL=http://127.0.0.1:8089/api/v2/oauth
+    GIGACHAT_API_URL=http://127.0.0.1:8089/api/v1/chat/completions
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+DEFAULT_ANSWER = "Молодец, балам! Очень вежливо и правильно сказал, бабушка тобой гордится."
+
+
+async def oauth(request):
+    return web.json_response({
+        "access_token": "fake-token",
+        "expires_at": int((time.time() + 30 * 60) * 1000),
+    })
+
+
+async def completions(request):
+    payload = await request.json()
+    settings = request.app["settings"]
+    words = settings["answer"].split(" ")
+
+    if not payload.get("stream"):
+        await asyncio.sleep(settings["delay"] * len(words))
+        return web.json_response({
+            "choices": [{"message": {"role": "assistant", "content": settings["answer"]}}]
+        })
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    for index, word in enumerate(words):
+        await asyncio.sleep(settings["delay"])
+        chunk = word if index == 0 else f" {word}"
+        data = {"choices": [{"delta": {"content": chunk}, "index": 0}]}
+        await response.write(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+def create_app(answer: str = DEFAULT_ANSWER, delay: float = 0.2) -> web.Application:
+    app = web.Application()
+    app["settings"] = {"answer": answer, "delay": delay}
+    app.router.add_post("/api/v2/oauth", oauth)
+    app.router.add_post("/api/v1/chat/completions", completions)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушка GigaChat с потоковыми ответами (SSE)")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--delay", type=float, default=0.2, help="Пауза между фрагментами, секунды")
+    parser.add_argument("--answer", default=DEFAULT_ANSWER)
+    args = parser.parse_args()
+    web.run_app(create_app(args.answer, args.delay), host="127.0.0.1", port=args.port)
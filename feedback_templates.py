@@ -0,0 +1,123 @@
+"""
+Локальная обратная связь "от бабушки" без обращения к LLM.
+
+Ответ пользователя сравнивается с ожидаемыми фразами шага и получает вид
+совпадения: exact (точно), fuzzy (с опечатками), partial (часть слов) или none.
+По виду совпадения выбирается заготовленный шаблон с татарским вариантом.
+
+Режим выбирается для каждого шага в описании главы ключом "feedback":
+    "llm"      - всегда GigaChat (по умолчанию)
+    "template" - всегда шаблон
+    "auto"     - шаблон для ожидаемых ответов (exact/fuzzy), GigaChat для необычных
+"""
+import random
+import re
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional
+
+EXACT = "exact"
+FUZZY = "fuzzy"
+PARTIAL = "partial"
+NONE = "none"
+
+FUZZY_RATIO = 0.85
+PARTIAL_RATIO = 0.5
+
+# Шаблоны по ключу шага ("feedback_key") и виду совпадения: татарский и русский варианты
+FEEDBACK_TEMPLATES: Dict[str, Dict[str, List[Dict[str, str]]]] = {
+    "default": {
+        EXACT: [
+            {"tt": "Афәрин, балам! Бик дөрес әйттең.", "ru": "Молодец, дитя моё! Очень правильно сказал."},
+            {"tt": "Менә шулай! Бик матур әйттең.", "ru": "Вот так! Очень красиво сказал."},
+        ],
+        FUZZY: [
+            {"tt": "Яхшы, балам! Бераз гына хата бар, ләкин мин аңладым.",
+             "ru": "Хорошо, дитя моё! Есть маленькая ошибка, но я всё поняла."},
+        ],
+        PARTIAL: [
+            {"tt": "Әйбәт башладың! Тагын бер тапкыр тулысынча әйтеп кара.",
+             "ru": "Хорошее начало! Попробуй ещё раз сказать полностью."},
+        ],
+        NONE: [
+            {"tt": "Борчылма, балам, бергә өйрәнербез.", "ru": "Не переживай, дитя моё, вместе научимся."},
+        ],
+    },
+    "tea_liked": {
+        EXACT: [
+            {"tt": "Бик шат, балам! Чәебез тәмле булгач, тагын эчәрбез.",
+             "ru": "Очень рада, дитя моё! Раз чай вкусный, ещё попьём."},
+            {"tt": "Рәхмәт, кунак! Безнең чәй һәрвакыт тәмле.",
+             "ru": "Спасибо, гость! Наш чай всегда вкусный."},
+        ],
+        FUZZY: [
+            {"tt": "Аңладым, аңладым! Чәй ошаган, бик шат.",
+             "ru": "Поняла, поняла! Чай понравился, очень рада."},
+        ],
+    },
+    "tea_more": {
+        EXACT: [
+            {"tt": "Әлбәттә, балам, хәзер үк салам! Эч, рәхим ит.",
+             "ru": "Конечно, дитя моё, сейчас же налью! Пей на здоровье."},
+            {"tt": "Менә, тагын бер чынаяк. Сәламәтлегеңә!",
+             "ru": "Вот, ещё одна чашка. На здоровье!"},
+        ],
+        FUZZY: [
+            {"tt": "Бик әдәпле сорадың! Хәзер салам.",
+             "ru": "Очень вежливо попросил! Сейчас налью."},
+        ],
+    },
+}
+
+
+def normalize_answer(text: str) -> str:
+    """Нижний регистр, без знаков препинания и лишних пробелов"""
+    return " ".join(re.sub(r"[^\w\s-]", " ", text.lower()).split())
+
+
+def classify_answer(user_answer: str, expected: Iterable[str]) -> str:
+    """Вид совпадения ответа с ожидаемыми фразами"""
+    answer = normalize_answer(user_answer)
+    candidates = [normalize_answer(phrase) for phrase in expected if phrase]
+    if not answer or not candidates:
+        return NONE
+    if answer in candidates:
+        return EXACT
+
+    best_ratio = max(SequenceMatcher(None, answer, phrase).ratio() for phrase in candidates)
+    if best_ratio >= FUZZY_RATIO:
+        return FUZZY
+
+    answer_words = set(answer.split())
+    best_overlap = max(len(answer_words & set(phrase.split())) / len(phrase.split()) for phrase in candidates)
+    if best_overlap >= PARTIAL_RATIO:
+        return PARTIAL
+    return NONE
+
+
+def render_template(key: Optional[str], match: str) -> str:
+    """Текст шаблона в том же виде, что и ответ LLM: татарский вариант и русский перевод"""
+    templates = FEEDBACK_TEMPLATES.get(key or "default", {}).get(match) \
+        or FEEDBACK_TEMPLATES["default"][match]
+    template = random.choice(templates)
+    return f"{template['tt']}\n\nРусский вариант: {template['ru']}"
+
+
+def expected_answers(part: dict) -> List[str]:
+    answers = list(part.get("expected_answers", []))
+    if part.get("correct_answer"):
+        answers.append(part["correct_answer"])
+    return answers
+
+
+def template_feedback(part: dict, user_answer: str) -> Optional[str]:
+    """
+    Обратная связь из шаблонов согласно режиму шага.
+    None означает, что для этого ответа нужно обратиться к LLM.
+    """
+    mode = part.get("feedback", "llm")
+    if mode == "llm":
+        return None
+    match = classify_answer(user_answer, expected_answers(part))
+    if mode == "auto" and match not in (EXACT, FUZZY):
+        return None
+    return render_template(part.get("feedback_key"), match)
@@ -0,0 +1,334 @@
+"""
+Обратная связь от GigaChat для ответов пользователя.
+
+Каждый вызов идет через предохранитель и укладывается в бюджет времени
+взаимодействия (resilience.deadline). Если GigaChat недоступен или бюджет
+исчерпан, пользователь сразу получает ранее сохраненный или шаблонный ответ.
+
+get_llm_response_streaming() читает ответ потоком (server-sent events) и
+передает накопленный текст в колбэк по мере генерации.
+
+Одинаковые одновременные запросы (тот же вопрос и тот же ответ после
+нормализации) объединяются в один. Число одновременных обращений к GigaChat
+ограничено LLM_MAX_CONCURRENCY, остальные ждут своей очереди.
+
+Без GIGACHAT_AUTH_KEY обращений к GigaChat нет - сразу шаблонный ответ. Без
+gradio_client ответы не переводятся (только сохраненные переводы).
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional, Tuple, TypeVar
+
+import aiohttp
+import requests
+
+import metrics
+from coalescing import SingleFlight
+from config import (GIGACHAT_API_URL, GIGACHAT_AUTH_KEY, GIGACHAT_OAUTH_URL, LLM_HEDGE_DELAY,
+                    LLM_MAX_CONCURRENCY, TRANSLATE_API_URL)
+from resilience import BudgetExhausted, CircuitBreaker, CircuitOpenError, DeadlineExceeded, hedged, timeout_for
+from translations import translate_static
+
+logger = logging.getLogger(__name__)
+
+LLM_ENABLED = bool(GIGACHAT_AUTH_KEY)
+if not LLM_ENABLED:
+    logger.warning("GIGACHAT_AUTH_KEY не задан: обратная связь от LLM выключена, используются шаблоны")
+
+try:
+    from gradio_client import Client as GradioClient
+except ImportError:
+    GradioClient = None
+    logger.warning("gradio_client не установлен: перевод ответов LLM выключен")
+
+OAUTH_TIMEOUT = 10
+COMPLETION_TIMEOUT = 30
+TRANSLATE_TIMEOUT = 10
+
+llm_breaker = CircuitBreaker("gigachat", slow_call_seconds=5.0)
+translate_breaker = CircuitBreaker("translate_tatar", slow_call_seconds=3.0)
+
+_llm_flight = SingleFlight("llm")
+_llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+llm_waiting = metrics.gauge("llm_requests_waiting", "Запросы к LLM в очереди за свободным слотом")
+llm_in_flight = metrics.gauge("llm_requests_in_flight", "Выполняющиеся запросы к LLM")
+llm_queue_wait = metrics.histogram("llm_queue_wait_seconds", "Время ожидания свободного слота LLM")
+
+# Шаблонные ответы на случай, когда GigaChat недоступен
+FALLBACK_RESPONSES = [
+    "Молодец, балам! Бабушка тобой гордится.",
+    "Вот и славно! Так держать, дорогой гость.",
+    "Хорошо сказал! Бабушка рада тебя слышать.",
+]
+
+T = TypeVar("T")
+
+_token: Optional[Tuple[str, float]] = None
+_translate_client = None
+
+# Последние успешные ответы по (вопрос, ответ) - отдаются, пока предохранитель разомкнут
+_response_cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+RESPONSE_CACHE_SIZE = 512
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().replace("!", "").replace(",", "").replace(".", "").split())
+
+
+def _get_access_token() -> str:
+    """Получение токена (кэшируется до истечения срока действия)"""
+    global _token
+    if _token and _token[1] > time.time() + 60:
+        return _token[0]
+
+    headers = {
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Accept': 'application/json',
+        'RqUID': 'b15dc234-3503-40d5-ac09-c25453176832',
+        'Authorization': f'Basic {GIGACHAT_AUTH_KEY}'
+    }
+    payload = {
+        'scope': 'GIGACHAT_API_PERS'
+    }
+    response = requests.post(GIGACHAT_OAUTH_URL, headers=headers, data=payload, verify=False,
+                             timeout=timeout_for(OAUTH_TIMEOUT))
+    response.raise_for_status()
+    data = response.json()
+    # expires_at приходит в миллисекундах; если его нет, считаем токен живым 25 минут
+    expires_at = data.get('expires_at', (time.time() + 25 * 60) * 1000) / 1000
+    _token = (data['access_token'], expires_at)
+    return _token[0]
+
+
+def build_payload(question: str, user_answer: str) -> dict:
+    # Формируем промпт для проверки ответа
+    system_prompt = f"""Представь, что ты добрая и вежливая бабушка, которая говорит ТОЛЬКО ПО-РУССКИ!!!.
+    Пользователю был задан вопрос: '{question}'
+    Пользователь ответил: '{user_answer}'
+    Если пользователь правильно ответил на вопрос - похвали пользователя.
+    Если пользователь ответил не по теме - вежливо укажи на его ошибки.
+    Будь доброй и поддерживающей. НЕ ОТВЕЧАЙ ПО_ТАТАРСКИ!!!
+    Отвечай сплошным текстам - не отвечай по пунктам.
+    Отвечай не больше двух предложений. Старайся ответь кратко и ясно
+    Выводи только одну фразу!
+    """
+
+    return {
+        "model": "GigaChat",
+        "messages": [
+            {
+                "role": "system",
+                "content": system_prompt
+            },
+            {
+                "role": "user",
+                "content": f"Ответ: '{user_answer}'"
+            }
+        ],
+        "temperature": 0.7,
+        "max_tokens": 500
+    }
+
+
+def request_completion(question: str, user_answer: str) -> str:
+    """Синхронный запрос к GigaChat; таймауты берутся из оставшегося бюджета"""
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {_get_access_token()}"
+    }
+    resp = requests.post(GIGACHAT_API_URL, headers=headers, json=build_payload(question, user_answer),
+                         verify=False, timeout=timeout_for(COMPLETION_TIMEOUT))
+    resp.raise_for_status()
+    return resp.json()['choices'][0]['message']['content']
+
+
+async def stream_completion(question: str, user_answer: str) -> AsyncIterator[str]:
+    """Потоковый запрос к GigaChat: отдает фрагменты ответа по мере их генерации"""
+    token = await asyncio.to_thread(_get_access_token)
+    payload = build_payload(question, user_answer)
+    payload["stream"] = True
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream",
+        "Authorization": f"Bearer {token}"
+    }
+    timeout = aiohttp.ClientTimeout(total=timeout_for(COMPLETION_TIMEOUT))
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.post(GIGACHAT_API_URL, json=payload, headers=headers, ssl=False) as resp:
+            resp.raise_for_status()
+            async for raw_line in resp.content:
+                line = raw_line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+
+def translate_to_tatar(text: str) -> str:
+    """Перевод через translate.tatar (gradio_client - необязательная зависимость)"""
+    global _translate_client
+    if _translate_client is None:
+        _translate_client = GradioClient(TRANSLATE_API_URL)
+    job = _translate_client.submit(lang="rus2tat", text=text, api_name="/translate_interface")
+    return job.result(timeout=timeout_for(TRANSLATE_TIMEOUT))
+
+
+def fallback_response(question: str, user_answer: str) -> str:
+    """Ранее полученный ответ на такой же вопрос или шаблон"""
+    cached = _response_cache.get((_normalize(question), _normalize(user_answer)))
+    if cached:
+        return cached
+    text = random.choice(FALLBACK_RESPONSES)
+    translated = translate_static(text)
+    if translated and translated != text:
+        return f"{translated}\n\nРусский вариант: {text}"
+    return text
+
+
+def _remember(question: str, user_answer: str, response: str):
+    key = (_normalize(question), _normalize(user_answer))
+    _response_cache[key] = response
+    _response_cache.move_to_end(key)
+    while len(_response_cache) > RESPONSE_CACHE_SIZE:
+        _response_cache.popitem(last=False)
+
+
+@asynccontextmanager
+async def _llm_slot():
+    """Слот для запроса к LLM; ожидание в очереди ограничено бюджетом взаимодействия"""
+    started = time.monotonic()
+    llm_waiting.inc()
+    try:
+        await asyncio.wait_for(_llm_slots.acquire(), timeout_for(COMPLETION_TIMEOUT))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("No free LLM slot within the time budget")
+    finally:
+        llm_waiting.dec()
+        llm_queue_wait.observe(time.monotonic() - started)
+    llm_in_flight.inc()
+    try:
+        yield
+    finally:
+        llm_in_flight.dec()
+        _llm_slots.release()
+
+
+async def _within_budget(factory: Callable[[], Awaitable[T]], limit: float) -> T:
+    """
+    Ждет factory() не дольше limit и остатка бюджета. Таймауты requests внутри
+    потока не учитывают повторные попытки и hedged-запросы, поэтому ожидание
+    ограничивается и здесь (сам поток доработает в фоне).
+    """
+    timeout = timeout_for(limit)
+    try:
+        return await asyncio.wait_for(factory(), timeout)
+    except asyncio.TimeoutError:
+        if timeout < limit:
+            # Ждали меньше собственного таймаута сервиса - кончился бюджет взаимодействия
+            raise BudgetExhausted(f"Time budget ran out after {timeout:.1f}s")
+        raise DeadlineExceeded(f"No response within {timeout:.1f}s")
+
+
+async def _completion(question: str, user_answer: str) -> str:
+    def attempt():
+        return asyncio.to_thread(request_completion, question, user_answer)
+
+    if LLM_HEDGE_DELAY > 0:
+        return await _within_budget(lambda: hedged(attempt, LLM_HEDGE_DELAY), COMPLETION_TIMEOUT)
+    return await _within_budget(attempt, COMPLETION_TIMEOUT)
+
+
+async def _translate(text: str) -> Optional[str]:
+    # Статические тексты уже переведены офлайн (build_translations.py)
+    stored = translate_static(text)
+    if stored is not None and stored != text:
+        return stored
+    if GradioClient is None:
+        return None
+    try:
+        return await translate_breaker.call(
+            _within_budget, lambda: asyncio.to_thread(translate_to_tatar, text), TRANSLATE_TIMEOUT)
+    except (CircuitOpenError, DeadlineExceeded):
+        return None
+    except Exception as e:
+        logger.error(f"Ошибка при переводе: {e}")
+        return None
+
+
+async def get_llm_response(question: str, user_answer: str) -> str:
+    """
+    Получает ответ от GigaChat API с проверкой ответа пользователя.
+    Никогда не возвращает None: при сбое отдает сохраненный или шаблонный ответ.
+    """
+    if not LLM_ENABLED:
+        return fallback_response(question, user_answer)
+    key = (_normalize(question), _normalize(user_answer))
+    return await _llm_flight.do(key, lambda: _respond(question, user_answer))
+
+
+async def _respond(question: str, user_answer: str) -> str:
+    try:
+        async with _llm_slot():
+            answer = await llm_breaker.call(_completion, question, user_answer)
+    except (CircuitOpenError, DeadlineExceeded):
+        return fallback_response(question, user_answer)
+    except Exception as e:
+        logger.error(f"Ошибка при обращении к LLM: {e}")
+        return fallback_response(question, user_answer)
+
+    return await _finalize(question, user_answer, answer)
+
+
+async def _finalize(question: str, user_answer: str, answer: str) -> str:
+    translated = await _translate(answer)
+    if translated:
+        response = f"{translated}\n\nРусский вариант: {answer}"
+    else:
+        response = f"Русский вариант: {answer}\n\n(Перевод временно недоступен)"
+    _remember(question, user_answer, response)
+    return response
+
+
+async def _stream_into(question: str, user_answer: str, on_text: Callable[[str], Awaitable[None]]) -> str:
+    parts = []
+    async for delta in stream_completion(question, user_answer):
+        parts.append(delta)
+        await on_text("".join(parts))
+    return "".join(parts)
+
+
+async def get_llm_response_streaming(question: str, user_answer: str,
+                                     on_text: Callable[[str], Awaitable[None]]) -> str:
+    """
+    То же, что get_llm_response, но русский текст ответа передается в on_text
+    по мере генерации. Возвращает итоговый ответ (с переводом, если он доступен).
+    Если такой же запрос уже выполняется, ждет его итог без промежуточного текста.
+    """
+    if not LLM_ENABLED:
+        return fallback_response(question, user_answer)
+    key = (_normalize(question), _normalize(user_answer))
+    return await _llm_flight.do(key, lambda: _respond_streaming(question, user_answer, on_text))
+
+
+async def _respond_streaming(question: str, user_answer: str, on_text: Callable[[str], Awaitable[None]]) -> str:
+    try:
+        async with _llm_slot():
+            answer = await llm_breaker.call(
+                _within_budget, lambda: _stream_into(question, user_answer, on_text), COMPLETION_TIMEOUT)
+    except (CircuitOpenError, DeadlineExceeded):
+        return fallback_response(question, user_answer)
+    except Exception as e:
+        logger.error(f"Ошибка при потоковом обращении к LLM: {e}")
+        return fallback_response(question, user_answer)
+
+    return await _finalize(question, user_answer, answer)
@@ -0,0 +1,151 @@
+"""
+Простые метрики процесса: счетчики, значения и гистограммы.
+
+Все метрики регистрируются в общем реестре и отдаются в текстовом формате
+Prometheus через render() или HTTP-сервер (start_metrics_server).
+"""
+import bisect
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+_lock = threading.Lock()
+_registry: Dict[str, "_Metric"] = {}
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+
+    def get(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def lines(self) -> List[str]:
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[Tuple[str, str], ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with _lock:
+            # [счетчики по корзинам..., сумма, количество]
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(labels))
+        return int(series[-1]) if series else 0
+
+    def sum(self, **labels) -> float:
+        series = self._series.get(_label_key(labels))
+        return series[-2] if series else 0.0
+
+    def lines(self) -> List[str]:
+        result = []
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                result.append(f"{self.name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}")
+            result.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {series[-1]}")
+            result.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+            result.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return result
+
+
+def _register(metric_class, name: str, description: str, **kwargs):
+    with _lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = metric_class(name, description, **kwargs)
+            _registry[name] = metric
+        return metric
+
+
+def counter(name: str, description: str) -> Counter:
+    return _register(Counter, name, description)
+
+
+def gauge(name: str, description: str) -> Gauge:
+    return _register(Gauge, name, description)
+
+
+def histogram(name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram, name, description, buckets=buckets)
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    output = []
+    for metric in list(_registry.values()):
+        output.append(f"# HELP {metric.name} {metric.description}")
+        output.append(f"# TYPE {metric.name} {metric.kind}")
+        output.extend(metric.lines())
+    return "\n".join(output) + "\n"
+
+
+async def start_metrics_server(port: int, host: str = "0.0.0.0"):
+    """Поднимает HTTP-эндпоинт /metrics на aiohttp (идет вместе с aiogram)"""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=render(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return runner
@@ -0,0 +1,344 @@
+"""
+Вынос CPU-тяжелой работы из цикла событий бота в пул процессов.
+
+Работа описывается задачами (Job): у задачи есть оценка стоимости и метод
+run(), который выполняется там, куда задачу направит Offloader:
+- inline - дешевые задачи выполняются сразу в цикле событий (передача в другой
+  процесс дороже самой работы);
+- light - пул процессов для обычных задач;
+- heavy - отдельный пул для самых дорогих задач, чтобы они не занимали
+  все процессы и не задерживали обычные.
+На каждую очередь ограничено число задач в работе и ожидающих; сверх этого
+submit() сразу отказывает (OffloadOverloaded). Задача, превысившая свой лимит
+времени, прерывается вместе с процессом пула, пул пересоздается.
+
+LoopLagMonitor измеряет задержку цикла событий: насколько позже запланированного
+просыпается короткий sleep. Сравнение задержки с выносом работы и без:
+    python offload.py bench --jobs 40 --size 1000
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import difflib
+import hashlib
+import logging
+import multiprocessing as mp
+import string
+import time
+from collections import Counter, deque
+from typing import Dict, Generic, List, Mapping, Optional, Sequence, Tuple, TypeVar
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+offload_jobs = metrics.counter("offload_jobs_total", "Задачи выноса по типу, очереди и результату")
+offload_duration = metrics.histogram("offload_job_seconds", "Время задачи от постановки до результата по очереди")
+offload_waiting = metrics.gauge("offload_jobs_waiting", "Задачи, ожидающие свободного места в очереди")
+offload_restarts = metrics.counter("offload_pool_restarts_total", "Пересоздания пула после превышения лимита времени")
+loop_lag = metrics.histogram("event_loop_lag_seconds", "Задержка цикла событий",
+                             buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+INLINE = "inline"
+LIGHT = "light"
+HEAVY = "heavy"
+# Границы стоимости (условные единицы ~ операции над символами) для выбора очереди
+INLINE_COST = 20_000
+HEAVY_COST = 2_000_000
+
+
+class OffloadError(Exception):
+    pass
+
+
+class OffloadOverloaded(OffloadError):
+    pass
+
+
+class OffloadTimeout(OffloadError):
+    pass
+
+
+class Job(Generic[T]):
+    """Задача выноса; должна сериализоваться pickle и не обращаться к состоянию бота"""
+    timeout: float = 5.0
+
+    def cost(self) -> int:
+        raise NotImplementedError
+
+    def run(self) -> T:
+        raise NotImplementedError
+
+
+def normalize_answer(text: str) -> str:
+    return " ".join(text.lower().replace("!", "").replace(",", "").split())
+
+
+class MatchResult:
+    __slots__ = ("matched", "similarity", "closest")
+
+    def __init__(self, matched: bool, similarity: float, closest: Optional[str]):
+        self.matched = matched
+        self.similarity = similarity
+        self.closest = closest
+
+    def __repr__(self) -> str:
+        return f"MatchResult(matched={self.matched}, similarity={self.similarity:.2f}, closest={self.closest!r})"
+
+
+class MatchAnswer(Job[MatchResult]):
+    """
+    Проверка ответа пользователя: exact - совпадение после нормализации,
+    contains - ответ содержит одно из ожидаемых слов. Похожесть на ближайший
+    ожидаемый ответ считается в обоих режимах (для подсказок и статистики).
+    """
+
+    def __init__(self, answer: str, expected: Sequence[str], mode: str = "exact"):
+        self.answer = answer
+        self.expected = tuple(expected)
+        self.mode = mode
+
+    def cost(self) -> int:
+        # SequenceMatcher в худшем случае квадратичен по длине строк
+        return sum(min(len(self.answer), self._compare_limit(option)) * max(1, len(option))
+                   for option in self.expected)
+
+    @staticmethod
+    def _compare_limit(option: str) -> int:
+        # Ответ намного длиннее ожидаемого похожим не бывает - дальше не сравниваем
+        return 4 * len(option) + 20
+
+    def check(self) -> bool:
+        """Только верно/неверно, без оценки похожести (дешево)"""
+        answer = normalize_answer(self.answer)
+        if self.mode == "contains":
+            return any(option in answer for option in self.expected)
+        return any(answer == option for option in self.expected)
+
+    def run(self) -> MatchResult:
+        answer = normalize_answer(self.answer)
+        matched = self.check()
+        best, closest = 0.0, None
+        for option in self.expected:
+            compared = answer[:self._compare_limit(option)]
+            ratio = difflib.SequenceMatcher(None, compared, option, autojunk=False).ratio()
+            if ratio > best:
+                best, closest = ratio, option
+        return MatchResult(matched, best, closest)
+
+
+class RenderTemplates(Job[List[str]]):
+    """Подстановка значений в шаблон $-переменных для пачки получателей"""
+
+    def __init__(self, template: str, values: Sequence[Mapping[str, object]]):
+        self.template = template
+        self.values = list(values)
+
+    def cost(self) -> int:
+        return len(self.template) * len(self.values)
+
+    def run(self) -> List[str]:
+        template = string.Template(self.template)
+        return [template.safe_substitute(value) for value in self.values]
+
+
+class FileDigest(Job[str]):
+    """Хэш содержимого файла (изображения) - подпись для кэшей"""
+    timeout = 30.0
+
+    def __init__(self, path: str, size_hint: int = 0):
+        self.path = path
+        self.size_hint = size_hint
+
+    def cost(self) -> int:
+        return self.size_hint
+
+    def run(self) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(self.path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+class AggregateEvents(Job[List[Tuple]]):
+    """Свертка событий (ключ, ...) в строки сводки (ключ..., количество)"""
+
+    def __init__(self, events: Sequence[Tuple]):
+        self.events = list(events)
+
+    def cost(self) -> int:
+        return len(self.events) * 10
+
+    def run(self) -> List[Tuple]:
+        return [key + (count,) for key, count in Counter(self.events).items()]
+
+
+def _execute(job: Job[T]) -> T:
+    return job.run()
+
+
+class _Lane:
+    def __init__(self, name: str, workers: int, max_pending: int):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self.slots = asyncio.Semaphore(workers)
+        self.pending = 0
+        self.executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+    def get_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(self.workers, mp_context=mp.get_context("spawn"))
+        return self.executor
+
+    def restart(self, executor: concurrent.futures.ProcessPoolExecutor):
+        """
+        Прерывает зависшие задачи: у ProcessPoolExecutor нет отмены работающей задачи.
+        Пул пересоздается, только если executor все еще текущий: задачи, упавшие вместе
+        со старым пулом, не должны останавливать уже созданный новый.
+        """
+        if self.executor is not executor:
+            return
+        self.executor = None
+        processes = list(getattr(executor, "_processes", {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+        offload_restarts.inc(lane=self.name)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+
+class Offloader:
+    def __init__(self, light_workers: int = 2, heavy_workers: int = 1, max_pending: int = 100,
+                 inline_cost: int = INLINE_COST, heavy_cost: int = HEAVY_COST):
+        self.inline_cost = inline_cost
+        self.heavy_cost = heavy_cost
+        self._lanes: Dict[str, _Lane] = {
+            LIGHT: _Lane(LIGHT, light_workers, max_pending),
+            HEAVY: _Lane(HEAVY, heavy_workers, max(1, max_pending // 10)),
+        }
+
+    def route(self, job: Job) -> str:
+        cost = job.cost()
+        if cost < self.inline_cost:
+            return INLINE
+        return HEAVY if cost >= self.heavy_cost else LIGHT
+
+    async def submit(self, job: Job[T], timeout: Optional[float] = None) -> T:
+        """Выполняет задачу в подходящей очереди и возвращает результат"""
+        lane_name = self.route(job)
+        job_type = type(job).__name__
+        started = time.monotonic()
+        if lane_name == INLINE:
+            result = job.run()
+            offload_jobs.inc(job=job_type, lane=INLINE, result="ok")
+            offload_duration.observe(time.monotonic() - started, lane=INLINE)
+            return result
+
+        lane = self._lanes[lane_name]
+        if lane.pending >= lane.max_pending:
+            offload_jobs.inc(job=job_type, lane=lane_name, result="rejected")
+            raise OffloadOverloaded(f"Offload lane {lane_name} is full ({lane.pending} jobs)")
+        lane.pending += 1
+        offload_waiting.inc(lane=lane_name)
+        waiting = True
+        try:
+            async with lane.slots:
+                offload_waiting.dec(lane=lane_name)
+                waiting = False
+                # Лимит времени считается от начала выполнения, а не от постановки в очередь
+                limit = timeout if timeout is not None else job.timeout
+                executor = lane.get_executor()
+                future = asyncio.get_running_loop().run_in_executor(executor, _execute, job)
+                try:
+                    result = await asyncio.wait_for(future, limit)
+                except asyncio.TimeoutError:
+                    lane.restart(executor)
+                    offload_jobs.inc(job=job_type, lane=lane_name, result="timeout")
+                    raise OffloadTimeout(f"{job_type} did not finish in {limit}s") from None
+                except concurrent.futures.process.BrokenProcessPool as e:
+                    # Пул пересоздали из-за чужой зависшей задачи или процесс упал
+                    lane.restart(executor)
+                    offload_jobs.inc(job=job_type, lane=lane_name, result="error")
+                    raise OffloadError(f"{job_type} failed: process pool was restarted") from e
+        finally:
+            if waiting:
+                offload_waiting.dec(lane=lane_name)
+            lane.pending -= 1
+        offload_jobs.inc(job=job_type, lane=lane_name, result="ok")
+        offload_duration.observe(time.monotonic() - started, lane=lane_name)
+        return result
+
+    def shutdown(self):
+        for lane in self._lanes.values():
+            lane.shutdown()
+
+
+class LoopLagMonitor:
+    """Задержка цикла событий: насколько позже заданного просыпается sleep(interval)"""
+
+    def __init__(self, interval: float = 0.1, window: int = 600):
+        self.interval = interval
+        self._recent: deque = deque(maxlen=window)
+
+    async def run(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - started - self.interval)
+            self._recent.append(lag)
+            loop_lag.observe(lag)
+
+    def snapshot(self) -> Dict[str, float]:
+        """p50, p99 и максимум задержки за последние window измерений"""
+        ordered = sorted(self._recent)
+        if not ordered:
+            return {"p50": 0.0, "p99": 0.0, "max": 0.0}
+        return {
+            "p50": ordered[len(ordered) // 2],
+            "p99": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+            "max": ordered[-1],
+        }
+
+
+async def _bench(jobs: int, size: int):
+    phrase = "әйе бик тәмле чәй булды рәхмәт " * (size // 30 + 1)
+    answer, expected = phrase[:size], phrase[::-1][:size]
+    work = [MatchAnswer(answer + str(index), (expected,)) for index in range(jobs)]
+
+    offloader = Offloader(light_workers=2, max_pending=jobs, inline_cost=10 ** 12, heavy_cost=10 ** 12)
+    for mode in ("inline", "offload"):
+        if mode == "offload":
+            offloader.inline_cost = 0
+            # Запуск процессов пула не входит в измерение
+            await offloader.submit(MatchAnswer("a", ("a",)))
+        monitor = LoopLagMonitor(interval=0.01, window=100_000)
+        monitor_task = asyncio.create_task(monitor.run())
+        await asyncio.sleep(0.1)
+        started = time.perf_counter()
+        await asyncio.gather(*(offloader.submit(job, timeout=120) for job in work))
+        elapsed = time.perf_counter() - started
+        # Даем монитору проснуться и записать задержку, накопленную за время работы
+        await asyncio.sleep(0.05)
+        monitor_task.cancel()
+        lag = monitor.snapshot()
+        print(f"{mode:8} jobs={jobs} size={size} total={elapsed:.2f}s  loop lag p50={lag['p50'] * 1000:.1f}ms "
+              f"p99={lag['p99'] * 1000:.1f}ms max={lag['max'] * 1000:.1f}ms")
+    offloader.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Вынос CPU-работы в пул процессов")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subparsers.add_parser("bench")
+    bench_parser.add_argument("--jobs", type=int, default=40)
+    bench_parser.add_argument("--size", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(_bench(args.jobs, args.size))
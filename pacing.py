@@ -0,0 +1,143 @@
+"""
+Темп показа сцен: паузы между сообщениями главы.
+
+Пауза шага зависит от:
+- настройки шага в описании части главы: "pacing": {"scene": 4, "button": {"min": 1, "max": 3}}
+  (число - фиксированная пауза, min/max - границы паузы по времени чтения);
+- времени чтения только что отправленного текста (символов в секунду);
+- скорости ответов пользователя: тем, кто отвечает быстро, паузы короче, кто медленно - длиннее;
+- быстрого режима (/fast), который сокращает все паузы.
+
+Без настроек в главе пауза - время чтения в пределах от MIN_DELAY до прежней
+фиксированной паузы шага (DEFAULT_PACING).
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Union
+
+import metrics
+
+pacing_delay = metrics.histogram("pacing_delay_seconds", "Паузы между сообщениями сцен по шагу и режиму",
+                                 buckets=(0.25, 0.5, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 8.0, 12.0))
+pacing_saved = metrics.counter("pacing_saved_seconds_total", "Сэкономленное время относительно прежних пауз")
+pacing_response = metrics.histogram("pacing_response_seconds", "Время ответа пользователя на вопрос или кнопку",
+                                    buckets=(1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0))
+pacing_fast_users = metrics.gauge("pacing_fast_mode_users", "Пользователи с включенным быстрым режимом")
+
+# Прежние фиксированные паузы шагов - верхняя граница паузы по умолчанию
+DEFAULT_PACING = {
+    "welcome": 5.0,
+    "scene": 5.0,
+    "button": 3.0,
+    "voice": 2.0,
+    "next": 3.0,
+    "answer": 1.0,
+}
+PACING_STEPS = tuple(DEFAULT_PACING)
+MIN_DELAY = 1.0
+# Ниже этой паузы сообщения сливаются (и упираются в ограничения Telegram)
+FLOOR_DELAY = 0.3
+CHARS_PER_SECOND = 15.0
+FAST_FACTOR = 0.3
+# Типичное время ответа: при нем коэффициент пауз равен 1
+TYPICAL_RESPONSE = 10.0
+FACTOR_RANGE = (0.6, 1.4)
+# Ответы позже этого срока - пользователь отходил, скорость чтения по ним не оцениваем
+MAX_RESPONSE = 300.0
+EMA_WEIGHT = 0.3
+
+StepSpec = Union[float, Dict[str, float], None]
+
+
+def reading_seconds(text: Optional[str]) -> float:
+    return len(text or "") / CHARS_PER_SECOND
+
+
+class PaceProfile:
+    __slots__ = ("response_ema", "samples", "prompted_at", "fast")
+
+    def __init__(self):
+        self.response_ema = TYPICAL_RESPONSE
+        self.samples = 0
+        self.prompted_at: Optional[float] = None
+        self.fast = False
+
+    @property
+    def factor(self) -> float:
+        # По одному ответу темп не меняем
+        if self.samples < 2:
+            return 1.0
+        low, high = FACTOR_RANGE
+        return min(high, max(low, self.response_ema / TYPICAL_RESPONSE))
+
+
+class Pacer:
+    def __init__(self, max_users: int = 100_000):
+        self.max_users = max_users
+        self._profiles: "OrderedDict[int, PaceProfile]" = OrderedDict()
+
+    def _profile(self, chat_id: int) -> PaceProfile:
+        profile = self._profiles.get(chat_id)
+        if profile is None:
+            profile = self._profiles[chat_id] = PaceProfile()
+            while len(self._profiles) > self.max_users:
+                _, evicted = self._profiles.popitem(last=False)
+                if evicted.fast:
+                    pacing_fast_users.dec()
+        else:
+            self._profiles.move_to_end(chat_id)
+        return profile
+
+    def is_fast(self, chat_id: int) -> bool:
+        profile = self._profiles.get(chat_id)
+        return profile is not None and profile.fast
+
+    def set_fast(self, chat_id: int, enabled: bool):
+        profile = self._profile(chat_id)
+        if profile.fast != enabled:
+            pacing_fast_users.inc(1 if enabled else -1)
+        profile.fast = enabled
+
+    def prompted(self, chat_id: int):
+        """Пользователю показан вопрос или кнопка - начинаем отсчет времени ответа"""
+        self._profile(chat_id).prompted_at = time.monotonic()
+
+    def responded(self, chat_id: int) -> Optional[float]:
+        """Пользователь ответил; время ответа уточняет его темп. Возвращает время ответа в секундах"""
+        profile = self._profiles.get(chat_id)
+        if profile is None or profile.prompted_at is None:
+            return None
+        elapsed = time.monotonic() - profile.prompted_at
+        profile.prompted_at = None
+        if elapsed > MAX_RESPONSE:
+            return elapsed
+        pacing_response.observe(elapsed)
+        profile.response_ema += EMA_WEIGHT * (elapsed - profile.response_ema)
+        profile.samples += 1
+        return elapsed
+
+    def delay(self, chat_id: int, step: str, text: Optional[str] = None, spec: StepSpec = None) -> float:
+        """Пауза шага step после отправки text"""
+        default = DEFAULT_PACING[step]
+        if isinstance(spec, (int, float)):
+            base = float(spec)
+        else:
+            spec = spec or {}
+            low, high = spec.get("min", min(MIN_DELAY, default)), spec.get("max", default)
+            base = min(high, max(low, reading_seconds(text)))
+        profile = self._profiles.get(chat_id)
+        factor = profile.factor if profile else 1.0
+        fast = profile is not None and profile.fast
+        if fast:
+            factor *= FAST_FACTOR
+        result = max(FLOOR_DELAY, base * factor)
+        pacing_delay.observe(result, step=step, mode="fast" if fast else "normal")
+        if result < default:
+            pacing_saved.inc(default - result, step=step)
+        return result
+
+    async def pause(self, chat_id: int, step: str, text: Optional[str] = None, part: Optional[dict] = None):
+        """Пауза шага с учетом настроек части главы part"""
+        spec = (part or {}).get("pacing", {}).get(step)
+        await asyncio.sleep(self.delay(chat_id, step, text, spec))
@@ -0,0 +1,104 @@
+"""
+Обслуживание партиций истории решенных задач (user_solved_tasks).
+
+История разбита по месяцам (solved_at). Фоновое обслуживание заранее создает
+партиции на ближайшие месяцы, а партиции старше срока хранения выгружает в
+сжатые CSV-файлы (archive/user_solved_tasks_YYYYMM.csv.gz) и удаляет из базы.
+Уникальность пары (пользователь, задача) хранится отдельно в solved_task_keys
+и после архивации не теряется.
+
+Ручной запуск:
+    python partitions.py list
+    python partitions.py maintain --retention-months 12
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+from datetime import date
+from typing import List, Optional
+
+import metrics
+from main import DatabaseManager, add_months, month_start, open_database
+
+logger = logging.getLogger(__name__)
+
+partitions_created = metrics.counter("solved_partitions_created_total", "Созданные партиции истории решений")
+partitions_archived = metrics.counter("solved_partitions_archived_total", "Выгруженные в архив партиции")
+
+# На сколько месяцев вперед держать готовые партиции
+MONTHS_AHEAD = 2
+
+
+def archive_partition(db: DatabaseManager, name: str, archive_dir: str) -> Optional[str]:
+    """Выгружает партицию в gzip-файл и удаляет ее; возвращает путь к архиву (None - ее уже выгрузил другой процесс)"""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with db.solved_partitions_lock():
+        if name not in {partition for partition, _ in db.list_solved_partitions()}:
+            return None
+        with open(tmp_path, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as out:
+                db.copy_solved_partition(name, out)
+            raw.flush()
+            os.fsync(raw.fileno())
+        # Файл на месте до удаления партиции: при сбое данные остаются хотя бы в базе
+        os.replace(tmp_path, path)
+        db.drop_solved_partition(name)
+    partitions_archived.inc()
+    logger.info(f"Партиция {name} выгружена в {path}")
+    return path
+
+
+def maintain(db: DatabaseManager, retention_months: int = 0, archive_dir: str = "archive",
+             months_ahead: int = MONTHS_AHEAD) -> List[str]:
+    """
+    Создает недостающие партиции; если retention_months > 0, архивирует партиции
+    месяцев старше retention_months от текущего. Возвращает пути новых архивов.
+    """
+    created = db.ensure_solved_partitions(months_ahead)
+    if created:
+        partitions_created.inc(len(created))
+        logger.info(f"Созданы партиции: {', '.join(created)}")
+    if retention_months <= 0:
+        return []
+    border = add_months(month_start(date.today()), -retention_months)
+    archived = [archive_partition(db, name, archive_dir)
+                for name, month in db.list_solved_partitions() if month < border]
+    return [path for path in archived if path]
+
+
+async def run(db: DatabaseManager, retention_months: int, archive_dir: str, interval: float = 6 * 3600):
+    """Фоновое обслуживание партиций раз в interval секунд"""
+    while True:
+        try:
+            await asyncio.to_thread(maintain, db, retention_months, archive_dir)
+        except Exception as e:
+            logger.error(f"Ошибка обслуживания партиций: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    from config import DATABASE_URL, SOLVED_TASKS_ARCHIVE_DIR, SOLVED_TASKS_RETENTION_MONTHS
+
+    parser = argparse.ArgumentParser(description="Партиции истории решенных задач")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list")
+    maintain_parser = subparsers.add_parser("maintain")
+    maintain_parser.add_argument("--retention-months", type=int, default=SOLVED_TASKS_RETENTION_MONTHS)
+    maintain_parser.add_argument("--archive-dir", default=SOLVED_TASKS_ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    db = open_database(DATABASE_URL)
+    try:
+        if args.command == "list":
+            for name, month in db.list_solved_partitions():
+                print(f"{month:%Y-%m}  {name}")
+        else:
+            for path in maintain(db, args.retention_months, args.archive_dir):
+                print(path)
+    finally:
+        db.close()
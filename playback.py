@@ -0,0 +1,81 @@
+"""
+Реестр воспроизведения глав.
+
+Показ главы (сообщения с паузами между ними) идет отдельной задачей. На каждый
+чат - не больше одной такой задачи: новый запуск (начать заново, /start)
+отменяет предыдущий, чтобы старые корутины не продолжали слать сообщения.
+Количество одновременно воспроизводимых глав в процессе ограничено.
+"""
+import asyncio
+import logging
+from typing import Coroutine, Dict, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+playbacks_active = metrics.gauge("playback_tasks_active", "Воспроизводимые сейчас главы")
+playbacks_waiting = metrics.gauge("playback_tasks_waiting", "Главы, ожидающие свободного слота")
+playbacks_cancelled = metrics.counter("playback_tasks_cancelled_total", "Отмененные воспроизведения")
+
+
+class PlaybackRegistry:
+    def __init__(self, limit: int = 500):
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._slots = asyncio.Semaphore(limit)
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def get(self, chat_id: int) -> Optional[asyncio.Task]:
+        return self._tasks.get(chat_id)
+
+    def start(self, chat_id: int, coro: Coroutine) -> asyncio.Task:
+        """Запускает воспроизведение для чата, отменяя предыдущее"""
+        self.cancel(chat_id)
+        task = asyncio.create_task(self._run(coro))
+        self._tasks[chat_id] = task
+        task.add_done_callback(lambda t: self._done(chat_id, t, coro))
+        return task
+
+    def cancel(self, chat_id: int) -> bool:
+        """Отменяет воспроизведение чата (кроме задачи, из которой вызвана отмена)"""
+        task = self._tasks.get(chat_id)
+        if task is None or task is asyncio.current_task() or task.done():
+            return False
+        task.cancel()
+        del self._tasks[chat_id]
+        playbacks_cancelled.inc()
+        return True
+
+    async def _run(self, coro: Coroutine):
+        playbacks_waiting.inc()
+        try:
+            await self._slots.acquire()
+        except asyncio.CancelledError:
+            coro.close()
+            raise
+        finally:
+            playbacks_waiting.dec()
+        playbacks_active.inc()
+        try:
+            return await coro
+        finally:
+            playbacks_active.dec()
+            self._slots.release()
+
+    def _done(self, chat_id: int, task: asyncio.Task, coro: Coroutine):
+        if self._tasks.get(chat_id) is task:
+            del self._tasks[chat_id]
+        if task.cancelled():
+            # Задачу могли отменить до первого шага - тогда корутина главы так и не запускалась
+            coro.close()
+        elif task.exception() is not None:
+            logger.error(f"Ошибка при воспроизведении главы в чате {chat_id}: {task.exception()}")
+
+    async def shutdown(self):
+        """Отменяет все воспроизведения (при остановке бота)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
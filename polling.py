@@ -0,0 +1,124 @@
+"""
+Устойчивый запуск long polling.
+
+Если Telegram недоступен, start_polling падает (например, на getMe при старте)
+и бот останавливается. run_polling перезапускает polling с экспоненциальной
+паузой и разбросом, используя тот же Dispatcher и ту же сессию бота: состояния
+FSM, воспроизводимые главы и рассылки продолжают работать, повторного холодного
+старта (метрики, фоновые задачи) нет.
+
+ConnectionMonitor считает разрывы связи с Telegram и время простоя - в том числе
+те, которые aiogram переживает сам внутри цикла getUpdates.
+"""
+import asyncio
+import logging
+import signal
+import time
+from contextlib import suppress
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import GetUpdates
+from aiogram.utils.backoff import BackoffConfig
+
+import metrics
+from resilience import Backoff
+
+logger = logging.getLogger(__name__)
+
+polling_up = metrics.gauge("polling_up", "1 - связь с Telegram есть, 0 - нет")
+polling_disconnects = metrics.counter("polling_disconnects_total", "Потери связи с Telegram")
+polling_reconnects = metrics.counter("polling_reconnects_total", "Восстановления связи с Telegram")
+polling_restarts = metrics.counter("polling_restarts_total", "Перезапуски polling после падения")
+polling_downtime = metrics.histogram("polling_downtime_seconds", "Длительность простоя без связи с Telegram",
+                                     buckets=(1, 2, 5, 10, 30, 60, 120, 300, 600))
+
+# Если polling проработал дольше, паузы перед перезапуском снова начинаются с минимальной
+STABLE_SECONDS = 60
+
+
+class ConnectionMonitor(BaseRequestMiddleware):
+    """Middleware сессии бота: по результатам getUpdates отмечает потерю и восстановление связи"""
+
+    def __init__(self):
+        self.down_since: Optional[float] = None
+
+    def mark_down(self, reason: str):
+        if self.down_since is None:
+            self.down_since = time.monotonic()
+            polling_up.set(0)
+            polling_disconnects.inc()
+            logger.warning(f"Потеряна связь с Telegram: {reason}")
+
+    def mark_up(self):
+        polling_up.set(1)
+        if self.down_since is None:
+            return
+        downtime = time.monotonic() - self.down_since
+        self.down_since = None
+        polling_reconnects.inc()
+        polling_downtime.observe(downtime)
+        logger.info(f"Связь с Telegram восстановлена, простой {downtime:.1f} с")
+
+    async def __call__(self, make_request, bot, method):
+        if not isinstance(method, GetUpdates):
+            return await make_request(bot, method)
+        try:
+            response = await make_request(bot, method)
+        except Exception as e:
+            self.mark_down(f"{type(e).__name__}: {e}")
+            raise
+        self.mark_up()
+        return response
+
+
+async def run_polling(dp: Dispatcher, bot: Bot, base_delay: float = 1.0, max_delay: float = 60.0, **kwargs):
+    """Запускает polling и перезапускает его после падений, пока не придет SIGINT/SIGTERM"""
+    monitor = ConnectionMonitor()
+    bot.session.middleware(monitor)
+    backoff = Backoff(base=base_delay, max_delay=max_delay)
+    stopping = asyncio.Event()
+
+    async def stop_polling():
+        with suppress(RuntimeError):  # polling сейчас не запущен (идет пауза перед перезапуском)
+            await dp.stop_polling()
+
+    def on_signal():
+        stopping.set()
+        asyncio.create_task(stop_polling())
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, on_signal)
+
+    try:
+        while not stopping.is_set():
+            started = time.monotonic()
+            try:
+                await dp.start_polling(
+                    bot,
+                    handle_signals=False,
+                    close_bot_session=False,
+                    # Повторы getUpdates внутри aiogram - с теми же паузами
+                    backoff_config=BackoffConfig(min_delay=base_delay, max_delay=max_delay,
+                                                 factor=backoff.factor, jitter=backoff.jitter),
+                    **kwargs
+                )
+                return
+            except Exception as e:
+                monitor.mark_down(f"{type(e).__name__}: {e}")
+                if time.monotonic() - started > STABLE_SECONDS:
+                    backoff.reset()
+                delay = backoff.next_delay()
+                polling_restarts.inc()
+                logger.error(f"Polling остановился с ошибкой {type(e).__name__}: {e}; "
+                             f"перезапуск через {delay:.1f} с")
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(stopping.wait(), delay)
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with suppress(NotImplementedError):
+                loop.remove_signal_handler(sig)
+        await bot.session.close()
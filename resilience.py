@@ -0,0 +1,214 @@
+"""
+Защита от медленных и недоступных внешних сервисов (GigaChat, translate.tatar).
+
+- deadline(): бюджет времени на одно взаимодействие с пользователем; все внешние
+  вызовы внутри берут таймаут из оставшегося бюджета.
+- CircuitBreaker: размыкается при большой доле ошибок или медленных ответов и
+  сразу отказывает, пока сервис не восстановится.
+- hedged(): повторный запрос, если первый не ответил за заданное время.
+- Backoff: экспоненциально растущие паузы со случайным разбросом между повторами.
+"""
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class BudgetExhausted(DeadlineExceeded):
+    """Кончился бюджет вызывающего, а не таймаут самого сервиса: предохранитель это не считает сбоем"""
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Ограничивает время всех внешних вызовов внутри блока (вложенный бюджет не может быть больше внешнего)"""
+    expires_at = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        expires_at = min(expires_at, current)
+    token = _deadline.set(expires_at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Сколько секунд осталось от бюджета (None - бюджет не задан)"""
+    expires_at = _deadline.get()
+    if expires_at is None:
+        return None
+    return expires_at - time.monotonic()
+
+
+def timeout_for(limit: float) -> float:
+    """Таймаут для очередного вызова: не больше limit и не больше остатка бюджета"""
+    left = remaining()
+    if left is None:
+        return limit
+    if left <= 0:
+        raise BudgetExhausted("Interaction time budget is exhausted")
+    return min(limit, left)
+
+
+breaker_state = metrics.gauge("circuit_breaker_state", "Состояние предохранителя: 0 - closed, 1 - half_open, 2 - open")
+breaker_calls = metrics.counter("circuit_breaker_calls_total", "Вызовы через предохранитель по результату")
+breaker_opened = metrics.counter("circuit_breaker_opened_total", "Сколько раз предохранитель размыкался")
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_ratio: float = 0.5, slow_call_seconds: float = 5.0,
+                 slow_call_ratio: float = 0.8, window: int = 20, min_calls: int = 5,
+                 open_seconds: float = 30.0):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_ratio = slow_call_ratio
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        # Последние вызовы: (успех, медленный)
+        self._calls = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.state = self.CLOSED
+        breaker_state.set(0, name=name)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"Предохранитель {self.name}: {self.state} -> {state}")
+        self.state = state
+        breaker_state.set(self._STATE_VALUES[state], name=self.name)
+
+    def allow(self) -> bool:
+        """Можно ли сейчас делать вызов"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            # В полуоткрытом состоянии пропускаем один пробный вызов
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record(self, success: bool, duration: float):
+        slow = duration >= self.slow_call_seconds
+        breaker_calls.inc(name=self.name, result="success" if success else "failure")
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+            if success and not slow:
+                self._calls.clear()
+                self._set_state(self.CLOSED)
+            else:
+                self._trip()
+            return
+
+        self._calls.append((success, slow))
+        if len(self._calls) < self.min_calls:
+            return
+        failures = sum(1 for ok, _ in self._calls if not ok)
+        slow_calls = sum(1 for _, is_slow in self._calls if is_slow)
+        if failures / len(self._calls) >= self.failure_ratio or slow_calls / len(self._calls) >= self.slow_call_ratio:
+            self._trip()
+
+    def _trip(self):
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+        breaker_opened.inc(name=self.name)
+        self._set_state(self.OPEN)
+
+    async def call(self, func: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+        """Выполняет асинхронный вызов через предохранитель"""
+        if not self.allow():
+            breaker_calls.inc(name=self.name, result="rejected")
+            raise CircuitOpenError(f"Circuit {self.name} is open")
+        started = time.monotonic()
+        try:
+            result = await func(*args, **kwargs)
+        except (asyncio.CancelledError, BudgetExhausted):
+            # Сервис не виноват: вызов отменили или у вызывающего кончилось время
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+            raise
+        except Exception:
+            self.record(False, time.monotonic() - started)
+            raise
+        self.record(True, time.monotonic() - started)
+        return result
+
+
+async def hedged(factory: Callable[[], Awaitable[T]], delay: float, attempts: int = 2) -> T:
+    """
+    Запускает factory(); если ответа нет через delay секунд, запускает еще одну попытку.
+    Возвращает первый успешный результат, остальные попытки отменяются.
+    """
+    tasks = [asyncio.ensure_future(factory())]
+    started = 1
+    last_error: Optional[BaseException] = None
+    try:
+        while tasks:
+            timeout = delay if started < attempts else None
+            done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                tasks.append(asyncio.ensure_future(factory()))
+                started += 1
+                continue
+            for task in done:
+                tasks.remove(task)
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+            # Все запущенные попытки упали, а запас еще есть - пробуем сразу
+            if not tasks and started < attempts:
+                tasks.append(asyncio.ensure_future(factory()))
+                started += 1
+        raise last_error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class Backoff:
+    """
+    Паузы между повторами: base * factor^n, не больше max_delay, со случайным
+    разбросом +-jitter, чтобы много клиентов не переподключались одновременно.
+    """
+
+    def __init__(self, base: float = 1.0, max_delay: float = 60.0, factor: float = 2.0, jitter: float = 0.2):
+        self.base = base
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.attempt = 0
+
+    def next_delay(self) -> float:
+        delay = min(self.max_delay, self.base * self.factor ** self.attempt)
+        self.attempt += 1
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def reset(self):
+        self.attempt = 0
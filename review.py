@@ -0,0 +1,271 @@
+"""
+Интервальное повторение пройденного материала (алгоритм SM-2).
+
+Правильно отвеченные части глав с подсказкой "review" ставятся на повторение
+через день (ReviewService.schedule); решенные задачи из user_solved_tasks
+добавляются раз в час. Расписание хранится в таблице review_items.
+
+В памяти держится только куча (heap) повторений, срок которых наступает
+в ближайшее окно LOOKAHEAD: она подгружается из Postgres постранично
+(keyset по (due_at, user_id, task_id)), поэтому выбор "кому пора повторять"
+не требует просмотра всех пар (пользователь, задача). Подошедшие повторения
+отправляются пачками.
+
+Бенчмарк планировщика без базы:
+    python review.py bench --items 1000000
+"""
+import argparse
+import asyncio
+import heapq
+import html
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LOOKAHEAD = timedelta(hours=1)
+PAGE_SIZE = 1000
+BATCH_SIZE = 25
+# Если пользователь не ответил на повторение, оно вернется через этот срок
+UNANSWERED_RETRY = timedelta(days=1)
+# Временная ошибка отправки: повторение снова попадет в кучу через SEND_RETRY, 2 * SEND_RETRY, ...
+# не больше SEND_ATTEMPTS раз, затем откладывается как неотвеченное
+SEND_RETRY = timedelta(minutes=5)
+SEND_ATTEMPTS = 4
+# Первое повторение части главы - через день после правильного ответа
+FIRST_REVIEW = timedelta(days=1)
+
+# Оценки, которые пользователь ставит себе кнопками
+QUALITY_FORGOT = 1
+QUALITY_HARD = 3
+QUALITY_EASY = 5
+QUALITIES = (QUALITY_FORGOT, QUALITY_HARD, QUALITY_EASY)
+
+reviews_sent = metrics.counter("reviews_sent_total", "Отправленные повторения")
+reviews_graded = metrics.counter("reviews_graded_total", "Оценки повторений")
+reviews_heap_size = metrics.gauge("reviews_heap_size", "Повторения в памяти планировщика")
+
+
+def sm2(quality: int, easiness: float, interval_days: int, repetitions: int) -> Tuple[float, int, int]:
+    """Один шаг SM-2: новые (легкость, интервал в днях, число повторений подряд)"""
+    if quality < 3:
+        repetitions = 0
+        interval_days = 1
+    else:
+        if repetitions == 0:
+            interval_days = 1
+        elif repetitions == 1:
+            interval_days = 6
+        else:
+            interval_days = round(interval_days * easiness)
+        repetitions += 1
+    easiness = max(1.3, easiness + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return easiness, interval_days, repetitions
+
+
+class ReviewScheduler:
+    """
+    Куча ближайших повторений.
+    Элемент кучи: (due_at, user_id, task_id, telegram_id, task_name).
+    """
+
+    def __init__(self, db=None, lookahead: timedelta = LOOKAHEAD, page_size: int = PAGE_SIZE):
+        self.db = db
+        self.lookahead = lookahead
+        self.page_size = page_size
+        self._heap: List[Tuple] = []
+        self._keys: Set[Tuple[int, int]] = set()
+        # Ключ последней загруженной строки и граница окна, до которой все загружено
+        self._watermark: Optional[Tuple] = None
+        self._horizon: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, due_at: datetime, user_id: int, task_id: int, telegram_id: int, task_name: str):
+        key = (user_id, task_id)
+        if key in self._keys:
+            return
+        self._keys.add(key)
+        heapq.heappush(self._heap, (due_at, user_id, task_id, telegram_id, task_name))
+
+    def pop_due(self, now: datetime, limit: int) -> List[Tuple]:
+        """Повторения, срок которых уже наступил (не больше limit)"""
+        due = []
+        while self._heap and len(due) < limit and self._heap[0][0] <= now:
+            item = heapq.heappop(self._heap)
+            self._keys.discard((item[1], item[2]))
+            due.append(item)
+        reviews_heap_size.set(len(self._heap))
+        return due
+
+    def reset(self):
+        """Начать подгрузку заново (например, после добавления новых повторений)"""
+        self._watermark = None
+        self._horizon = None
+
+    def refill(self, now: datetime) -> int:
+        """Догружает из базы повторения со сроком до now + lookahead, начиная с последней загруженной строки"""
+        horizon = now + self.lookahead
+        loaded = 0
+        while True:
+            rows = self.db.get_due_reviews(horizon, after=self._watermark, limit=self.page_size)
+            for due_at, user_id, task_id, telegram_id, task_name, *_ in rows:
+                self.push(due_at, user_id, task_id, telegram_id, task_name)
+            loaded += len(rows)
+            if rows:
+                last = rows[-1]
+                self._watermark = (last[0], last[1], last[2])
+            if len(rows) < self.page_size:
+                break
+        self._horizon = horizon
+        reviews_heap_size.set(len(self._heap))
+        return loaded
+
+
+def review_keyboard(task_id: int):
+    from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="😕 Забыл", callback_data=f"review_{task_id}_{QUALITY_FORGOT}"),
+        InlineKeyboardButton(text="🤔 С трудом", callback_data=f"review_{task_id}_{QUALITY_HARD}"),
+        InlineKeyboardButton(text="😊 Помню", callback_data=f"review_{task_id}_{QUALITY_EASY}"),
+    ]])
+
+
+class ReviewService:
+    """Связывает расписание в базе, кучу планировщика и отправку сообщений ботом"""
+
+    def __init__(self, db, bot, interval: float = 60.0, batch_size: int = BATCH_SIZE):
+        self.db = db
+        self.bot = bot
+        self.interval = interval
+        self.batch_size = batch_size
+        self.scheduler = ReviewScheduler(db)
+        # Число неудачных отправок подряд по (user_id, task_id)
+        self._send_failures: Dict[Tuple[int, int], int] = {}
+
+    async def schedule(self, user_id: int, task_name: str) -> bool:
+        """Ставит на повторение правильно отвеченную часть главы (очки и решенные задачи не меняются)"""
+        return await asyncio.to_thread(self.db.schedule_part_review, user_id, task_name,
+                                       datetime.now() + FIRST_REVIEW)
+
+    async def send_due(self) -> int:
+        now = datetime.now()
+        due = self.scheduler.pop_due(now, self.batch_size)
+        postponed = []
+        sent = 0
+        for due_at, user_id, task_id, telegram_id, task_name in due:
+            key = (user_id, task_id)
+            try:
+                await self.bot.send_message(
+                    telegram_id,
+                    f"🔁 Время повторить!\n\n<b>{html.escape(task_name)}</b>\n\nПомните, как это будет по-татарски?",
+                    reply_markup=review_keyboard(task_id)
+                )
+                self._send_failures.pop(key, None)
+                postponed.append(key)
+                sent += 1
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Пользователь заблокировал бота или чат недоступен - повторять сейчас бессмысленно
+                logger.info(f"Повторение пользователю {telegram_id} не доставлено: {e}")
+                self._send_failures.pop(key, None)
+                postponed.append(key)
+            except Exception as e:
+                failures = self._send_failures.get(key, 0) + 1
+                logger.error(f"Не удалось отправить повторение пользователю {telegram_id} "
+                             f"(попытка {failures}): {e}")
+                if failures >= SEND_ATTEMPTS:
+                    self._send_failures.pop(key, None)
+                    postponed.append(key)
+                else:
+                    # pop_due уже убрал его из кучи: возвращаем с растущей задержкой
+                    self._send_failures[key] = failures
+                    self.scheduler.push(now + SEND_RETRY * 2 ** (failures - 1), user_id, task_id, telegram_id,
+                                        task_name)
+        await asyncio.to_thread(self.db.postpone_reviews, postponed, now + UNANSWERED_RETRY)
+        reviews_sent.inc(sent)
+        return len(due)
+
+    async def grade(self, user_id: int, task_id: int, quality: int) -> Optional[datetime]:
+        """Применяет оценку пользователя и возвращает время следующего повторения"""
+        item = await asyncio.to_thread(self.db.get_review_item, user_id, task_id)
+        if item is None:
+            return None
+        easiness, interval_days, repetitions, _ = item
+        easiness, interval_days, repetitions = sm2(quality, easiness, interval_days, repetitions)
+        due_at = datetime.now() + timedelta(days=interval_days)
+        await asyncio.to_thread(self.db.update_review_item, user_id, task_id, easiness, interval_days,
+                                repetitions, due_at)
+        reviews_graded.inc(quality=str(quality))
+        return due_at
+
+    async def run(self):
+        """Фоновый цикл: подгрузка из базы и отправка подошедших повторений пачками"""
+        seeded_at = 0.0
+        while True:
+            try:
+                # Раз в час добавляем в расписание новые решенные задачи и перечитываем окно
+                if time.monotonic() - seeded_at > 3600:
+                    added = await asyncio.to_thread(self.db.seed_review_items)
+                    if added:
+                        self.scheduler.reset()
+                    seeded_at = time.monotonic()
+                await asyncio.to_thread(self.scheduler.refill, datetime.now())
+                while await self.send_due() == self.batch_size:
+                    # Пауза между пачками, чтобы не упереться в ограничения Telegram
+                    await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка планировщика повторений: {e}")
+            await asyncio.sleep(self.interval)
+
+
+def benchmark(items: int, users: int):
+    """Пропускная способность кучи: загрузка, выборка подошедших и перепланирование"""
+    scheduler = ReviewScheduler()
+    now = datetime.now()
+    rows = [(now + timedelta(seconds=random.randint(-3600, 3600)), i % users, i // users, i % users, "фраза")
+            for i in range(items)]
+
+    started = time.perf_counter()
+    for row in rows:
+        scheduler.push(*row)
+    push_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    popped = 0
+    while True:
+        batch = scheduler.pop_due(now, 1000)
+        if not batch:
+            break
+        popped += len(batch)
+    pop_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    state = (2.5, 0, 0)
+    for _ in range(items):
+        state = sm2(random.choice(QUALITIES), *state)
+    sm2_time = time.perf_counter() - started
+
+    print(f"items={items} users={users}")
+    print(f"push:    {items / push_time:,.0f} items/s")
+    print(f"pop_due: {popped / pop_time:,.0f} items/s ({popped} due now)")
+    print(f"sm2:     {items / sm2_time:,.0f} grades/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Планировщик интервального повторения")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subparsers.add_parser("bench")
+    bench_parser.add_argument("--items", type=int, default=1_000_000)
+    bench_parser.add_argument("--users", type=int, default=100_000)
+    args = parser.parse_args()
+    benchmark(args.items, args.users)
@@ -1,24 +1,27 @@
-from main import DatabaseManager
-from config import DATABASE_URL
+from data_access import get_data_access
 import asyncio
 
-db = DatabaseManager(DATABASE_URL)
+# Один на процесс сервис доступа к данным (общий с bot.py)
+data_service = get_data_access()
+db = data_service.db
 
 async def create_user_async(telegram_id: int, user_name: str, echpoch_score: int = 0):
-    return await db.create_user_async(telegram_id, user_name, echpoch_score)
+    return await data_service.create_user(telegram_id, user_name, echpoch_score)
 
 async def get_user_by_telegram_id_async(telegram_id: int):
-    return await db.get_user_by_telegram_id_async(telegram_id)
+    return await data_service.get_user_by_telegram_id(telegram_id)
 
 async def get_user_stats_async(telegram_id: int):
-    return await db.get_user_stats_async(telegram_id)
+    return await data_service.get_user_stats(telegram_id)
 
 async def increment_user_score_async(user_id: int, increment: int):
-    return await db.increment_user_score_async(user_id, increment)
+    return await data_service.increment_user_score(user_id, increment)
 
 # Синхронные методы для использования вне асинхронного контекста
 def create_user(telegram_id: int, user_name: str, echpoch_score: int = 0):
-    return db.create_user(telegram_id, user_name, echpoch_score)
+    user_id = db.create_user(telegram_id, user_name, echpoch_score)
+    data_service.invalidate_user(telegram_id)
+    return user_id
 
 def get_user_by_telegram_id(telegram_id: int):
     return db.get_user_by_telegram_id(telegram_id)
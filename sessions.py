@@ -0,0 +1,217 @@
+"""
+Хранилище состояний FSM с ограничением памяти.
+
+Состояние пользователя (текущая глава, шаг, показанные картинки...) хранится
+в памяти компактно: запись с __slots__ и данные, упакованные в JSON-байты,
+вместо словаря со списками. Сессии, к которым не обращались дольше TTL, и
+самые давние сессии при превышении бюджета памяти сохраняются в таблицу
+fsm_sessions и выгружаются из памяти. Когда пользователь возвращается, его
+сессия загружается из базы при первом обращении.
+"""
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+import metrics
+from coalescing import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+sessions_resident = metrics.gauge("fsm_sessions_resident", "Сессии FSM в памяти процесса")
+sessions_resident_bytes = metrics.gauge("fsm_sessions_resident_bytes", "Оценка памяти, занятой сессиями FSM")
+sessions_evicted = metrics.counter("fsm_sessions_evicted_total", "Выгруженные из памяти сессии по причине")
+sessions_loaded = metrics.counter("fsm_sessions_loaded_total", "Загрузки сессий из базы по результату")
+
+EMPTY_DATA = b"{}"
+# При вытеснении по бюджету освобождаем память с запасом, чтобы не вытеснять на каждой записи
+BUDGET_LOW_WATERMARK = 0.9
+
+
+class SessionRecord:
+    __slots__ = ("state", "packed", "touched", "dirty")
+
+    def __init__(self, state: Optional[str], packed: bytes, touched: float, dirty: bool = False):
+        self.state = state
+        self.packed = packed
+        self.touched = touched
+        self.dirty = dirty
+
+    def is_empty(self) -> bool:
+        return self.state is None and self.packed == EMPTY_DATA
+
+
+# Примерная стоимость записи без данных: сам объект, ключ и место в словаре
+RECORD_OVERHEAD = sys.getsizeof(SessionRecord(None, b"", 0.0)) + sys.getsizeof(StorageKey(0, 0, 0)) + 100
+
+
+def pack(data: Mapping[str, Any]) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def unpack(packed: bytes) -> Dict[str, Any]:
+    return json.loads(packed)
+
+
+class SessionStorage(BaseStorage):
+    def __init__(self, db, ttl: float = 1800.0, memory_budget: int = 64 * 1024 * 1024,
+                 sweep_interval: float = 60.0):
+        self.db = db
+        self.ttl = ttl
+        self.memory_budget = memory_budget
+        self.sweep_interval = sweep_interval
+        self._records: "OrderedDict[StorageKey, SessionRecord]" = OrderedDict()
+        self._bytes = 0
+        self._loading = SingleFlight("fsm_sessions")
+        self._evicting: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    @property
+    def resident_bytes(self) -> int:
+        return self._bytes
+
+    @staticmethod
+    def session_key(key: StorageKey) -> str:
+        return (f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:"
+                f"{key.business_connection_id or ''}:{key.destiny}")
+
+    @staticmethod
+    def _size(record: SessionRecord) -> int:
+        return RECORD_OVERHEAD + sys.getsizeof(record.packed)
+
+    def _report(self):
+        sessions_resident.set(len(self._records))
+        sessions_resident_bytes.set(self._bytes)
+
+    async def _load(self, key: StorageKey) -> SessionRecord:
+        row = await asyncio.to_thread(self.db.load_session, self.session_key(key))
+        record = self._records.get(key)
+        if record is not None:
+            return record
+        if row:
+            record = SessionRecord(sys.intern(row[0]) if row[0] else None, row[1].encode("utf-8"), time.monotonic())
+        else:
+            record = SessionRecord(None, EMPTY_DATA, time.monotonic())
+        sessions_loaded.inc(result="hit" if row else "miss")
+        self._records[key] = record
+        self._bytes += self._size(record)
+        self._report()
+        return record
+
+    async def _record(self, key: StorageKey) -> SessionRecord:
+        record = self._records.get(key)
+        if record is None:
+            record = await self._loading.do(key, lambda: self._load(key))
+        record.touched = time.monotonic()
+        if self._records.get(key) is record:
+            self._records.move_to_end(key)
+        else:
+            # Запись успели вытеснить, пока ее загружали - возвращаем в память
+            self._records[key] = record
+            self._bytes += self._size(record)
+            self._report()
+        return record
+
+    def _check_budget(self):
+        if self._bytes > self.memory_budget and (self._evicting is None or self._evicting.done()):
+            self._evicting = asyncio.create_task(self.evict())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        value = state.state if isinstance(state, State) else state
+        record.state = sys.intern(value) if value else None
+        record.dirty = True
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        record = await self._record(key)
+        size_before = self._size(record)
+        record.packed = pack(data)
+        record.dirty = True
+        if self._records.get(key) is record:
+            self._bytes += self._size(record) - size_before
+            self._report()
+        self._check_budget()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return unpack((await self._record(key)).packed)
+
+    async def _persist(self, items: List[Tuple[StorageKey, SessionRecord]]) -> List[Tuple]:
+        """Сохраняет измененные записи; возвращает снимки (ключ, запись, состояние, данные, время)"""
+        snapshots = [(key, record, record.state, record.packed, record.touched) for key, record in items]
+        dirty = [snapshot for snapshot in snapshots if snapshot[1].dirty]
+        rows = [(self.session_key(key), state, packed.decode("utf-8"))
+                for key, record, state, packed, _ in dirty if not record.is_empty()]
+        empty = [self.session_key(key) for key, record, *_ in dirty if record.is_empty()]
+        await asyncio.to_thread(self.db.save_sessions, rows)
+        await asyncio.to_thread(self.db.delete_sessions, empty)
+        for key, record, state, packed, _ in dirty:
+            # Пока шла запись, сессию могли изменить - тогда она остается измененной
+            if record.state is state and record.packed is packed:
+                record.dirty = False
+        return snapshots
+
+    async def evict(self) -> int:
+        """Выгружает сессии, простаивающие дольше TTL, и самые давние сверх бюджета памяти"""
+        idle_border = time.monotonic() - self.ttl
+        target_bytes = self.memory_budget * BUDGET_LOW_WATERMARK
+        victims = []
+        freed = 0
+        for key, record in self._records.items():
+            if record.touched < idle_border:
+                victims.append((key, record, "idle"))
+            elif self._bytes - freed > target_bytes:
+                victims.append((key, record, "budget"))
+            else:
+                # Записи упорядочены по последнему обращению - дальше только свежие
+                break
+            freed += self._size(record)
+        if not victims:
+            return 0
+
+        reasons = {key: reason for key, _, reason in victims}
+        try:
+            snapshots = await self._persist([(key, record) for key, record, _ in victims])
+        except Exception as e:
+            logger.error(f"Не удалось сохранить сессии FSM, они остаются в памяти: {e}")
+            return 0
+
+        evicted = 0
+        for key, record, _, _, touched in snapshots:
+            if self._records.get(key) is record and record.touched == touched and not record.dirty:
+                del self._records[key]
+                self._bytes -= self._size(record)
+                sessions_evicted.inc(reason=reasons[key])
+                evicted += 1
+        self._report()
+        if evicted:
+            logger.info(f"Выгружено сессий FSM: {evicted}, в памяти {len(self._records)} ({self._bytes} байт)")
+        return evicted
+
+    async def run(self):
+        """Фоновое вытеснение простаивающих сессий"""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.evict()
+            except Exception as e:
+                logger.error(f"Ошибка при вытеснении сессий FSM: {e}")
+
+    async def close(self) -> None:
+        """Сохраняет измененные сессии (память не освобождает - polling может быть перезапущен)"""
+        dirty = [(key, record) for key, record in self._records.items() if record.dirty]
+        if dirty:
+            try:
+                await self._persist(dirty)
+            except Exception as e:
+                logger.error(f"Не удалось сохранить сессии FSM при остановке: {e}")
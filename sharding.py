@@ -0,0 +1,394 @@
+"""
+Горизонтальное масштабирование бота.
+
+Супервизор получает обновления от Telegram и раздает их N процессам-воркерам.
+Воркер для чата выбирается по хэшу chat_id (rendezvous hashing), поэтому шаги
+DayScenario одного чата всегда обрабатываются по порядку, а при добавлении или
+удалении воркера переезжает только часть чатов. Состояние FSM воркеры хранят в
+общем хранилище (REDIS_URL), данные - в общей базе. Каждый воркер запускает
+фоновые службы бота (bot.start_services) и экспортирует метрики на порту
+METRICS_PORT + 1 + номер воркера. Повторения и обслуживание партиций при этом
+работают только в одном воркере - том, что держит их аренду в базе (bot.run_exclusive).
+
+Упавший воркер заменяется новым; необработанные обновления его чатов теряются.
+Число воркеров меняется на ходу сигналами супервизору:
+    kill -USR1 <pid>   - добавить воркер
+    kill -USR2 <pid>   - вывести один воркер (после обработки его очереди)
+
+Запуск:
+    python sharding.py run --workers 4
+    python sharding.py bench --workers 1 2 4 --updates 2000
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import multiprocessing as mp
+import queue
+import signal
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений может лежать в очереди одного воркера
+WORKER_QUEUE_SIZE = 1000
+
+
+def extract_chat_id(update: Dict[str, Any]) -> int:
+    """Определяет chat_id обновления (для inline-запросов - id пользователя)"""
+    for key in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        if key in update:
+            return update[key]["chat"]["id"]
+    callback = update.get("callback_query")
+    if callback:
+        if callback.get("message"):
+            return callback["message"]["chat"]["id"]
+        return callback["from"]["id"]
+    for key in ("inline_query", "chosen_inline_result", "my_chat_member", "chat_member", "chat_join_request"):
+        if key in update:
+            payload = update[key]
+            return payload["chat"]["id"] if "chat" in payload else payload["from"]["id"]
+    return 0
+
+
+def _weight(worker: str, chat_id: int) -> int:
+    digest = hashlib.blake2b(f"{worker}:{chat_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def shard_for(chat_id: int, workers: List[str]) -> str:
+    """Rendezvous hashing: стабильный выбор воркера для чата"""
+    if not workers:
+        raise ValueError("No active workers")
+    return max(workers, key=lambda worker: _weight(worker, chat_id))
+
+
+# Обработчик для бенчмарка: имитирует CPU-нагрузку одного шага сценария
+async def _bench_handler(raw: Dict[str, Any]):
+    hashlib.pbkdf2_hmac("sha256", str(raw["update_id"]).encode(), b"tatar-village", 2000)
+
+
+async def _run_in_order(previous: Optional[asyncio.Task], handler, raw, chat_id: int, name: str, acks):
+    # Дожидаемся предыдущего обновления этого же чата, чтобы сохранить порядок шагов
+    if previous is not None:
+        try:
+            await previous
+        except Exception:
+            pass
+    try:
+        await handler(raw)
+    except Exception as e:
+        logger.error(f"[{name}] Ошибка при обработке обновления {raw.get('update_id')}: {e}")
+    finally:
+        acks.put((name, chat_id))
+
+
+async def _worker_loop(name: str, index: int, inbox, acks, mode: str):
+    if mode == "bench":
+        handler = _bench_handler
+    else:
+        # Импортируем бота только внутри воркера: супервизору не нужны ни база, ни диспетчер
+        from aiogram import types
+        from bot import bot, dp, start_services, stop_services
+        from config import METRICS_PORT
+
+        async def handler(raw):
+            update = types.Update.model_validate(raw, context={"bot": bot})
+            await dp.feed_update(bot, update)
+
+        await start_services(METRICS_PORT + 1 + index if METRICS_PORT else 0)
+    try:
+        await _feed(name, inbox, acks, handler)
+    finally:
+        if mode != "bench":
+            await stop_services()
+            await bot.session.close()
+    logger.info(f"[{name}] Воркер остановлен")
+
+
+async def _feed(name: str, inbox, acks, handler):
+    chains: Dict[int, asyncio.Task] = {}
+
+    def forget(chat_id: int, task: asyncio.Task):
+        if chains.get(chat_id) is task:
+            del chains[chat_id]
+
+    while True:
+        item = await asyncio.to_thread(inbox.get)
+        if item is None:
+            break
+        chat_id, raw = item
+        task = asyncio.create_task(_run_in_order(chains.get(chat_id), handler, raw, chat_id, name, acks))
+        chains[chat_id] = task
+        task.add_done_callback(lambda t, c=chat_id: forget(c, t))
+
+    # Мягкая остановка: дорабатываем все, что уже получили
+    if chains:
+        await asyncio.gather(*chains.values(), return_exceptions=True)
+
+
+def _worker_main(name: str, index: int, inbox, acks, mode: str):
+    logging.basicConfig(level=logging.WARNING if mode == "bench" else logging.INFO)
+    asyncio.run(_worker_loop(name, index, inbox, acks, mode))
+
+
+class _Worker:
+    def __init__(self, name: str, process, inbox):
+        self.name = name
+        self.process = process
+        self.inbox = inbox
+        self.in_flight = 0
+        # False - воркер выводится из ротации, замена после остановки не нужна
+        self.replace = True
+
+
+class ShardSupervisor:
+    """Запускает воркеры и маршрутизирует обновления по chat_id"""
+
+    def __init__(self, mode: str = "bot"):
+        self.mode = mode
+        self._ctx = mp.get_context("spawn")
+        self._acks = self._ctx.Queue()
+        self._workers: Dict[str, _Worker] = {}
+        self._active: List[str] = []
+        # chat_id -> (воркер, количество необработанных обновлений)
+        self._pending: Dict[int, Tuple[str, int]] = {}
+        self._next_id = 0
+        self._acks_task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.dispatched = 0
+        self.processed = 0
+
+    @property
+    def workers(self) -> List[str]:
+        return list(self._active)
+
+    def add_worker(self) -> str:
+        index = self._next_id
+        name = f"worker-{index}"
+        self._next_id += 1
+        inbox = self._ctx.Queue(maxsize=WORKER_QUEUE_SIZE)
+        process = self._ctx.Process(target=_worker_main, args=(name, index, inbox, self._acks, self.mode), name=name)
+        process.start()
+        self._workers[name] = _Worker(name, process, inbox)
+        # Новые чаты сразу начинают попадать на новый воркер, а чаты с необработанными
+        # обновлениями остаются на старом до опустошения очереди (см. route)
+        self._active.append(name)
+        logger.info(f"Запущен {name}, активных воркеров: {len(self._active)}")
+        return name
+
+    def route(self, chat_id: int) -> str:
+        pending = self._pending.get(chat_id)
+        if pending is not None:
+            return pending[0]
+        return shard_for(chat_id, self._active)
+
+    def _reap(self) -> bool:
+        """Убирает завершившиеся воркеры; упавшие заменяет новыми. True - кто-то завершился"""
+        dead = [worker for worker in self._workers.values() if not worker.process.is_alive()]
+        for worker in dead:
+            del self._workers[worker.name]
+            if worker.name in self._active:
+                self._active.remove(worker.name)
+            # Необработанные обновления чатов воркера потеряны, чаты переходят к другим воркерам
+            lost = [chat_id for chat_id, (owner, _) in self._pending.items() if owner == worker.name]
+            for chat_id in lost:
+                del self._pending[chat_id]
+            expected = self._stopping or not worker.replace
+            if worker.in_flight or not expected:
+                logger.error(f"{worker.name} завершился (код {worker.process.exitcode}), "
+                             f"потеряно обновлений: {worker.in_flight}, чатов: {len(lost)}")
+            if not expected:
+                self.add_worker()
+        return bool(dead)
+
+    async def dispatch(self, raw: Dict[str, Any]):
+        chat_id = extract_chat_id(raw)
+        # Очередь воркера ограничена: если он не успевает, ждем (backpressure);
+        # если воркер упал, чат переходит к другому
+        while True:
+            name = self.route(chat_id)
+            worker = self._workers[name]
+            if not worker.process.is_alive():
+                self._reap()
+                continue
+            try:
+                worker.inbox.put_nowait((chat_id, raw))
+                break
+            except queue.Full:
+                await asyncio.sleep(0.01)
+        count = self._pending.get(chat_id, (name, 0))[1]
+        self._pending[chat_id] = (name, count + 1)
+        worker.in_flight += 1
+        self.dispatched += 1
+
+    def _ack(self, name: str, chat_id: int):
+        self.processed += 1
+        worker = self._workers.get(name)
+        if worker is None:
+            # Подтверждение от уже убранного воркера: чат мог перейти к другому
+            return
+        worker.in_flight -= 1
+        owner, count = self._pending.get(chat_id, (name, 1))
+        if owner != name:
+            return
+        if count <= 1:
+            self._pending.pop(chat_id, None)
+        else:
+            self._pending[chat_id] = (owner, count - 1)
+
+    async def _collect_acks(self):
+        while not self._stopping or any(w.in_flight for w in self._workers.values()):
+            try:
+                name, chat_id = await asyncio.to_thread(self._acks.get, True, 0.5)
+            except queue.Empty:
+                self._reap()
+                continue
+            self._ack(name, chat_id)
+
+    def start(self, workers: int):
+        for _ in range(workers):
+            self.add_worker()
+        self._acks_task = asyncio.create_task(self._collect_acks())
+
+    async def drain_worker(self, name: str, timeout: float = 60.0):
+        """Выводит воркер из ротации, дожидается обработки его очереди и останавливает процесс"""
+        if name in self._active:
+            if len(self._active) == 1:
+                raise ValueError("Cannot drain the last active worker")
+            self._active.remove(name)
+        worker = self._workers[name]
+        worker.replace = False
+        deadline = time.monotonic() + timeout
+        while worker.in_flight > 0 and worker.process.is_alive() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if worker.in_flight > 0:
+            logger.warning(f"{name}: не дождались {worker.in_flight} обновлений, останавливаем")
+        worker.inbox.put(None)
+        await asyncio.to_thread(worker.process.join, timeout)
+        self._workers.pop(name, None)
+        logger.info(f"{name} остановлен, активных воркеров: {len(self._active)}")
+
+    async def resize(self, workers: int):
+        """Доводит количество активных воркеров до заданного"""
+        while len(self._active) < workers:
+            self.add_worker()
+        while len(self._active) > max(workers, 1):
+            await self.drain_worker(self._active[-1])
+
+    def _resize_on_signal(self, delta: int):
+        async def resize():
+            try:
+                await self.resize(len(self._active) + delta)
+            except Exception as e:
+                logger.error(f"Не удалось изменить число воркеров: {e}")
+
+        if not self._stopping:
+            asyncio.create_task(resize())
+
+    def handle_signals(self):
+        """SIGUSR1 - добавить воркер, SIGUSR2 - убрать воркер"""
+        if not hasattr(signal, "SIGUSR1"):
+            return
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGUSR1, self._resize_on_signal, 1)
+        loop.add_signal_handler(signal.SIGUSR2, self._resize_on_signal, -1)
+
+    async def stop(self):
+        for worker in list(self._workers.values()):
+            worker.inbox.put(None)
+        self._stopping = True
+        if self._acks_task:
+            await self._acks_task
+        for worker in list(self._workers.values()):
+            await asyncio.to_thread(worker.process.join)
+        self._workers.clear()
+        self._active.clear()
+
+    async def poll(self, timeout: int = 30):
+        """Long polling Telegram в супервизоре; обработка - в воркерах"""
+        from aiogram import Bot
+        from config import API_TOKEN
+
+        bot = Bot(token=API_TOKEN)
+        offset = None
+        try:
+            await bot.delete_webhook(drop_pending_updates=False)
+            while True:
+                try:
+                    updates = await bot.get_updates(offset=offset, timeout=timeout)
+                except Exception as e:
+                    logger.error(f"Ошибка получения обновлений: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                for update in updates:
+                    await self.dispatch(update.model_dump(mode="json", exclude_none=True))
+                    offset = update.update_id + 1
+        finally:
+            await bot.session.close()
+
+
+async def run_bot(workers: int):
+    from config import REDIS_URL
+
+    if workers > 1 and not REDIS_URL:
+        logger.warning("REDIS_URL не задан: у каждого воркера свое состояние FSM, "
+                       "при перебалансировке чаты потеряют прогресс")
+    supervisor = ShardSupervisor()
+    supervisor.start(workers)
+    supervisor.handle_signals()
+    try:
+        await supervisor.poll()
+    finally:
+        await supervisor.stop()
+
+
+async def benchmark(worker_counts: List[int], updates: int, chats: int):
+    """Пропускная способность (обновлений в секунду) в зависимости от числа воркеров"""
+    results = {}
+    for workers in worker_counts:
+        supervisor = ShardSupervisor(mode="bench")
+        supervisor.start(workers)
+        # Прогрев: ждем, пока процессы поднимутся
+        for i in range(workers * 4):
+            await supervisor.dispatch({"update_id": -i, "message": {"chat": {"id": i}}})
+        while supervisor.processed < workers * 4:
+            await asyncio.sleep(0.01)
+        supervisor.processed = 0
+
+        started = time.perf_counter()
+        for i in range(updates):
+            await supervisor.dispatch({"update_id": i, "message": {"chat": {"id": i % chats}}})
+        while supervisor.processed < updates:
+            await asyncio.sleep(0.005)
+        elapsed = time.perf_counter() - started
+        await supervisor.stop()
+
+        results[workers] = updates / elapsed
+        print(f"workers={workers:<3} updates={updates} time={elapsed:.2f}s throughput={results[workers]:.0f} upd/s")
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Запуск бота в нескольких процессах")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--workers", type=int, default=None)
+
+    bench_parser = subparsers.add_parser("bench")
+    bench_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    bench_parser.add_argument("--updates", type=int, default=2000)
+    bench_parser.add_argument("--chats", type=int, default=500)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        if args.workers is None:
+            from config import BOT_WORKERS
+            args.workers = BOT_WORKERS
+        asyncio.run(run_bot(args.workers))
+    else:
+        logging.getLogger().setLevel(logging.WARNING)
+        asyncio.run(benchmark(args.workers, args.updates, args.chats))
@@ -0,0 +1,833 @@
+"""
+Встроенное хранилище на SQLite с тем же API, что у DatabaseManager (main.py).
+
+Подходит для небольших установок и тестовых запусков: база - один файл, без
+сетевых обращений. Выбирается схемой DATABASE_URL (open_database в main.py):
+    sqlite:///data/bot.db       - путь относительно рабочего каталога
+    sqlite:////var/lib/bot.db   - абсолютный путь
+
+Устройство:
+- журнал WAL: чтения не ждут записи и друг друга;
+- все записи выполняет один поток-писатель. Запросы на запись копятся в очереди,
+  писатель забирает все накопившиеся (до batch_size) и выполняет их одной
+  транзакцией, каждый - в своей точке сохранения: ошибка одного запроса не
+  отменяет остальные, а фиксация (и fsync) одна на пачку. Вызов возвращается
+  после фиксации пачки;
+- чтения идут через соединения только для чтения, по одному на поток;
+- асинхронные методы не занимают цикл событий: запись ждет future писателя,
+  чтение выполняется в asyncio.to_thread.
+
+Реплик и партиций нет: история решений - одна таблица, методы обслуживания
+партиций ничего не делают. Вместо подготовленных выражений - кэш выражений
+sqlite3 на каждом соединении. Несколько процессов (sharding.py) могут работать
+с одним файлом: писатели разных процессов ждут друг друга (busy_timeout).
+
+Бенчмарк типичных запросов бота: SQLite во временном файле и, если указан,
+Postgres (отдельная база - бенчмарк создает в ней пользователей, задачи и события):
+    python sqlite_backend.py bench --postgres postgresql://... --threads 8 --operations 2000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import metrics
+from main import SQLITE_SCHEME, DatabaseManager, open_database
+
+logger = logging.getLogger(__name__)
+
+sqlite_write_batch = metrics.histogram("sqlite_write_batch_size", "Записи в одной транзакции писателя SQLite",
+                                       buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+sqlite_write_errors = metrics.counter("sqlite_write_errors_total", "Записи SQLite, завершившиеся ошибкой")
+sqlite_write_queue = metrics.gauge("sqlite_write_queue", "Записи, ожидающие писателя SQLite")
+
+# Сколько записей писатель объединяет в одну транзакцию
+WRITE_BATCH_SIZE = 256
+# Сколько миллисекунд ждать блокировку файла другим процессом
+BUSY_TIMEOUT_MS = 5000
+# Время по умолчанию в том же виде, что и у datetime из Python (локальное, с долями секунды)
+NOW_SQL = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+
+# TIMESTAMP, DATE и BOOLEAN читаются теми же типами Python, что и из Postgres
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_converter("TIMESTAMP", lambda raw: datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter("DATE", lambda raw: date.fromisoformat(raw.decode()))
+sqlite3.register_converter("BOOLEAN", lambda raw: raw not in (b"0", b""))
+
+WriteJob = Callable[[sqlite3.Cursor], Any]
+
+SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_id BIGINT UNIQUE NOT NULL,
+        echpoch_score INTEGER DEFAULT 0,
+        user_name VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP DEFAULT ({NOW_SQL})
+    );
+    CREATE INDEX IF NOT EXISTS idx_users_score ON users(echpoch_score);
+
+    CREATE TABLE IF NOT EXISTS tasks (
+        task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cost_of_echpoch INTEGER NOT NULL,
+        task_name VARCHAR(255) NOT NULL UNIQUE,
+        created_at TIMESTAMP DEFAULT ({NOW_SQL})
+    );
+
+    CREATE TABLE IF NOT EXISTS solved_task_keys (
+        user_id INTEGER REFERENCES users (user_id) ON DELETE CASCADE,
+        task_id INTEGER REFERENCES tasks (task_id) ON DELETE CASCADE,
+        PRIMARY KEY (user_id, task_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_solved_tasks_task ON solved_task_keys(task_id);
+
+    CREATE TABLE IF NOT EXISTS user_solved_tasks (
+        user_id INTEGER NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+        task_id INTEGER NOT NULL REFERENCES tasks (task_id) ON DELETE CASCADE,
+        solved_at TIMESTAMP NOT NULL DEFAULT ({NOW_SQL})
+    );
+    CREATE INDEX IF NOT EXISTS idx_solved_tasks_user ON user_solved_tasks(user_id, solved_at);
+
+    CREATE TABLE IF NOT EXISTS review_items (
+        user_id INTEGER REFERENCES users (user_id) ON DELETE CASCADE,
+        task_id INTEGER REFERENCES tasks (task_id) ON DELETE CASCADE,
+        easiness REAL NOT NULL DEFAULT 2.5,
+        interval_days INTEGER NOT NULL DEFAULT 0,
+        repetitions INTEGER NOT NULL DEFAULT 0,
+        due_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (user_id, task_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_review_items_due ON review_items(due_at, user_id, task_id);
+
+    CREATE TABLE IF NOT EXISTS broadcast_jobs (
+        job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name VARCHAR(255) NOT NULL,
+        template TEXT NOT NULL,
+        status VARCHAR(32) NOT NULL DEFAULT 'pending',
+        last_user_id INTEGER NOT NULL DEFAULT 0,
+        sent INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT ({NOW_SQL}),
+        updated_at TIMESTAMP DEFAULT ({NOW_SQL})
+    );
+    CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+        job_id INTEGER REFERENCES broadcast_jobs (job_id) ON DELETE CASCADE,
+        user_id INTEGER,
+        PRIMARY KEY (job_id, user_id)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS service_leases (
+        name VARCHAR(255) PRIMARY KEY,
+        owner VARCHAR(255) NOT NULL,
+        expires_at TIMESTAMP NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS fsm_sessions (
+        session_key VARCHAR(255) PRIMARY KEY,
+        state VARCHAR(255),
+        data TEXT NOT NULL,
+        updated_at TIMESTAMP DEFAULT ({NOW_SQL})
+    );
+
+    CREATE TABLE IF NOT EXISTS analytics_part_daily (
+        day DATE NOT NULL,
+        chapter VARCHAR(64) NOT NULL,
+        version VARCHAR(32) NOT NULL,
+        part INTEGER NOT NULL,
+        event VARCHAR(16) NOT NULL,
+        count BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (chapter, day, version, part, event)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS analytics_score_daily (
+        day DATE NOT NULL,
+        chapter VARCHAR(64) NOT NULL,
+        version VARCHAR(32) NOT NULL,
+        bucket INTEGER NOT NULL,
+        count BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (chapter, day, version, bucket)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS answer_events (
+        created_at TIMESTAMP NOT NULL,
+        telegram_id BIGINT NOT NULL,
+        chapter VARCHAR(64),
+        version VARCHAR(32),
+        part INTEGER,
+        answer TEXT NOT NULL,
+        matched BOOLEAN NOT NULL,
+        similarity REAL,
+        latency_ms INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_answer_events_user ON answer_events(telegram_id, created_at);
+'''
+
+
+def sqlite_path(db_url: str) -> str:
+    """Путь к файлу базы из URL вида sqlite:///относительный или sqlite:////абсолютный"""
+    if not db_url.startswith(SQLITE_SCHEME + "/"):
+        raise ValueError(f"Not an SQLite URL: {db_url}")
+    path = db_url[len(SQLITE_SCHEME) + 1:]
+    if not path or path == ":memory:":
+        # Читатели открывают базу отдельными соединениями - нужен файл
+        raise ValueError("SQLite backend needs a database file path")
+    return path
+
+
+class _Writer(threading.Thread):
+    """Единственный поток, который пишет в базу; выполняет запросы пачками в одной транзакции"""
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], batch_size: int):
+        super().__init__(name="sqlite-writer", daemon=True)
+        self._connect = connect
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[Optional[Tuple[WriteJob, Future]]]" = queue.Queue()
+        self._closed = False
+        self._ready = Future()
+
+    def start(self):
+        super().start()
+        # Ошибка открытия базы - сразу у вызывающего, а не в первой записи
+        self._ready.result()
+
+    def submit(self, job: WriteJob) -> Future:
+        if self._closed:
+            raise RuntimeError("SQLite database is closed")
+        future = Future()
+        self._queue.put((job, future))
+        sqlite_write_queue.set(self._queue.qsize())
+        return future
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self.join()
+
+    def run(self):
+        try:
+            conn = self._connect()
+        except Exception as e:
+            self._ready.set_exception(e)
+            return
+        self._ready.set_result(None)
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is None:
+                    break
+                batch = [item]
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                sqlite_write_queue.set(self._queue.qsize())
+                self._execute(conn, batch)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _execute(conn: sqlite3.Connection, batch: List[Tuple[WriteJob, Future]]):
+        batch = [(job, future) for job, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        sqlite_write_batch.observe(len(batch))
+        cursor = conn.cursor()
+        done = []
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for job, future in batch:
+                cursor.execute("SAVEPOINT job")
+                try:
+                    result = job(cursor)
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO job")
+                    cursor.execute("RELEASE job")
+                    sqlite_write_errors.inc()
+                    future.set_exception(e)
+                    continue
+                cursor.execute("RELEASE job")
+                done.append((future, result))
+            cursor.execute("COMMIT")
+        except Exception as e:
+            # Транзакция пачки не зафиксирована: ошибка у всех, кто еще ждет
+            if conn.in_transaction:
+                conn.rollback()
+            logger.error(f"Не удалось записать пачку в SQLite ({len(batch)} запросов): {e}")
+            for _, future in batch:
+                if not future.done():
+                    sqlite_write_errors.inc()
+                    future.set_exception(e)
+            return
+        for future, result in done:
+            future.set_result(result)
+
+
+class SQLiteDatabaseManager:
+    ANSWER_EVENT_COLUMNS = DatabaseManager.ANSWER_EVENT_COLUMNS
+
+    def __init__(self, db_url: str, batch_size: int = WRITE_BATCH_SIZE):
+        self.db_url = db_url
+        self.path = sqlite_path(db_url)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._writer = _Writer(self._connect_writer, batch_size)
+        self._writer.start()
+
+    # Соединения
+    def _connect(self, mode: str) -> sqlite3.Connection:
+        uri = f"file:{quote(os.path.abspath(self.path))}?mode={mode}"
+        # isolation_level=None: транзакциями управляем сами, sqlite3 не открывает их неявно
+        conn = sqlite3.connect(uri, uri=True, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None,
+                               check_same_thread=False, cached_statements=256)
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        return conn
+
+    def _connect_writer(self) -> sqlite3.Connection:
+        conn = self._connect("rwc")
+        conn.execute("PRAGMA journal_mode = WAL")
+        # В режиме WAL фиксация без fsync журнала: после сбоя питания теряются последние пачки, но не целостность
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect("ro")
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def _read(self, sql: str, params: Any = ()) -> sqlite3.Cursor:
+        return self._reader().execute(sql, params)
+
+    def _write(self, job: WriteJob) -> Any:
+        """Выполняет job(cursor) в потоке-писателе и ждет фиксации его пачки"""
+        return self._writer.submit(job).result()
+
+    async def _write_async(self, job: WriteJob) -> Any:
+        return await asyncio.wrap_future(self._writer.submit(job))
+
+    def close(self):
+        self._writer.close()
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+
+    # User operations
+    @staticmethod
+    def _create_user(cursor: sqlite3.Cursor, telegram_id: int, user_name: str, echpoch_score: int) -> int:
+        cursor.execute(
+            "INSERT INTO users (telegram_id, user_name, echpoch_score) VALUES (?, ?, ?)",
+            (telegram_id, user_name, echpoch_score)
+        )
+        return cursor.lastrowid
+
+    def create_user(self, telegram_id: int, user_name: str, echpoch_score: int = 0) -> int:
+        return self._write(lambda cursor: self._create_user(cursor, telegram_id, user_name, echpoch_score))
+
+    def get_user_by_telegram_id(self, telegram_id: int) -> Optional[Tuple]:
+        return self._read(
+            "SELECT user_id, telegram_id, echpoch_score, user_name FROM users WHERE telegram_id = ?", (telegram_id,)
+        ).fetchone()
+
+    def get_user(self, user_id: int) -> Optional[Tuple]:
+        return self._read(
+            "SELECT user_id, telegram_id, echpoch_score, user_name FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+
+    def update_user_score(self, user_id: int, new_score: int) -> bool:
+        return self._write(lambda cursor: cursor.execute(
+            "UPDATE users SET echpoch_score = ? WHERE user_id = ?", (new_score, user_id)
+        ).rowcount > 0)
+
+    @staticmethod
+    def _increment_user_score(cursor: sqlite3.Cursor, user_id: int, increment: int) -> bool:
+        cursor.execute("UPDATE users SET echpoch_score = echpoch_score + ? WHERE user_id = ?", (increment, user_id))
+        return cursor.rowcount > 0
+
+    def increment_user_score(self, user_id: int, increment: int) -> bool:
+        return self._write(lambda cursor: self._increment_user_score(cursor, user_id, increment))
+
+    def delete_user(self, user_id: int) -> bool:
+        return self._write(lambda cursor: cursor.execute(
+            "DELETE FROM users WHERE user_id = ?", (user_id,)
+        ).rowcount > 0)
+
+    # Task operations
+    def create_task(self, task_name: str, cost_of_echpoch: int) -> int:
+        return self._write(lambda cursor: cursor.execute(
+            "INSERT INTO tasks (task_name, cost_of_echpoch) VALUES (?, ?)", (task_name, cost_of_echpoch)
+        ).lastrowid)
+
+    def get_task(self, task_id: int) -> Optional[Tuple]:
+        return self._read(
+            "SELECT task_id, cost_of_echpoch, task_name FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+
+    def get_all_tasks(self) -> List[Tuple]:
+        return self._read("SELECT task_id, cost_of_echpoch, task_name FROM tasks ORDER BY task_id").fetchall()
+
+    def update_task_cost(self, task_id: int, new_cost: int) -> bool:
+        return self._write(lambda cursor: cursor.execute(
+            "UPDATE tasks SET cost_of_echpoch = ? WHERE task_id = ?", (new_cost, task_id)
+        ).rowcount > 0)
+
+    def delete_task(self, task_id: int) -> bool:
+        return self._write(lambda cursor: cursor.execute(
+            "DELETE FROM tasks WHERE task_id = ?", (task_id,)
+        ).rowcount > 0)
+
+    # Solved tasks operations
+    @staticmethod
+    def _mark_task_as_solved(cursor: sqlite3.Cursor, user_id: int, task_id: int) -> bool:
+        # Проверяем существование пользователя и задачи
+        if not cursor.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone():
+            return False
+        if not cursor.execute("SELECT 1 FROM tasks WHERE task_id = ?", (task_id,)).fetchone():
+            return False
+        cursor.execute("INSERT OR IGNORE INTO solved_task_keys (user_id, task_id) VALUES (?, ?)", (user_id, task_id))
+        if cursor.rowcount == 0:
+            # Задача уже была решена
+            return False
+        cursor.execute(
+            "INSERT INTO user_solved_tasks (user_id, task_id, solved_at) VALUES (?, ?, ?)",
+            (user_id, task_id, datetime.now())
+        )
+        cursor.execute(
+            "UPDATE users SET echpoch_score = echpoch_score + "
+            "(SELECT cost_of_echpoch FROM tasks WHERE task_id = ?) WHERE user_id = ?",
+            (task_id, user_id)
+        )
+        return True
+
+    def mark_task_as_solved(self, user_id: int, task_id: int) -> bool:
+        try:
+            return self._write(lambda cursor: self._mark_task_as_solved(cursor, user_id, task_id))
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка отметки решенной задачи: {e}")
+            return False
+
+    def get_solved_tasks(self, user_id: int, days: Optional[int] = None) -> List[Tuple]:
+        """Решенные задачи пользователя, новые первыми; days - только за последние дни"""
+        query = '''
+            SELECT t.task_id, t.cost_of_echpoch, t.task_name, ust.solved_at
+            FROM tasks t
+            JOIN user_solved_tasks ust ON t.task_id = ust.task_id
+            WHERE ust.user_id = ?
+        '''
+        params: List[Any] = [user_id]
+        if days is not None:
+            query += ' AND ust.solved_at >= ?'
+            params.append(datetime.now() - timedelta(days=days))
+        return self._read(query + ' ORDER BY ust.solved_at DESC', params).fetchall()
+
+    def is_task_solved(self, user_id: int, task_id: int) -> bool:
+        return self._read(
+            "SELECT 1 FROM solved_task_keys WHERE user_id = ? AND task_id = ?", (user_id, task_id)
+        ).fetchone() is not None
+
+    def get_user_stats(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        user = self.get_user_by_telegram_id(telegram_id)
+        if not user:
+            return None
+        return self._get_user_stats(user[0])
+
+    def _get_user_stats(self, user_id: int) -> Dict[str, Any]:
+        total_solved, total_score = self._read(
+            "SELECT (SELECT COUNT(*) FROM solved_task_keys WHERE user_id = ?1), "
+            "(SELECT echpoch_score FROM users WHERE user_id = ?1)",
+            (user_id,)
+        ).fetchone()
+        return {
+            'total_solved': total_solved,
+            'total_score': total_score
+        }
+
+    # Партиций нет: история решений хранится одной таблицей
+    def ensure_solved_partitions(self, months_ahead: int = 2) -> List[str]:
+        return []
+
+    def list_solved_partitions(self) -> List[Tuple[str, date]]:
+        return []
+
+    @contextmanager
+    def solved_partitions_lock(self):
+        yield
+
+    def copy_solved_partition(self, name: str, out) -> None:
+        raise ValueError(f"Not a monthly partition: {name}")
+
+    def drop_solved_partition(self, name: str) -> None:
+        raise ValueError(f"Not a monthly partition: {name}")
+
+    # Review operations
+    def seed_review_items(self) -> int:
+        """Ставит на повторение решенные задачи, которых еще нет в расписании (первый повтор - через день)"""
+        return self._write(lambda cursor: cursor.execute('''
+            INSERT OR IGNORE INTO review_items (user_id, task_id, due_at)
+            SELECT ust.user_id, ust.task_id, datetime(ust.solved_at, '+1 day')
+            FROM user_solved_tasks ust
+            LEFT JOIN review_items ri ON ri.user_id = ust.user_id AND ri.task_id = ust.task_id
+            WHERE ri.user_id IS NULL
+        ''').rowcount)
+
+    def schedule_part_review(self, user_id: int, task_name: str, due_at) -> bool:
+        """Ставит на повторение правильно отвеченную часть главы (задача с нулевой ценой, без очков)"""
+        def schedule(cursor: sqlite3.Cursor) -> bool:
+            row = cursor.execute(
+                "SELECT task_id FROM tasks WHERE task_name = ? AND cost_of_echpoch = 0 ORDER BY task_id LIMIT 1",
+                (task_name,)
+            ).fetchone()
+            if row:
+                task_id = row[0]
+            else:
+                task_id = cursor.execute(
+                    "INSERT INTO tasks (task_name, cost_of_echpoch) VALUES (?, 0)", (task_name,)
+                ).lastrowid
+            return cursor.execute(
+                "INSERT OR IGNORE INTO review_items (user_id, task_id, due_at) VALUES (?, ?, ?)",
+                (user_id, task_id, due_at)
+            ).rowcount > 0
+        return self._write(schedule)
+
+    def get_due_reviews(self, until, after: Optional[Tuple] = None, limit: int = 1000) -> List[Tuple]:
+        """
+        Страница повторений со сроком до until в порядке (due_at, user_id, task_id).
+        after - ключ последней строки предыдущей страницы (keyset-пагинация).
+        """
+        query = '''
+            SELECT ri.due_at, ri.user_id, ri.task_id, u.telegram_id, t.task_name,
+                   ri.easiness, ri.interval_days, ri.repetitions
+            FROM review_items ri
+            JOIN users u ON u.user_id = ri.user_id
+            JOIN tasks t ON t.task_id = ri.task_id
+            WHERE ri.due_at <= ?
+        '''
+        params: List[Any] = [until]
+        if after is not None:
+            query += ' AND (ri.due_at, ri.user_id, ri.task_id) > (?, ?, ?)'
+            params.extend(after)
+        query += ' ORDER BY ri.due_at, ri.user_id, ri.task_id LIMIT ?'
+        params.append(limit)
+        return self._read(query, params).fetchall()
+
+    def get_review_item(self, user_id: int, task_id: int) -> Optional[Tuple]:
+        return self._read(
+            "SELECT easiness, interval_days, repetitions, due_at FROM review_items WHERE user_id = ? AND task_id = ?",
+            (user_id, task_id)
+        ).fetchone()
+
+    def update_review_item(self, user_id: int, task_id: int, easiness: float, interval_days: int,
+                           repetitions: int, due_at) -> bool:
+        return self._write(lambda cursor: cursor.execute(
+            "UPDATE review_items SET easiness = ?, interval_days = ?, repetitions = ?, due_at = ? "
+            "WHERE user_id = ? AND task_id = ?",
+            (easiness, interval_days, repetitions, due_at, user_id, task_id)
+        ).rowcount > 0)
+
+    def postpone_reviews(self, keys: List[Tuple[int, int]], due_at) -> int:
+        """Переносит срок отправленных повторений (если пользователь не ответит, они вернутся)"""
+        if not keys:
+            return 0
+        return self._write(lambda cursor: cursor.executemany(
+            "UPDATE review_items SET due_at = ? WHERE user_id = ? AND task_id = ?",
+            [(due_at, user_id, task_id) for user_id, task_id in keys]
+        ).rowcount)
+
+    # Broadcast operations
+    def get_users_page(self, after_user_id: int = 0, limit: int = 1000) -> List[Tuple]:
+        """Страница пользователей по возрастанию user_id (keyset-пагинация без OFFSET)"""
+        return self._read(
+            "SELECT user_id, telegram_id, echpoch_score, user_name FROM users "
+            "WHERE user_id > ? ORDER BY user_id LIMIT ?",
+            (after_user_id, limit)
+        ).fetchall()
+
+    def create_broadcast_job(self, name: str, template: str) -> int:
+        return self._write(lambda cursor: cursor.execute(
+            "INSERT INTO broadcast_jobs (name, template) VALUES (?, ?)", (name, template)
+        ).lastrowid)
+
+    def create_broadcast_job_once(self, name: str, template: str) -> Optional[int]:
+        """Создает задание, только если задания с таким именем еще нет; None - его уже создал другой процесс"""
+        def create(cursor: sqlite3.Cursor) -> Optional[int]:
+            # Проверка и вставка идут в одной транзакции писателя, поэтому гонки между процессами нет
+            if cursor.execute("SELECT 1 FROM broadcast_jobs WHERE name = ?", (name,)).fetchone():
+                return None
+            return cursor.execute(
+                "INSERT INTO broadcast_jobs (name, template) VALUES (?, ?)", (name, template)
+            ).lastrowid
+        return self._write(create)
+
+    def claim_broadcast_job(self, job_id: int, stale_after: float) -> bool:
+        """Забирает незавершенное задание себе, если его никто не выполняет (нет контрольных точек stale_after секунд)"""
+        return self._write(lambda cursor: cursor.execute(
+            f"UPDATE broadcast_jobs SET status = 'running', updated_at = {NOW_SQL} "
+            "WHERE job_id = ? AND status <> 'done' "
+            "AND (status <> 'running' OR updated_at < strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime', ?))",
+            (job_id, f"-{stale_after} seconds")
+        ).rowcount > 0)
+
+    # Service lease operations
+    def claim_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Берет или продлевает аренду службы на ttl секунд; False - ее держит другой процесс"""
+        return self._write(lambda cursor: cursor.execute(
+            "INSERT INTO service_leases (name, owner, expires_at) "
+            "VALUES (?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime', ?)) "
+            "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            f"WHERE service_leases.owner = excluded.owner OR service_leases.expires_at < {NOW_SQL}",
+            (name, owner, f"+{ttl} seconds")
+        ).rowcount > 0)
+
+    def release_lease(self, name: str, owner: str) -> bool:
+        return self._write(lambda cursor: cursor.execute(
+            "DELETE FROM service_leases WHERE name = ? AND owner = ?", (name, owner)
+        ).rowcount > 0)
+
+    def get_broadcast_job(self, job_id: int) -> Optional[Tuple]:
+        return self._read(
+            "SELECT job_id, name, template, status, last_user_id, sent, failed FROM broadcast_jobs WHERE job_id = ?",
+            (job_id,)
+        ).fetchone()
+
+    def get_broadcast_job_by_name(self, name: str) -> Optional[Tuple]:
+        return self._read(
+            "SELECT job_id, name, template, status, last_user_id, sent, failed FROM broadcast_jobs "
+            "WHERE name = ? ORDER BY job_id DESC LIMIT 1",
+            (name,)
+        ).fetchone()
+
+    def get_delivered_users(self, job_id: int, after_user_id: int) -> List[int]:
+        """Пользователи после контрольной точки, которым сообщение уже доставлено"""
+        rows = self._read(
+            "SELECT user_id FROM broadcast_deliveries WHERE job_id = ? AND user_id > ?", (job_id, after_user_id)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def _save_broadcast_checkpoint(cursor: sqlite3.Cursor, job_id: int, last_user_id: int, sent: int,
+                                   failed: int, status: str, delivered: List[int]) -> bool:
+        if delivered:
+            cursor.executemany(
+                "INSERT OR IGNORE INTO broadcast_deliveries (job_id, user_id) VALUES (?, ?)",
+                [(job_id, user_id) for user_id in delivered]
+            )
+        # Доставки до контрольной точки больше не нужны: они покрыты last_user_id
+        cursor.execute("DELETE FROM broadcast_deliveries WHERE job_id = ? AND user_id <= ?", (job_id, last_user_id))
+        cursor.execute(
+            f"UPDATE broadcast_jobs SET last_user_id = ?, sent = ?, failed = ?, status = ?, updated_at = {NOW_SQL} "
+            "WHERE job_id = ?",
+            (last_user_id, sent, failed, status, job_id)
+        )
+        return cursor.rowcount > 0
+
+    def save_broadcast_checkpoint(self, job_id: int, last_user_id: int, sent: int, failed: int,
+                                  status: str, delivered: List[int]) -> bool:
+        """Контрольная точка рассылки и новые доставки - в одной транзакции"""
+        return self._write(lambda cursor: self._save_broadcast_checkpoint(
+            cursor, job_id, last_user_id, sent, failed, status, delivered
+        ))
+
+    # FSM session operations
+    def load_session(self, session_key: str) -> Optional[Tuple]:
+        return self._read("SELECT state, data FROM fsm_sessions WHERE session_key = ?", (session_key,)).fetchone()
+
+    def save_sessions(self, sessions: List[Tuple[str, Optional[str], str]]) -> int:
+        """Сохраняет пачку сессий (ключ, состояние, данные в JSON) одной транзакцией"""
+        if not sessions:
+            return 0
+        self._write(lambda cursor: cursor.executemany(
+            f"""
+            INSERT INTO fsm_sessions (session_key, state, data, updated_at) VALUES (?, ?, ?, {NOW_SQL})
+            ON CONFLICT (session_key) DO UPDATE
+            SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+            """,
+            sessions
+        ))
+        return len(sessions)
+
+    def delete_sessions(self, session_keys: List[str]) -> int:
+        if not session_keys:
+            return 0
+        return self._write(lambda cursor: cursor.executemany(
+            "DELETE FROM fsm_sessions WHERE session_key = ?", [(key,) for key in session_keys]
+        ).rowcount)
+
+    # Analytics operations
+    @staticmethod
+    def _add_analytics(cursor: sqlite3.Cursor, part_counts: List[Tuple], score_counts: List[Tuple]):
+        if part_counts:
+            cursor.executemany('''
+                INSERT INTO analytics_part_daily (day, chapter, version, part, event, count) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (chapter, day, version, part, event) DO UPDATE
+                SET count = analytics_part_daily.count + excluded.count
+            ''', part_counts)
+        if score_counts:
+            cursor.executemany('''
+                INSERT INTO analytics_score_daily (day, chapter, version, bucket, count) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (chapter, day, version, bucket) DO UPDATE
+                SET count = analytics_score_daily.count + excluded.count
+            ''', score_counts)
+
+    def add_analytics(self, part_counts: List[Tuple], score_counts: List[Tuple]) -> None:
+        """Прибавляет пачку приращений к дневным сводкам одной транзакцией (формат - как у DatabaseManager)"""
+        if part_counts or score_counts:
+            self._write(lambda cursor: self._add_analytics(cursor, part_counts, score_counts))
+
+    def get_chapter_funnel(self, chapter: str, since: date) -> List[Tuple]:
+        """(часть, событие, количество) главы начиная с дня since"""
+        return self._read('''
+            SELECT part, event, SUM(count)
+            FROM analytics_part_daily
+            WHERE chapter = ? AND day >= ?
+            GROUP BY part, event
+            ORDER BY part, event
+        ''', (chapter, since)).fetchall()
+
+    def get_score_distribution(self, chapter: str, since: date) -> List[Tuple]:
+        """(корзина баллов, количество завершений главы) начиная с дня since"""
+        return self._read('''
+            SELECT bucket, SUM(count)
+            FROM analytics_score_daily
+            WHERE chapter = ? AND day >= ?
+            GROUP BY bucket
+            ORDER BY bucket
+        ''', (chapter, since)).fetchall()
+
+    # Answer log operations
+    def insert_answer_events(self, events: List[Tuple]) -> int:
+        """Добавляет пачку попыток ответа (кортежи в порядке ANSWER_EVENT_COLUMNS)"""
+        if not events:
+            return 0
+        placeholders = ", ".join("?" * len(self.ANSWER_EVENT_COLUMNS))
+        self._write(lambda cursor: cursor.executemany(
+            f"INSERT INTO answer_events ({', '.join(self.ANSWER_EVENT_COLUMNS)}) VALUES ({placeholders})", events
+        ))
+        return len(events)
+
+    # Асинхронные методы для использования в боте
+    async def create_user_async(self, telegram_id: int, user_name: str, echpoch_score: int = 0) -> int:
+        return await self._write_async(lambda cursor: self._create_user(cursor, telegram_id, user_name, echpoch_score))
+
+    async def get_user_by_telegram_id_async(self, telegram_id: int) -> Optional[Tuple]:
+        return await asyncio.to_thread(self.get_user_by_telegram_id, telegram_id)
+
+    async def get_user_stats_async(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get_user_stats, telegram_id)
+
+    async def increment_user_score_async(self, user_id: int, increment: int) -> bool:
+        return await self._write_async(lambda cursor: self._increment_user_score(cursor, user_id, increment))
+
+
+# Бенчмарк
+BENCH_USERS = 1000
+BENCH_TASKS = 50
+# Telegram id пользователей бенчмарка - вне диапазона настоящих
+BENCH_TELEGRAM_BASE = -10 ** 12
+
+
+def _measure(threads: int, operations: int, operation: Callable[[int], Any]) -> Tuple[float, List[float]]:
+    """Выполняет operation(i) для i < operations в threads потоках; (операций в секунду, задержки)"""
+    def timed(index: int) -> float:
+        started = time.perf_counter()
+        operation(index)
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(threads) as executor:
+        started = time.perf_counter()
+        latencies = list(executor.map(timed, range(operations)))
+        elapsed = time.perf_counter() - started
+    return operations / elapsed, latencies
+
+
+def _bench_backend(name: str, db, threads: int, operations: int):
+    run_id = time.time_ns() % 10 ** 9
+    telegram_ids = [BENCH_TELEGRAM_BASE - run_id * BENCH_USERS - index for index in range(BENCH_USERS)]
+    user_ids = [db.create_user(telegram_id, f"bench{index}") for index, telegram_id in enumerate(telegram_ids)]
+    task_ids = [db.create_task(f"bench-{run_id}-{index}", 5) for index in range(BENCH_TASKS)]
+    session_keys = [f"bench:{run_id}:{index}" for index in range(BENCH_USERS)]
+    chapters = ("chapter1", "chapter2")
+
+    def answer_batch(index: int) -> List[Tuple]:
+        return [(datetime.now(), telegram_ids[(index + offset) % BENCH_USERS], chapters[offset % 2], "bench",
+                 offset % 10, "рәхмәт", offset % 3 == 0, 0.75, 4200) for offset in range(500)]
+
+    cases = {
+        "get_user_by_telegram_id": lambda i: db.get_user_by_telegram_id(telegram_ids[i % BENCH_USERS]),
+        "get_user_stats": lambda i: db.get_user_stats(telegram_ids[i % BENCH_USERS]),
+        "increment_user_score": lambda i: db.increment_user_score(user_ids[i % BENCH_USERS], 5),
+        "mark_task_as_solved": lambda i: db.mark_task_as_solved(
+            user_ids[i % BENCH_USERS], task_ids[i // BENCH_USERS % BENCH_TASKS]),
+        "save_sessions x100": lambda i: db.save_sessions(
+            [(session_keys[(i * 100 + offset) % BENCH_USERS], "DayScenario:waiting_for_answer",
+              '{"current_chapter": "chapter1", "current_part": 3, "score": 15}') for offset in range(100)]),
+        "add_analytics": lambda i: db.add_analytics(
+            [(date.today(), chapters[i % 2], "bench", i % 10, "reached", 1)], []),
+        "insert_answer_events x500": lambda i: db.insert_answer_events(answer_batch(i)),
+    }
+    # Пачки тяжелее одиночных запросов - их меньше
+    batched = {"save_sessions x100", "insert_answer_events x500"}
+    try:
+        for case, operation in cases.items():
+            count = max(threads, operations // 20) if case in batched else operations
+            rate, latencies = _measure(threads, count, operation)
+            latencies.sort()
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f"{name:8} {case:26} {rate:9.0f} ops/s  p50 {statistics.median(latencies) * 1000:7.2f} ms  "
+                  f"p99 {p99 * 1000:7.2f} ms")
+    finally:
+        db.delete_sessions(session_keys)
+        for user_id in user_ids:
+            db.delete_user(user_id)
+        for task_id in task_ids:
+            db.delete_task(task_id)
+
+
+def benchmark(postgres_url: Optional[str], threads: int, operations: int):
+    with tempfile.TemporaryDirectory() as directory:
+        db = open_database(f"{SQLITE_SCHEME}/{os.path.join(directory, 'bench.db')}")
+        try:
+            _bench_backend("sqlite", db, threads, operations)
+        finally:
+            db.close()
+    if postgres_url:
+        db = open_database(postgres_url, pool_size=threads)
+        try:
+            _bench_backend("postgres", db, threads, operations)
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Встроенное хранилище SQLite")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subparsers.add_parser("bench")
+    bench_parser.add_argument("--postgres", help="URL отдельной базы Postgres для сравнения")
+    bench_parser.add_argument("--threads", type=int, default=8)
+    bench_parser.add_argument("--operations", type=int, default=2000)
+    args = parser.parse_args()
+    benchmark(args.postgres, args.threads, args.operations)
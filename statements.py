@@ -0,0 +1,148 @@
+"""
+Подготовленные выражения для самых частых запросов.
+
+Каждое выражение готовится (PREPARE) один раз на соединение из пула при
+первом использовании, дальше выполняется через EXECUTE - Postgres не
+разбирает и не планирует его заново. Какие выражения уже готовы, знает
+само соединение (StatementConnection), поэтому пересозданное пулом
+соединение подготовит их снова.
+
+Бенчмарк (нужна база с таблицами бота):
+    python statements.py bench --dsn postgresql://... --iterations 5000
+"""
+import argparse
+import time
+from typing import Dict, Sequence, Set, Tuple
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+
+import metrics
+
+statement_cache = metrics.counter("db_statement_cache_total", "Выполнения подготовленных выражений: hit - уже готово")
+
+# Имя -> (типы параметров, запрос с параметрами $1, $2, ...)
+STATEMENTS: Dict[str, Tuple[Tuple[str, ...], str]] = {
+    "user_by_telegram_id": (
+        ("bigint",),
+        "SELECT user_id, telegram_id, echpoch_score, user_name FROM users WHERE telegram_id = $1",
+    ),
+    "increment_score": (
+        ("integer", "integer"),
+        "UPDATE users SET echpoch_score = echpoch_score + $1 WHERE user_id = $2",
+    ),
+    # Уникальность пары проверяет solved_task_keys; в историю попадает только новая пара
+    "insert_solved_task": (
+        ("integer", "integer"),
+        "WITH new_key AS (INSERT INTO solved_task_keys (user_id, task_id) VALUES ($1, $2) "
+        "ON CONFLICT DO NOTHING RETURNING user_id, task_id) "
+        "INSERT INTO user_solved_tasks (user_id, task_id) SELECT user_id, task_id FROM new_key",
+    ),
+    "user_stats": (
+        ("integer",),
+        "SELECT (SELECT COUNT(*) FROM solved_task_keys WHERE user_id = $1), "
+        "(SELECT echpoch_score FROM users WHERE user_id = $1)",
+    ),
+}
+
+
+class StatementConnection(psycopg2.extensions.connection):
+    """Соединение, которое помнит подготовленные на нем выражения"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: Set[str] = set()
+
+
+def execute_prepared(cursor, name: str, params: Sequence = ()):
+    """Выполняет выражение name, при первом обращении на этом соединении готовит его"""
+    conn = cursor.connection
+    prepared = getattr(conn, "prepared", None)
+    if prepared is None:
+        # Соединение не из пула (например, psycopg2.connect) - обычный запрос
+        cursor.execute(*_plain(name, params))
+        return
+    if name in prepared:
+        statement_cache.inc(statement=name, result="hit")
+    else:
+        types, sql = STATEMENTS[name]
+        cursor.execute(f"PREPARE {name} ({', '.join(types)}) AS {sql}")
+        # PREPARE не отменяется откатом транзакции - выражение остается на соединении
+        prepared.add(name)
+        statement_cache.inc(statement=name, result="miss")
+    placeholders = ", ".join(["%s"] * len(params))
+    try:
+        cursor.execute(f"EXECUTE {name} ({placeholders})" if params else f"EXECUTE {name}", params)
+    except psycopg2.errors.InvalidSqlStatementName:
+        # Выражение удалили на сервере (DISCARD/DEALLOCATE) - подготовим заново в следующий раз
+        prepared.discard(name)
+        raise
+
+
+def _plain(name: str, params: Sequence) -> Tuple[str, Dict[str, object]]:
+    """Тот же запрос без подготовки: $N заменяются на именованные параметры psycopg2"""
+    _, sql = STATEMENTS[name]
+    for number in range(len(params), 0, -1):
+        sql = sql.replace(f"${number}", f"%(p{number})s")
+    return sql, {f"p{number}": value for number, value in enumerate(params, 1)}
+
+
+def hit_rate() -> Dict[str, float]:
+    """Доля выполнений без подготовки по каждому выражению"""
+    rates = {}
+    for name in STATEMENTS:
+        hits = statement_cache.get(statement=name, result="hit")
+        total = hits + statement_cache.get(statement=name, result="miss")
+        if total:
+            rates[name] = hits / total
+    return rates
+
+
+def benchmark(dsn: str, iterations: int):
+    conn = psycopg2.connect(dsn, connection_factory=StatementConnection)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT user_id, telegram_id FROM users ORDER BY user_id LIMIT 1")
+        row = cursor.fetchone()
+        if row is None:
+            raise SystemExit("Таблица users пуста - добавьте хотя бы одного пользователя")
+        user_id, telegram_id = row
+        conn.rollback()
+
+        cases = {
+            "user_by_telegram_id": (telegram_id,),
+            "user_stats": (user_id,),
+            # Прибавляем 0, чтобы не менять данные
+            "increment_score": (0, user_id),
+        }
+        for name, params in cases.items():
+            plain_sql, plain_params = _plain(name, params)
+
+            started = time.perf_counter()
+            for _ in range(iterations):
+                cursor.execute(plain_sql, plain_params)
+            conn.rollback()
+            plain = (time.perf_counter() - started) / iterations
+
+            started = time.perf_counter()
+            for _ in range(iterations):
+                execute_prepared(cursor, name, params)
+            conn.rollback()
+            prepared = (time.perf_counter() - started) / iterations
+
+            print(f"{name:22} plain {plain * 1e6:8.1f} us  prepared {prepared * 1e6:8.1f} us  "
+                  f"x{plain / prepared:.2f}")
+        print("hit rate: " + ", ".join(f"{name}={rate:.3f}" for name, rate in hit_rate().items()))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Подготовленные выражения")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subparsers.add_parser("bench")
+    bench_parser.add_argument("--dsn", required=True)
+    bench_parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+    benchmark(args.dsn, args.iterations)
@@ -0,0 +1,75 @@
+"""
+Сообщение, которое дописывается по мере генерации ответа LLM.
+
+Сначала сразу отправляется заглушка, затем текст правится не чаще, чем раз в
+STREAM_EDIT_INTERVAL секунд (ограничение Telegram на правки сообщений).
+"""
+import asyncio
+import html
+import logging
+import time
+from typing import Optional
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from config import STREAM_EDIT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = "👵 Бабушка думает..."
+
+
+class ProgressiveMessage:
+    def __init__(self, message: types.Message, header: str, min_interval: float = STREAM_EDIT_INTERVAL):
+        self.message = message
+        self.header = header
+        self.min_interval = min_interval
+        self._sent: Optional[types.Message] = None
+        self._last_text = ""
+        self._next_edit_at = 0.0
+
+    def _render(self, body: str) -> str:
+        return f"{self.header}\n\n{html.escape(body)}"
+
+    async def start(self):
+        """Отправляет заглушку сразу, не дожидаясь ответа LLM"""
+        self._sent = await self.message.answer(self._render(PLACEHOLDER))
+        self._next_edit_at = time.monotonic() + self.min_interval
+
+    async def update(self, body: str):
+        """Промежуточный текст: правка пропускается, если с прошлой прошло слишком мало времени"""
+        if self._sent is None or time.monotonic() < self._next_edit_at:
+            return
+        await self._edit(body + " ▌")
+
+    async def finish(self, body: str):
+        """Итоговый текст отправляется всегда"""
+        if self._sent is None:
+            await self.message.answer(self._render(body))
+            return
+        for _ in range(2):
+            if await self._edit(body):
+                return
+            # Telegram попросил подождать - дожидаемся и пробуем еще раз
+            wait = self._next_edit_at - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        await self.message.answer(self._render(body))
+
+    async def _edit(self, body: str) -> bool:
+        text = self._render(body)
+        if text == self._last_text:
+            return True
+        try:
+            await self._sent.edit_text(text)
+        except TelegramRetryAfter as e:
+            self._next_edit_at = time.monotonic() + e.retry_after
+            return False
+        except TelegramBadRequest as e:
+            # "message is not modified" и подобное - текст уже на месте
+            logger.debug(f"Правка сообщения отклонена: {e}")
+            return True
+        self._last_text = text
+        self._next_edit_at = time.monotonic() + self.min_interval
+        return True
@@ -0,0 +1,363 @@
+"""
+Запись и воспроизведение входящего трафика для нагрузочных тестов.
+
+Запись (TRAFFIC_LOG в окружении бота): каждое входящее обновление дописывается
+в сжатый gzip-журнал (JSON по строке). Идентификаторы пользователей и чатов
+заменяются на HMAC от них (один и тот же пользователь - один и тот же
+псевдоним), имена и юзернеймы удаляются, абсолютные даты заменяются
+смещением от начала записи.
+
+Воспроизведение подает журнал в Dispatcher из bot.py со скоростью 1x, Nx или
+максимальной. Telegram, GigaChat и переводчик заменены заглушками, база -
+настоящая (DATABASE_URL тестовой базы). Отчет содержит задержки обработчиков
+и число обращений к базе; два отчета (две сборки) можно сравнить.
+
+    python traffic.py replay --log traffic.jsonl.gz --speed 1 --report base.json
+    python traffic.py replay --log traffic.jsonl.gz --speed max --report new.json
+    python traffic.py compare base.json new.json
+
+Без Postgres воспроизводить можно на встроенной базе (sqlite_backend.py):
+
+    DATABASE_URL=sqlite:///replay.db python traffic.py replay --log traffic.jsonl.gz --speed max --report sqlite.json
+"""
+import argparse
+import asyncio
+import functools
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from collections import Counter as CallCounter, defaultdict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.base import BaseSession
+from aiogram.types import TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+# Объекты, в которых id - это пользователь или чат
+IDENTITY_KEYS = ("from", "chat", "user", "sender_chat", "new_chat_member", "old_chat_member")
+PERSONAL_FIELDS = ("last_name", "username", "title", "phone_number", "bio", "language_code")
+DATE_FIELDS = ("date", "edit_date", "forward_date")
+
+FLUSH_EVERY = 100
+FLUSH_SECONDS = 1.0
+
+
+class Anonymizer:
+    def __init__(self, salt: bytes, started: float):
+        self.salt = salt
+        self.started = started
+
+    def user_id(self, value: int) -> int:
+        digest = hmac.new(self.salt, str(value).encode(), hashlib.sha256).digest()
+        alias = int.from_bytes(digest[:5], "big") + 1
+        return -alias if value < 0 else alias
+
+    def _walk(self, node: Any, parent_key: Optional[str] = None) -> Any:
+        if isinstance(node, list):
+            return [self._walk(item, parent_key) for item in node]
+        if not isinstance(node, dict):
+            return node
+        result = {}
+        for key, value in node.items():
+            if key in PERSONAL_FIELDS:
+                continue
+            if key in DATE_FIELDS and isinstance(value, (int, float)):
+                result[key] = max(0, int(value - self.started))
+            elif key == "first_name":
+                result[key] = "user"
+            elif key == "id" and parent_key in IDENTITY_KEYS and isinstance(value, int):
+                result[key] = self.user_id(value)
+            elif key == "chat_id" and isinstance(value, int):
+                result[key] = self.user_id(value)
+            else:
+                result[key] = self._walk(value, key)
+        return result
+
+    def anonymize(self, update: Dict[str, Any]) -> Dict[str, Any]:
+        return self._walk(update)
+
+
+class TrafficRecorder(BaseMiddleware):
+    """Outer middleware для dp.update: записывает обновление и передает его дальше"""
+
+    def __init__(self, path: str, salt: Optional[bytes] = None):
+        self.path = path
+        self.started = time.time()
+        # Без заданной соли псевдонимы не связываются между перезапусками
+        self.anonymizer = Anonymizer(salt or os.urandom(16), self.started)
+        self._buffer: List[str] = []
+        self._flushed_at = time.monotonic()
+        self._flushing: Optional[asyncio.Task] = None
+
+    def record(self, update: Update):
+        raw = update.model_dump(mode="json", exclude_none=True, by_alias=True)
+        entry = {"t": round(time.time() - self.started, 3), "update": self.anonymizer.anonymize(raw)}
+        self._buffer.append(json.dumps(entry, ensure_ascii=False))
+        due = len(self._buffer) >= FLUSH_EVERY or time.monotonic() - self._flushed_at > FLUSH_SECONDS
+        if due and (self._flushing is None or self._flushing.done()):
+            self._flushing = asyncio.create_task(self.flush())
+
+    def _write(self, lines: List[str]):
+        # Каждая пачка - отдельный gzip-член: файл только дописывается, gzip читает их подряд
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def flush(self):
+        lines, self._buffer = self._buffer, []
+        self._flushed_at = time.monotonic()
+        if not lines:
+            return
+        try:
+            await asyncio.to_thread(self._write, lines)
+        except Exception as e:
+            logger.error(f"Не удалось записать журнал трафика: {e}")
+
+    async def close(self):
+        if self._flushing is not None:
+            await self._flushing
+        await self.flush()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        try:
+            self.record(event)
+        except Exception as e:
+            logger.error(f"Не удалось записать обновление: {e}")
+        return await handler(event, data)
+
+
+def read_log(path: str):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class StubSession(BaseSession):
+    """Сессия без сети: отвечает на методы Telegram правдоподобными объектами"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: CallCounter = CallCounter()
+        self._message_id = 0
+
+    def _message(self, bot, method) -> Any:
+        from aiogram.types import Chat, Message, PhotoSize
+        self._message_id += 1
+        chat_id = getattr(method, "chat_id", None) or 1
+        photo = None
+        if getattr(method, "__api_method__", "") == "sendPhoto":
+            photo = [PhotoSize(file_id=f"photo-{self._message_id}", file_unique_id=f"u{self._message_id}",
+                               width=1, height=1)]
+        return Message(
+            message_id=self._message_id,
+            date=datetime.now(),
+            chat=Chat(id=chat_id if isinstance(chat_id, int) else 1, type="private"),
+            text=getattr(method, "text", None),
+            photo=photo,
+        ).as_(bot)
+
+    async def make_request(self, bot, method, timeout: Optional[int] = None):
+        from aiogram.types import Message, User
+        self.calls[method.__api_method__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        returning = method.__returning__
+        if returning is bool:
+            return True
+        if returning is User:
+            return User(id=bot.id, is_bot=True, first_name="replay", username="replay_bot")
+        if method.__api_method__ == "sendMediaGroup":
+            return [self._message(bot, method) for _ in method.media]
+        if returning is Message or "Message" in str(returning):
+            return self._message(bot, method)
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class HandlerTimer(BaseMiddleware):
+    """Inner middleware: время работы каждого обработчика"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.latencies[name].append(time.perf_counter() - started)
+
+
+def count_db_calls(manager_class) -> CallCounter:
+    """Оборачивает публичные методы класса базы (DatabaseManager, SQLiteDatabaseManager) счетчиком вызовов"""
+    calls: CallCounter = CallCounter()
+    for name, method in list(vars(manager_class).items()):
+        if name.startswith("_") or not callable(method) or asyncio.iscoroutinefunction(method):
+            continue
+
+        def wrap(method, name):
+            @functools.wraps(method)
+            def counted(*args, **kwargs):
+                calls[name] += 1
+                return method(*args, **kwargs)
+            return counted
+
+        setattr(manager_class, name, wrap(method, name))
+    return calls
+
+
+def stub_external_services(llm_latency: float):
+    """GigaChat и переводчик заменяются заглушками с заданной задержкой"""
+    import gigachat
+
+    answer = "Молодец! Хорошо сказано."
+
+    def request_completion(question: str, user_answer: str) -> str:
+        time.sleep(llm_latency)
+        return answer
+
+    async def stream_completion(question: str, user_answer: str):
+        await asyncio.sleep(llm_latency)
+        yield answer
+
+    def translate_to_tatar(text: str) -> str:
+        return text
+
+    gigachat.request_completion = request_completion
+    gigachat.stream_completion = stream_completion
+    gigachat.translate_to_tatar = translate_to_tatar
+
+
+def _percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))] if ordered else 0.0
+
+
+async def replay(log_path: str, speed: Optional[float], telegram_latency: float, llm_latency: float,
+                 settle_timeout: float = 120.0) -> Dict[str, Any]:
+    # Воспроизведение не должно само попасть в журнал
+    os.environ["TRAFFIC_LOG"] = ""
+    stub_external_services(llm_latency)
+
+    import bot as bot_module
+    # Класс базы зависит от схемы DATABASE_URL (DatabaseManager или SQLiteDatabaseManager)
+    db_calls = count_db_calls(type(bot_module.db))
+    session = StubSession(telegram_latency)
+    bot_module.bot.session = session
+    dp = bot_module.dp
+    timer = HandlerTimer()
+    for observer in (dp.message, dp.callback_query, dp.inline_query):
+        observer.middleware(timer)
+
+    entries = list(read_log(log_path))
+    db_calls.clear()
+    started = time.monotonic()
+    tasks = []
+    for entry in entries:
+        if speed:
+            delay = entry["t"] / speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        update = Update.model_validate(entry["update"], context={"bot": bot_module.bot})
+        # Как при polling: каждое обновление - отдельная задача
+        tasks.append(asyncio.create_task(dp.feed_update(bot_module.bot, update)))
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # Дожидаемся воспроизведения глав, запущенных обработчиками
+    deadline = time.monotonic() + settle_timeout
+    while len(bot_module.playbacks) and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    await bot_module.playbacks.shutdown()
+    duration = time.monotonic() - started
+
+    return {
+        "log": log_path,
+        "speed": speed or "max",
+        "updates": len(entries),
+        "duration_seconds": round(duration, 3),
+        "handlers": {
+            name: {
+                "count": len(values),
+                "mean_ms": round(sum(values) / len(values) * 1000, 3),
+                "p50_ms": round(_percentile(values, 0.5) * 1000, 3),
+                "p95_ms": round(_percentile(values, 0.95) * 1000, 3),
+            }
+            for name, values in sorted(timer.latencies.items())
+        },
+        "db_calls": dict(sorted(db_calls.items())),
+        "db_calls_total": sum(db_calls.values()),
+        "telegram_calls": dict(sorted(session.calls.items())),
+    }
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any]) -> str:
+    def change(old: float, value: float) -> str:
+        if not old:
+            return "   n/a"
+        return f"{(value - old) / old * 100:+6.1f}%"
+
+    lines = [f"{'handler':32} {'p50 base':>10} {'p50 new':>10} {'':>7} {'p95 base':>10} {'p95 new':>10} {'':>7}"]
+    for name in sorted(set(base["handlers"]) | set(new["handlers"])):
+        old = base["handlers"].get(name, {})
+        cur = new["handlers"].get(name, {})
+        lines.append(
+            f"{name:32} {old.get('p50_ms', 0):10.2f} {cur.get('p50_ms', 0):10.2f} "
+            f"{change(old.get('p50_ms', 0), cur.get('p50_ms', 0)):>7} "
+            f"{old.get('p95_ms', 0):10.2f} {cur.get('p95_ms', 0):10.2f} "
+            f"{change(old.get('p95_ms', 0), cur.get('p95_ms', 0)):>7}"
+        )
+    lines.append("")
+    lines.append(f"{'db call':32} {'base':>10} {'new':>10}")
+    for name in sorted(set(base["db_calls"]) | set(new["db_calls"])):
+        lines.append(f"{name:32} {base['db_calls'].get(name, 0):10d} {new['db_calls'].get(name, 0):10d}")
+    lines.append(f"{'total':32} {base['db_calls_total']:10d} {new['db_calls_total']:10d} "
+                 f"{change(base['db_calls_total'], new['db_calls_total']):>7}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Воспроизведение записанного трафика бота")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    replay_parser = subparsers.add_parser("replay")
+    replay_parser.add_argument("--log", required=True)
+    replay_parser.add_argument("--speed", default="1", help="Множитель скорости или 'max'")
+    replay_parser.add_argument("--telegram-latency", type=float, default=0.05)
+    replay_parser.add_argument("--llm-latency", type=float, default=1.0)
+    replay_parser.add_argument("--report", required=True)
+    compare_parser = subparsers.add_parser("compare")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        speed = None if args.speed == "max" else float(args.speed)
+        report = asyncio.run(replay(args.log, speed, args.telegram_latency, args.llm_latency))
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"{report['updates']} обновлений за {report['duration_seconds']} с, "
+              f"обращений к базе: {report['db_calls_total']}")
+    else:
+        with open(args.base, encoding="utf-8") as f:
+            base_report = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new_report = json.load(f)
+        print(compare(base_report, new_report))
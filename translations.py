@@ -0,0 +1,157 @@
+"""
+Хранилище заранее переведенных статических текстов.
+
+Все тексты глав фиксированы, поэтому переводятся один раз офлайн
+(build_translations.py) и сохраняются в компактный индексированный файл
+translations/<язык>.idx. Во время работы файл отображается в память (mmap),
+поиск - двоичный по 64-битному хэшу исходного текста, без сетевых вызовов.
+
+Формат файла:
+    заголовок   MAGIC (4 байта), версия (uint16), количество записей N (uint32)
+    индекс      N записей (хэш uint64, смещение uint32, длина uint32), по возрастанию хэша
+    данные      переводы в UTF-8 подряд
+"""
+import hashlib
+import mmap
+import os
+import struct
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TRANSLATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "translations")
+
+MAGIC = b"TVTR"
+VERSION = 1
+_HEADER = struct.Struct("<4sHI")
+_ENTRY = struct.Struct("<QII")
+
+# Ключи частей глав, в которых лежит текст для пользователя
+TRANSLATABLE_KEYS = (
+    "title", "text", "text_tatar", "text_russian", "question", "hint", "response",
+    "next_text_tatar", "next_text_russian", "next_text_babulka", "next_text_babulka1",
+    "next_button_text", "take_button_text",
+)
+
+
+def text_key(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def store_path(lang: str) -> str:
+    return os.path.join(TRANSLATIONS_DIR, f"{lang}.idx")
+
+
+def extract_strings(chapters: dict) -> List[str]:
+    """Все переводимые строки из описания глав (без повторов, в порядке появления)"""
+    found: Dict[str, None] = {}
+
+    def walk(node):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key in TRANSLATABLE_KEYS and isinstance(value, str) and value.strip():
+                    found.setdefault(value, None)
+                else:
+                    walk(value)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(chapters)
+    return list(found)
+
+
+def write_store(path: str, translations: Dict[str, str]):
+    """Записывает словарь {исходный текст: перевод} в индексированный файл"""
+    entries = []
+    blob = bytearray()
+    for source, translated in translations.items():
+        data = translated.encode("utf-8")
+        entries.append((text_key(source), len(blob), len(data)))
+        blob.extend(data)
+    entries.sort()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(entries)))
+        for entry in entries:
+            f.write(_ENTRY.pack(*entry))
+        f.write(blob)
+    # Подменяем файл атомарно, чтобы работающий бот не прочитал его наполовину записанным
+    os.replace(tmp_path, path)
+
+
+class TranslationStore:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Unsupported translation store: {path}")
+        self._data_offset = _HEADER.size + self.count * _ENTRY.size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def get(self, text: str) -> Optional[str]:
+        key = text_key(text)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            entry_key, offset, length = _ENTRY.unpack_from(self._map, _HEADER.size + middle * _ENTRY.size)
+            if entry_key < key:
+                low = middle + 1
+            elif entry_key > key:
+                high = middle
+            else:
+                start = self._data_offset + offset
+                return self._map[start:start + length].decode("utf-8")
+        return None
+
+    def close(self):
+        self._map.close()
+
+
+# Открытые хранилища по языкам вместе с временем изменения файла, из которого они прочитаны
+_stores: Dict[str, Tuple[float, TranslationStore]] = {}
+
+
+def get_store(lang: str) -> Optional[TranslationStore]:
+    """Хранилище для языка (None, если его еще не собрали).
+
+    Файл переоткрывается, когда build_translations.py подменил его новым,
+    а собранный после запуска бота файл подхватывается без перезапуска.
+    """
+    path = store_path(lang)
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        _stores.pop(lang, None)
+        return None
+    cached = _stores.get(lang)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    # Старое отображение не закрываем явно: его может еще читать другой поток,
+    # память освободится, когда на него не останется ссылок
+    store = TranslationStore(path)
+    _stores[lang] = (mtime, store)
+    return store
+
+
+def reload(lang: Optional[str] = None):
+    """Сбрасывает открытые хранилища (все или одного языка)"""
+    if lang is None:
+        _stores.clear()
+    else:
+        _stores.pop(lang, None)
+
+
+def translate_static(text: str, lang: str = "tt") -> Optional[str]:
+    """Готовый перевод статического текста или None"""
+    store = get_store(lang)
+    return store.get(text) if store else None
+
+
+def missing(texts: Iterable[str], lang: str = "tt") -> List[str]:
+    """Тексты, для которых в хранилище нет перевода"""
+    return [text for text in texts if translate_static(text, lang) is None]